@@ -0,0 +1,26 @@
+import importlib
+from typing import Any
+
+from ai_commit.core.tracing import span
+
+# agent registry: cli name -> "module:attribute". Agents are only imported when they are used,
+# so a subcommand never pays for the dependencies (pandas, chardet, ollama...) of the others.
+AGENTS = {
+    "commit": "ai_commit.Agents.commit_agent:CommitAgent",
+    "range": "ai_commit.Agents.range_agent:RangeCommitAgent",
+    "review": "ai_commit.Agents.review_agent:review_code",
+    "pr": "ai_commit.Agents.pr_agent:PullRequestAgent",
+    "email": "ai_commit.Agents.email_agent:run_email_agent",
+}
+
+
+def load_agent(name: str) -> Any:
+    """
+    Import and return the agent registered under the given name
+
+    Args:
+        name: The name of the agent in the registry
+    """
+    module_name, attribute = AGENTS[name].split(":")
+    with span("agent.import", agent=name):
+        return getattr(importlib.import_module(module_name), attribute)
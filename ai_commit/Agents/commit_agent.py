@@ -1,11 +1,18 @@
 import os
 import subprocess
 import sys
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from ai_commit.core.llm import generate_response
+from ai_commit.core.config import config
+from ai_commit.core.diff import DiffPreprocessor, FileDiff, chunk_diff, iter_file_diffs, token_budget_for
+from ai_commit.core.history import examples_token_reserve, start_history_update, with_examples
+from ai_commit.core.llm import LocalLLMProvider, WarmUp, generate_response, start_warm_up, stream_response
+from ai_commit.core.mapreduce import map_reduce_response, reduce_context, summarize_chunks
+from ai_commit.core.prefetch import Prefetcher
+from ai_commit.core.tracing import span
 from ai_commit.Agents.base_agent import BaseAgent
-from ai_commit.core.utils import load_prompt, run_command
+from ai_commit.core.utils import load_prompt, print_stream, run_command, stream_command
 
 
 class CommitAgent(BaseAgent):
@@ -16,67 +23,378 @@ class CommitAgent(BaseAgent):
             "commit": ["git", "commit", "-m"],
             "get_stashed_changes": ["git", "diff", "--cached"],
         }
+        self.early_summaries = []
+        self.warm_up: Optional[WarmUp] = None
+        # the commit prompt of every diff, so regenerations use the same examples
+        self.prompts: Dict[str, str] = {}
+        # the repository the examples come from, the current directory by default
+        self.repo: Optional[str] = None
     
-    def interaction_loop(self, staged_changes:str, use_local:bool, local_llm: str)-> None:
+    def commit_prompt(self, staged_changes: str, examples: bool = True) -> str:
+        """The commit prompt, with the messages of similar past commits as examples"""
+        if not examples:
+            return load_prompt("commit_message")
+        if staged_changes not in self.prompts:
+            self.prompts[staged_changes] = with_examples(load_prompt("commit_message"), staged_changes, self.repo)
+        return self.prompts[staged_changes]
+
+    def uses_map_reduce(self, staged_changes: str, map_reduce: bool = False) -> bool:
+        return map_reduce or len(staged_changes) > config.map_reduce_threshold
+
+    def map_reduce_chunks(self, staged_changes: str) -> Tuple[List[str], str]:
         """
-        Here we have the main interaction loop for when the user uses the commit agent
+        Split a (preprocessed) diff into the chunks to summarize. The list of files the
+        preprocessing left out needs no summary, it is returned as notes for the reduce pass.
+        """
+        diff, _, left_out = staged_changes.partition(DiffPreprocessor.STAT_TITLE)
+        notes = DiffPreprocessor.STAT_TITLE.strip() + "\n" + left_out if left_out else ""
+        return chunk_diff(diff, config.map_reduce_chunk_size), notes
+
+    def read_staged_diff(self, use_local: bool, local_llm: str, map_reduce: bool = False,
+                         raw_diff: bool = False) -> str:
+        """
+        Stream `git diff --cached` file by file. As soon as the diff is known to need map-reduce,
+        the chunks of every file are summarized in the background while git is still writing the
+        rest. The summaries land in the response cache, where the map step picks them up (or
+        joins the requests still in flight).
+
+        Args:
+            use_local (bool): Whether to use a local model
+            local_llm (str): The name of the local model to use
+            map_reduce (bool): Force map-reduce generation regardless of the diff size
+            raw_diff (bool): The diff won't be preprocessed, summarize the raw files
+
+        Returns:
+            str: The raw staged diff
+        """
+        preprocessor = DiffPreprocessor([]) if raw_diff else DiffPreprocessor.from_names(config.diff_filters)
+        map_prompt = load_prompt("diff_summary")
+
+        executor = None
+        pending: List[str] = []
+        parts: List[str] = []
+        filtered_size = 0
+
+        for file_text in iter_file_diffs(stream_command(self.commands["get_stashed_changes"])):
+            parts.append(file_text)
+            # without the cache there is no way to hand the early summaries over
+            if not config.cache_enabled:
+                continue
+
+            kept, _ = preprocessor.filter([FileDiff(file_text)])
+            for file_diff in kept:
+                filtered_size += len(file_diff.text())
+                pending.extend(chunk_diff(file_diff.text(), config.map_reduce_chunk_size))
+
+            if executor is None and (map_reduce or filtered_size > config.map_reduce_threshold):
+                executor = ThreadPoolExecutor(max_workers=max(1, config.map_reduce_workers))
+            if executor is not None:
+                self.early_summaries.extend(
+                    executor.submit(generate_response, prompt=map_prompt, context=chunk,
+                                    use_local=use_local, model_name=local_llm)
+                    for chunk in pending
+                )
+                pending = []
+
+        if executor is not None:
+            # let the summaries finish in the background, the map step waits for them
+            executor.shutdown(wait=False)
+        return "".join(parts)
+
+    def cancel_early_summaries(self) -> None:
+        for future in self.early_summaries:
+            future.cancel()
+        self.early_summaries = []
+
+    def prepare_diff(self, staged_changes: str, local_llm: str = "", map_reduce: bool = False,
+                     verbose: bool = True) -> str:
+        """
+        Preprocessing stage between git and the model: drops lockfiles, generated code, binary
+        and whitespace-only changes, then trims the diff to the context budget of the model.
+        Map-reduce generation summarizes every chunk on its own, so there is nothing to trim.
+
+        Args:
+            staged_changes (str): The raw staged diff
+            local_llm (str): The name of the local model to use, empty for the remote model
+            map_reduce (bool): Force map-reduce generation regardless of the diff size
+            verbose (bool): Print how much the preprocessing saved
+        """
+        preprocessor = DiffPreprocessor.from_names(config.diff_filters)
+        result = preprocessor.process(staged_changes)
+        if not self.uses_map_reduce(result.text, map_reduce):
+            budget = token_budget_for(local_llm or config.remote_model, load_prompt("commit_message"))
+            # room for the examples of commit_prompt()
+            budget = max(budget - examples_token_reserve(), 512)
+            result = preprocessor.process(staged_changes, token_budget=budget)
+
+        if verbose and result.bytes < result.original_bytes:
+            print(result.report())
+        return result.text
+
+    def generate_commit_message(self, staged_changes: str, use_local: bool, local_llm: str,
+                                map_reduce: bool = False, use_cache: bool = True, examples: bool = True) -> str:
+        """
+        Generate a commit message for the staged changes. Large diffs (or any diff when
+        map_reduce is set) are summarized per file and hunk first, then reduced into one message.
 
         Args:
             staged_changes (str): The staged changes to be committed
             use_local (bool): Whether to use a local model
             local_llm (str): The name of the local model to use
+            map_reduce (bool): Force map-reduce generation regardless of the diff size
+            use_cache (bool): Set to False to ask for a new message instead of the cached one
+            examples (bool): Show the model the messages of similar past commits
         """
+        prompt = self.commit_prompt(staged_changes, examples)
 
-        while True:
-            #load prompt
-            prompt = load_prompt("commit_message")
+        if self.uses_map_reduce(staged_changes, map_reduce):
+            chunks, notes = self.map_reduce_chunks(staged_changes)
+            return map_reduce_response(
+                chunks=chunks,
+                map_prompt=load_prompt("diff_summary"),
+                reduce_prompt=prompt,
+                use_local=use_local,
+                model_name=local_llm,
+                max_workers=config.map_reduce_workers,
+                use_cache=use_cache,
+                notes=notes
+            )
+
+        return generate_response(
+            prompt = prompt,
+            context = staged_changes,
+            use_local=use_local,
+            model_name=local_llm,
+            use_cache=use_cache
+        )
 
-            #generate commit message using llm
-            commit_message = generate_response(
-                prompt = prompt,
-                context = staged_changes,
+    def stream_commit_message(self, staged_changes: str, use_local: bool, local_llm: str,
+                              map_reduce: bool = False, use_cache: bool = True,
+                              regenerate: bool = False) -> Iterator[str]:
+        """
+        Same as generate_commit_message, but yields the message tokens as they are generated.
+        With map-reduce only the final reduce pass is streamed.
+
+        Args:
+            regenerate (bool): Ask for another message than the first one. The local model
+                continues from the prompt it already evaluated instead of reading the diff again.
+        """
+        prompt = self.commit_prompt(staged_changes)
+        context = staged_changes
+
+        if self.uses_map_reduce(staged_changes, map_reduce):
+            chunks, notes = self.map_reduce_chunks(staged_changes)
+            print(f"Summarizing {len(chunks)} chunks with up to {config.map_reduce_workers} parallel requests...")
+            summaries = summarize_chunks(
+                chunks,
+                load_prompt("diff_summary"),
                 use_local=use_local,
-                model_name=local_llm
+                model_name=local_llm,
+                max_workers=config.map_reduce_workers
             )
+            context = reduce_context([summary.strip() for summary in summaries if summary.strip()], notes)
+
+        if regenerate and self.uses_session(use_local, local_llm):
+            yield from LocalLLMProvider(local_llm).regenerate_response(prompt, context)
+            return
+
+        yield from stream_response(
+            prompt=prompt,
+            context=context,
+            use_local=use_local,
+            model_name=local_llm,
+            use_cache=use_cache
+        )
+
+    def uses_session(self, use_local: bool, local_llm: str) -> bool:
+        """Whether regenerations continue an ollama session, the router picks its provider per request"""
+        return use_local and bool(local_llm) and not config.router_enabled
+
+    def print_session_report(self, staged_changes: str, use_local: bool, local_llm: str) -> None:
+        """Show how much prompt evaluation the regenerated message needed, compared to the first one"""
+        if not self.uses_session(use_local, local_llm) or self.uses_map_reduce(staged_changes):
+            return
+        report = LocalLLMProvider(local_llm).session(self.commit_prompt(staged_changes), staged_changes).report()
+        if report:
+            print(report)
+
+    def print_warm_up_report(self) -> None:
+        """Show how much of the model load was hidden, once, after the first message"""
+        if self.warm_up is not None:
+            report = self.warm_up.report()
+            if report:
+                print(report)
+            self.warm_up = None
+
+    def print_message(self, commit_message: str, title: str = "GENERATED COMMIT MESSAGE:") -> None:
+        print("\n" + "="*50)
+        print(title)
+        print("="*50)
+        print(commit_message)
+        print("="*50 + "\n")
+
+    def commit(self, commit_message: str) -> None:
+        print("committing...")
+        res = run_command(self.commands["commit"] + [commit_message])
+        print(f"\n{res}\n✨ Committed!")
+
+    def interaction_loop(self, staged_changes:str, use_local:bool, local_llm: str, map_reduce: bool = False,
+                         candidates: int = 1)-> None:
+        """
+        Here we have the main interaction loop for when the user uses the commit agent
+
+        While the user reads a message, the next candidates are already generated in the
+        background, so regenerating shows a ready message right away.
+
+        Args:
+            staged_changes (str): The staged changes to be committed
+            use_local (bool): Whether to use a local model
+            local_llm (str): The name of the local model to use
+            map_reduce (bool): Force map-reduce generation regardless of the diff size
+            candidates (int): Number of messages generated in parallel to choose from
+        """
+
+        # candidates are always fresh generations, the cache only serves the first message
+        prefetcher = Prefetcher(
+            lambda: self.stream_commit_message(staged_changes, use_local, local_llm, map_reduce, use_cache=False,
+                                               regenerate=True)
+        )
+        try:
+            if candidates > 1:
+                self.candidates_loop(prefetcher, candidates)
+                return
+
+            #generate commit message using llm, rendering the tokens as they arrive
             print("\n" + "="*50)
             print("GENERATED COMMIT MESSAGE:")
             print("="*50)
-            print(commit_message)
+            commit_message = print_stream(
+                self.stream_commit_message(staged_changes, use_local, local_llm, map_reduce)
+            ).strip()
             print("="*50 + "\n")
+            self.print_warm_up_report()
+
+            while True:
+                if not commit_message:
+                    print("\n❌ No commit message generated.")
+                    break
 
+                if config.prefetch_count > 0:
+                    prefetcher.start(config.prefetch_count)
 
+                action = input("\n\nProceed to commit? [y(yes) | n(no) | r(regenerate)] ")
+                if action in ["r", "regenerate"]:
+                    subprocess.run(self.commands["clear_screen"], shell=True)
+                    if prefetcher.pending:
+                        print("⏳ Waiting for the next message...")
+                    commit_message = prefetcher.take()
+                    # keep the other prefetched candidates from piling up, new ones start on the next prompt
+                    prefetcher.cancel()
+                    if commit_message:
+                        self.print_message(commit_message)
+                        self.print_session_report(staged_changes, use_local, local_llm)
+                        continue
+
+                    # prefetching is disabled or failed, the user explicitly asked for a new message,
+                    # so don't serve the cached one again
+                    print("\n" + "="*50)
+                    print("GENERATED COMMIT MESSAGE:")
+                    print("="*50)
+                    commit_message = print_stream(
+                        self.stream_commit_message(staged_changes, use_local, local_llm, map_reduce, use_cache=False,
+                                                   regenerate=True)
+                    ).strip()
+                    print("="*50 + "\n")
+                    self.print_session_report(staged_changes, use_local, local_llm)
+                    continue
+
+                prefetcher.cancel()
+                if action in ["y", "yes"]:
+                    self.commit(commit_message)
+                elif action in ["n", "no"]:
+                    print("\n❌ Discarding AI commit message.")
+                else:
+                    print("\n🤖 Invalid action")
+                break
+        finally:
+            prefetcher.cancel()
+
+    def candidates_loop(self, prefetcher: Prefetcher, candidates: int) -> None:
+        """
+        Let the user pick one of several messages generated in parallel. The next batch is
+        generated in the background while the user is choosing.
 
-            action = input("\n\nProceed to commit? [y(yes) | n(no) | r(regenerate)] ")
+        Args:
+            prefetcher (Prefetcher): Generates the candidate messages
+            candidates (int): Number of messages per batch
+        """
+        print(f"✨ Generating {candidates} commit messages in parallel...")
+        prefetcher.start(candidates)
+        messages = prefetcher.take_all()
+        self.print_warm_up_report()
+
+        while True:
+            if not messages:
+                print("\n❌ No commit message generated.")
+                break
+
+            for index, message in enumerate(messages, start=1):
+                self.print_message(message, title=f"CANDIDATE {index}:")
+
+            prefetcher.start(candidates)
+            action = input(f"\n\nPick a message to commit [1-{len(messages)} | n(no) | r(regenerate)] ")
             if action in ["r", "regenerate"]:
                 subprocess.run(self.commands["clear_screen"], shell=True)
+                if prefetcher.pending:
+                    print("⏳ Waiting for the next messages...")
+                messages = prefetcher.take_all()
                 continue
-            elif action in ["y", "yes"]:
-                print("committing...")
-                res = run_command(self.commands["commit"] + [commit_message])
-                print(f"\n{res}\n✨ Committed!")
-                break
+
+            prefetcher.cancel()
+            if action.isdigit() and 1 <= int(action) <= len(messages):
+                self.commit(messages[int(action) - 1])
             elif action in ["n", "no"]:
                 print("\n❌ Discarding AI commit message.")
-                break
             else:
                 print("\n🤖 Invalid action")
-                break
-
+            break
 
-    def run(self, use_local:bool = False, local_llm : str = "") -> None:
+    def run(self, use_local:bool = False, local_llm : str = "", map_reduce: bool = False, candidates: int = 1,
+            raw_diff: bool = False, warm_up: Optional[WarmUp] = None) -> None:
+        """
+        Args:
+            use_local (bool): Whether to use a local model
+            local_llm (str): The name of the local model to use
+            map_reduce (bool): Force map-reduce generation regardless of the diff size
+            candidates (int): Number of messages generated in parallel to choose from
+            raw_diff (bool): Send the staged diff without preprocessing
+            warm_up (Optional[WarmUp]): The model warm-up started by the caller, one is started
+                here when there is none
+        """
+        self.warm_up = warm_up or start_warm_up(use_local, local_llm)
         try:
             run_command(self.commands["is_git_repo"])
+            # new commits are indexed while the diff is read, examples come from what is indexed by then
+            start_history_update()
 
-            #get staged changes
-            staged_changes = run_command(self.commands["get_stashed_changes"])
+            #get staged changes, streamed so large diffs start summarizing before git is done
+            with span("diff.read"):
+                staged_changes = self.read_staged_diff(use_local, local_llm, map_reduce, raw_diff)
 
             if not staged_changes.strip():
                 print("\n❌ No staged changes detected. Please stage your changes first.")
                 sys.exit(0)
 
+            if not raw_diff:
+                with span("diff.prepare"):
+                    staged_changes = self.prepare_diff(staged_changes, local_llm if use_local else "", map_reduce)
+
+            if self.warm_up is not None:
+                self.warm_up.mark_needed()
+
             # Pass staged changes to the interaction loop
-            self.interaction_loop(staged_changes, use_local, local_llm)
+            self.interaction_loop(staged_changes, use_local, local_llm, map_reduce, candidates)
         except KeyboardInterrupt:
             print("\n\n❌ AI commit exited.")
-            
-
+        finally:
+            self.cancel_early_summaries()
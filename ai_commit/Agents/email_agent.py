@@ -1,24 +1,52 @@
 import imaplib
 import email
-import requests
-from email import policy
-from email.parser import BytesParser
-import pandas as pd
+import sys
 from datetime import datetime, timedelta
 import re
-import chardet  # Library to detect encoding
 
-# IMAP settings for Gmail
-IMAP_SERVER = 'imap.gmail.com'
-EMAIL = 'example@email.com'
-APP_PASSWORD = 'nnil ifgd wnjo keij'
+from ai_commit.core.charset import PayloadDecoder
+from ai_commit.core.config import config
+from ai_commit.core.imap import fetch_headers, fetch_text_parts
+from ai_commit.core.mail_state import HANDLED_STATUSES, MailState, sender_key
+from ai_commit.core.spam import get_spam_scorer
+from ai_commit.core.unsubscribe import UnsubscribeExecutor
 
-def fetch_emails_imap(days_ago=4):
-    # Connect to the IMAP server
-    mail = imaplib.IMAP4_SSL(IMAP_SERVER)
+# IMAP settings, the credentials only ever come from the environment
+IMAP_SERVER = config.imap_server
+EMAIL = config.imap_user
+APP_PASSWORD = config.imap_password
+
+UNSUBSCRIBE_LINK = re.compile(r'https?://[^\s]*unsubscribe[^\s]*', re.IGNORECASE)
+
+# Remembers the encoding detected for every sender for the rest of the run
+PAYLOAD_DECODER = PayloadDecoder(sample_bytes=config.email_charset_sample)
+
+def connect_imap():
+    """Connect and log in to the IMAP server, exit when no credentials are configured."""
+    if not EMAIL or not APP_PASSWORD:
+        print("❌ No mailbox configured: set AI_COMMIT_IMAP_USER and AI_COMMIT_IMAP_PASSWORD "
+              "(for Gmail an app password).")
+        sys.exit(1)
+    if config.imap_ssl:
+        mail = imaplib.IMAP4_SSL(IMAP_SERVER, config.imap_port)
+    else:
+        mail = imaplib.IMAP4(IMAP_SERVER, config.imap_port)
     mail.login(EMAIL, APP_PASSWORD)
+    return mail
+
+def search_emails(mail, days_ago=4, state=None):
+    """
+    Select the inbox and return the uids of the emails to check. With a MailState, only the
+    emails that arrived since the last run are returned (the days_ago window is only used by
+    the first run).
+    """
     mail.select('inbox')
 
+    last_uid = 0
+    uidvalidity = mail.response('UIDVALIDITY')[1][0]
+    if state is not None and uidvalidity:
+        last_uid = state.begin(f"{EMAIL}@{IMAP_SERVER}", 'inbox', int(uidvalidity))
+
     # Calculate the date range
     end_date = datetime.now() - timedelta(days=days_ago)
     start_date = end_date - timedelta(days=1)  # Fetch emails from 4 days ago only
@@ -29,46 +57,107 @@ def fetch_emails_imap(days_ago=4):
 
     # Search for emails within the date range
     search_criteria = f'(SINCE "{start_date_str}" BEFORE "{end_date_str}")'
+    if last_uid:
+        # Everything that arrived since the last run
+        search_criteria = f'(UID {last_uid + 1}:*)'
 
     # Search for all emails in the inbox
-    status, messages = mail.search(None, search_criteria)
+    status, messages = mail.uid('SEARCH', None, search_criteria)
     if status != 'OK':
         print("No emails found.")
-        return pd.DataFrame()  # Return an empty DataFrame if no emails are found
+        return []
 
-    email_data = []
+    # n:* also matches the newest email when it is older than n
+    return [int(uid) for uid in messages[0].split() if int(uid) > last_uid]
 
-    # Fetch the most recent email
-    for num in messages[0].split():  # Adjust the range as needed
-        status, data = mail.fetch(num, '(RFC822)')
-        if status != 'OK':
-            print(f"Failed to fetch email {num}.")
-            continue
+def fetch_email_headers(mail, uids, state=None):
+    """
+    Fetch stage: yield the headers and body structure of the emails, one batch per round trip,
+    without the emails of senders that were already handled
+    """
+    handled = state.handled_senders() if state is not None else set()
+    batch_size = config.imap_batch_size
+    for start in range(0, len(uids), batch_size):
+        batch = uids[start:start + batch_size]
+        headers = list(fetch_headers(mail, batch, batch_size))
+        if state is not None:
+            state.mark_fetched(batch)
+        yield [message for message in headers if sender_key(message['headers']['from']) not in handled]
+
+def extract_emails(mail, header_batches):
+    """
+    Decode and extract stage: turn every batch of headers into email rows, fetching and decoding
+    the text part of the emails the headers alone don't flag. Yields the headers and the rows
+    of every batch.
+    """
+    scorer = get_spam_scorer()
+    for headers in header_batches:
+        rows = []
+        for message in headers:
+            header_links = extract_header_unsubscribe_links(message['headers']['list-unsubscribe'])
+            # RFC 8058: the https links of the header accept a one-click POST
+            one_click = 'one-click' in str(message['headers']['list-unsubscribe-post'] or "").lower()
+            rows.append({
+                'UID': message['uid'],
+                'Subject': message['headers']['subject'] or "",
+                'Sender': message['headers']['from'],
+                'Body': "",
+                'Unsubscribe Links': header_links,
+                'One-Click Links': header_links if one_click else []
+            })
 
-        # Parse the email content
-        raw_email = data[0][1]
-        msg = BytesParser(policy=policy.default).parsebytes(raw_email)
+        # The text part is only needed when the headers alone don't flag the email
+        candidates = [
+            message for message, row in zip(headers, rows)
+            if not (scorer.score(row['Subject'], "", message['headers'])['spam'] and row['Unsubscribe Links'])
+        ]
+        bodies = fetch_text_parts(mail, candidates, config.imap_batch_size, config.imap_body_bytes)
 
-        # Extract email details
-        subject = msg['subject']
-        sender = msg['from']
-        body = get_email_body(msg)
-        unsubscribe_links = extract_unsubscribe_links(body)
+        for message, row in zip(headers, rows):
+            payload = bodies.pop(row['UID'], None)
+            if payload:
+                row['Body'] = decode_payload(payload, message['text_part']['charset'], sender_key(row['Sender']))
+        yield headers, rows
 
-        # Append email data to the list
-        email_data.append({
-            'Subject': subject,
-            'Sender': sender,
-            'Body': body if body else "",  # Ensure body is not None
-            'Unsubscribe Links': unsubscribe_links
-        })
+def classify_emails(batches):
+    """
+    Classify stage: score every batch of emails in one pass of the spam rules, collecting the
+    unsubscribe links of their bodies on the way, and flag the emails to unsubscribe from
+    """
+    scorer = get_spam_scorer()
+    for headers, rows in batches:
+        scores = scorer.score_batch(
+            {'subject': row['Subject'], 'body': row['Body'], 'headers': message['headers']}
+            for message, row in zip(headers, rows)
+        )
+        for row, score in zip(rows, scores):
+            row['Unsubscribe Links'] = list(dict.fromkeys(row['Unsubscribe Links'] + score['links']))
+            row['Spam Score'] = score['score']
+            row['Should Unsubscribe'] = score['spam'] and has_unsubscribe_link(row)
+            yield row
 
-    mail.close()
-    mail.logout()
-    return pd.DataFrame(email_data)
+def iter_emails(mail, days_ago=4, state=None):
+    """
+    Run the fetch -> decode -> extract -> classify pipeline, yielding every classified email as
+    soon as its batch arrived. Only one batch of emails is held in memory at a time.
+    """
+    uids = search_emails(mail, days_ago, state)
+    return classify_emails(extract_emails(mail, fetch_email_headers(mail, uids, state)))
+
+def fetch_emails_imap(days_ago=4, state=None):
+    """Fetch and classify all the emails into a pandas DataFrame, see iter_emails."""
+    import pandas as pd  # only needed for the table
+
+    mail = connect_imap()
+    try:
+        return pd.DataFrame(list(iter_emails(mail, days_ago, state)))
+    finally:
+        mail.close()
+        mail.logout()
 
 def get_email_body(msg):
     """Recursively extract the email body from a multipart email."""
+    sender = sender_key(msg['from'])
     if msg.is_multipart():
         for part in msg.walk():
             content_type = part.get_content_type()
@@ -76,81 +165,185 @@ def get_email_body(msg):
             if content_type == "text/plain" and "attachment" not in content_disposition:
                 payload = part.get_payload(decode=True)
                 if payload:
-                    return decode_payload(payload)
+                    return decode_payload(payload, part.get_content_charset(), sender)
     else:
         payload = msg.get_payload(decode=True)
         if payload:
-            return decode_payload(payload)
+            return decode_payload(payload, msg.get_content_charset(), sender)
     return ""  # Return an empty string if no body is found
 
-def decode_payload(payload):
-    """Decode the payload using the correct encoding."""
-    try:
-        # Try UTF-8 first
-        return payload.decode('utf-8')
-    except UnicodeDecodeError:
-        # Fallback to chardet for encoding detection
-        encoding = chardet.detect(payload)['encoding']
-        if encoding:
-            return payload.decode(encoding, errors='replace')
-        else:
-            return payload.decode('utf-8', errors='replace')  # Fallback to UTF-8 with replacement
+def decode_payload(payload, charset=None, sender=None):
+    """
+    Decode the payload with the charset the part declares, UTF-8, or the encoding detected for
+    earlier emails of the sender, running chardet on a sample of it only when all of them fail.
+    """
+    return PAYLOAD_DECODER.decode(payload, charset, sender)
 
 def extract_unsubscribe_links(body):
     """Extract unsubscribe links from the email body."""
     if not body:  # Handle empty or None body
         return []
-    # Regex to find unsubscribe links
-    unsubscribe_pattern = re.compile(r'https?://[^\s]*unsubscribe[^\s]*', re.IGNORECASE)
-    links = unsubscribe_pattern.findall(body)
-    return links
+    return UNSUBSCRIBE_LINK.findall(body)
 
-def is_spam(subject, body):
-    """Check if an email is spam based on keywords."""
-    spam_keywords = ["unsubscribe", "discount", "promotion", "offer", "deal"]
-    return any(keyword.lower() in (subject + body).lower() for keyword in spam_keywords)
+def extract_header_unsubscribe_links(header):
+    """Extract the http unsubscribe links from a List-Unsubscribe header."""
+    if not header:
+        return []
+    return re.findall(r'<\s*(https?://[^>\s]+)\s*>', str(header))
+
+def is_spam(subject, body, headers=None):
+    """Check if an email is spam with the weighted spam rules, see core.spam."""
+    return get_spam_scorer().score(subject, body, headers)['spam']
 
 def has_unsubscribe_link(email_row):
     """Check if an email has unsubscribe links."""
     return len(email_row['Unsubscribe Links']) > 0
 
-def unsubscribe_from_email(unsubscribe_links):
-    """Unsubscribe from emails by visiting the unsubscribe links."""
-    for link in unsubscribe_links:
-        try:
-            response = requests.get(link)  # or requests.post(link)
-            if response.status_code == 200:
-                print(f"Successfully unsubscribed from {link}")
-            else:
-                print(f"Failed to unsubscribe from {link}")
-        except Exception as e:
-            print(f"Error unsubscribing from {link}: {e}")
-
-def display_emails_for_review(email_df):
+def unsubscribe_senders(senders):
+    """
+    Unsubscribe from several senders at once, see core.unsubscribe.plan_requests for the
+    dicts to pass. Returns the UnsubscribeReport.
+    """
+    executor = UnsubscribeExecutor(
+        max_workers=config.unsubscribe_workers,
+        per_host=config.unsubscribe_per_host,
+        timeout=config.unsubscribe_timeout
+    )
+    try:
+        return executor.run(senders)
+    finally:
+        executor.close()
+
+def unsubscribe_from_email(unsubscribe_links, one_click_links=()):
+    """Unsubscribe from emails by visiting the unsubscribe links, True if one of them worked."""
+    report = unsubscribe_senders([{'sender': "", 'links': unsubscribe_links, 'one_click': one_click_links}])
+    print(report.summary())
+    return any(report.senders().values())
+
+def _email_rows(emails):
+    """The rows of a DataFrame from fetch_emails_imap, or the rows of iter_emails as they are"""
+    return emails.to_dict('records') if hasattr(emails, 'to_dict') else emails
+
+def display_emails_for_review(emails):
     """Display emails flagged for unsubscribing."""
-    for index, row in email_df[email_df['Should Unsubscribe']].iterrows():
+    for row in _email_rows(emails):
+        if not row['Should Unsubscribe']:
+            continue
         print(f"Subject: {row['Subject']}")
         print(f"Sender: {row['Sender']}")
         print(f"Unsubscribe Links: {row['Unsubscribe Links']}")
         print("-" * 50)
 
-def prompt_user_for_unsubscribe(email_df):
-    """Prompt the user to confirm unsubscribing from emails."""
-    for index, row in email_df[email_df['Should Unsubscribe']].iterrows():
+def record_emails(rows, state):
+    """Pass the rows through, storing their classification in the sync state one batch at a time"""
+    pending = []
+    for row in rows:
+        pending.append({key: value for key, value in row.items() if key != 'Body'})
+        if len(pending) >= config.imap_batch_size:
+            state.record_messages(pending)
+            pending = []
+        yield row
+    if pending:
+        state.record_messages(pending)
+
+def count_emails(rows, summary):
+    """Pass the rows through, counting the emails and the flagged emails of every sender"""
+    for row in rows:
+        counts = summary.setdefault(sender_key(row['Sender']), {'Emails': 0, 'Flagged': 0})
+        counts['Emails'] += 1
+        counts['Flagged'] += int(bool(row['Should Unsubscribe']))
+        yield row
+
+def print_email_summary(summary):
+    """Print the emails checked per sender, as a pandas table when pandas is installed."""
+    if not summary:
+        return
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    if pd is not None:
+        table = pd.DataFrame.from_dict(summary, orient='index').sort_values('Emails', ascending=False)
+        table.index.name = 'Sender'
+        print(table.to_string())
+        return
+    width = max(len(sender) for sender in summary)
+    print(f"{'Sender':<{width}}  Emails  Flagged")
+    for sender, counts in sorted(summary.items(), key=lambda item: -item[1]['Emails']):
+        print(f"{sender:<{width}}  {counts['Emails']:>6}  {counts['Flagged']:>7}")
+
+def prompt_user_for_unsubscribe(emails, state=None):
+    """
+    Prompt the user to confirm unsubscribing as the flagged emails come in, once per sender,
+    then unsubscribe from all the confirmed senders at once. The answers are recorded per
+    sender. Returns the number of emails checked.
+    """
+    answered = set()
+    confirmed = set()
+    # Only the links of the confirmed senders are kept, every flagged email of theirs contributes
+    unsubscribe = []
+    checked = 0
+    for row in _email_rows(emails):
+        checked += 1
+        if not row['Should Unsubscribe']:
+            continue
+        sender = sender_key(row['Sender'])
+        links = {'sender': row['Sender'], 'links': row['Unsubscribe Links'], 'one_click': row['One-Click Links']}
+        if sender in confirmed:
+            unsubscribe.append(links)
+            continue
+        if sender in answered or (state is not None and state.sender_status(sender) in HANDLED_STATUSES):
+            # Already answered for another email of this sender
+            continue
+        answered.add(sender)
         print(f"Subject: {row['Subject']}")
         print(f"Sender: {row['Sender']}")
         user_input = input("Do you want to unsubscribe? (y/n): ").strip().lower()
         if user_input == 'y':
-            unsubscribe_from_email(row['Unsubscribe Links'])
+            confirmed.add(sender)
+            unsubscribe.append(links)
+        elif state is not None:
+            state.set_sender_status(sender, 'kept')
 
-def run_email_agent():
-    """Run the email agent to fetch, analyze, and unsubscribe from emails."""
-    email_df = fetch_emails_imap()
+    if not confirmed:
+        return checked
 
-    # Flag emails for unsubscribing
-    email_df['Should Unsubscribe'] = email_df.apply(
-        lambda row: is_spam(row['Subject'], row['Body']) and has_unsubscribe_link(row), axis=1
-    )
+    report = unsubscribe_senders(unsubscribe)
+    print(report.summary())
+    if state is not None:
+        outcome = report.senders()
+        for sender in confirmed:
+            # A failed sender is asked about again next time
+            state.set_sender_status(sender, 'unsubscribed' if outcome.get(sender) else 'failed', report.links(sender))
+    return checked
+
+def run_email_agent(summary=False):
+    """
+    Run the email agent to fetch, analyze, and unsubscribe from emails. The emails flow through
+    the pipeline one batch at a time, the user is asked about the first ones while the next ones
+    are still to be fetched.
+    """
+    state = MailState(config.email_state_path) if config.email_state else None
+    mail = connect_imap()
+    try:
+        emails = iter_emails(mail, state=state)
+        if state is not None:
+            emails = record_emails(emails, state)
+        counts = {}
+        if summary:
+            emails = count_emails(emails, counts)
+
+        # Prompt user to unsubscribe
+        if not prompt_user_for_unsubscribe(emails, state):
+            print("No new emails to check.")
+        print_email_summary(counts)
 
-    # Prompt user to unsubscribe
-    prompt_user_for_unsubscribe(email_df)
\ No newline at end of file
+        # Only now the fetched emails count as processed
+        if state is not None:
+            state.commit()
+    finally:
+        mail.close()
+        mail.logout()
+        if state is not None:
+            state.close()
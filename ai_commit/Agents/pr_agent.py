@@ -0,0 +1,182 @@
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from ai_commit.core.cache import ResponseCache, get_response_cache
+from ai_commit.core.config import config
+from ai_commit.core.diff import DiffPreprocessor, estimate_tokens, token_budget_for
+from ai_commit.core.llm import generate_response, get_llm_provider, is_failed_response, stream_response
+from ai_commit.core.mapreduce import collapse_summaries
+from ai_commit.Agents.base_agent import BaseAgent
+from ai_commit.core.tracing import span
+from ai_commit.core.utils import load_prompt, print_stream, run_command, stream_command
+
+
+class PullRequestAgent(BaseAgent):
+    """
+    Writes the pull request description of the current branch from summaries of its commits.
+    Every commit is summarized on its own, concurrently on a bounded pool, and the summary is
+    cached by the commit sha (a sha pins the message and the diff), the prompt and the model.
+    The summaries are then reduced into the description, after collapsing them group by group
+    when there are too many for one prompt. Describing the branch again after a push only
+    summarizes the new commits.
+    """
+
+    def __init__(self):
+        self.commands = {
+            "is_git_repo": ["git", "rev-parse", "--git-dir"],
+            "remote_head": ["git", "symbolic-ref", "--quiet", "--short", "refs/remotes/origin/HEAD"],
+            "verify": ["git", "rev-parse", "--verify", "--quiet"],
+            "list_commits": ["git", "log", "--reverse", "--no-merges", "--format=%H%x00%s"],
+            "show_commit": ["git", "show", "--format=%B", "--no-color", "--no-ext-diff"],
+            "diff_stat": ["git", "diff", "--stat", "--no-color"],
+        }
+
+    def git_output(self, command: List[str]) -> str:
+        """The output of a git command, empty when it fails instead of exiting"""
+        result = subprocess.run(command, capture_output=True, text=True, encoding="utf-8", errors="replace")
+        return result.stdout.strip() if result.returncode == 0 else ""
+
+    def default_base(self) -> str:
+        """The branch a pull request goes to: origin's default branch, or the first of main and master"""
+        remote_head = self.git_output(self.commands["remote_head"])
+        if remote_head:
+            return remote_head
+        for name in ("origin/main", "origin/master", "main", "master"):
+            if self.git_output(self.commands["verify"] + [name]):
+                return name
+        return ""
+
+    def list_commits(self, base: str) -> List[Tuple[str, str]]:
+        """The sha and subject of every non-merge commit of HEAD that isn't on the base, oldest first"""
+        output = run_command(self.commands["list_commits"] + [f"{base}..HEAD"])
+        return [tuple(line.split("\0", 1)) for line in output.splitlines() if "\0" in line]
+
+    def commit_context(self, sha: str, budget: int) -> str:
+        """The message and the preprocessed diff of a commit, trimmed to the budget"""
+        text = "".join(stream_command(self.commands["show_commit"] + [sha]))
+        split = text.find("\ndiff --git ")
+        message, diff = (text, "") if split < 0 else (text[:split], text[split + 1:])
+        message = message.strip()
+        if diff:
+            diff = DiffPreprocessor.from_names(config.diff_filters).process(
+                diff, token_budget=max(budget - estimate_tokens(message), 512)
+            ).text
+        return f"Commit message:\n{message}\n\nChanges:\n{diff}"
+
+    def summarize_commits(self, commits: List[Tuple[str, str]], prompt: str, use_local: bool, local_llm: str,
+                          jobs: int) -> Dict[str, str]:
+        """
+        The summary of every commit, from the cache or generated concurrently
+
+        Returns:
+            Dict[str, str]: The summaries by sha, commits without one are left out
+        """
+        cache = get_response_cache() if config.cache_enabled else None
+        identity = get_llm_provider(use_local, local_llm).cache_identity()
+        budget = token_budget_for(local_llm if use_local else config.remote_model, prompt)
+
+        summaries: Dict[str, str] = {}
+        keys: Dict[str, str] = {}
+        for sha, _ in commits:
+            keys[sha] = ResponseCache.make_key(task="commit_summary", sha=sha, prompt=prompt, **identity)
+            cached = cache.get(keys[sha]) if cache else None
+            if cached is not None:
+                summaries[sha] = cached
+        missing = [(sha, subject) for sha, subject in commits if sha not in summaries]
+        if cache:
+            cache.record("hits", len(summaries))
+            if missing:
+                cache.record("misses", len(missing))
+        if not missing:
+            return summaries
+
+        print(f"Summarizing {len(missing)} new commits, {len(summaries)} from the cache...")
+
+        def summarize(sha: str) -> str:
+            with span("pr.commit", sha=sha[:10]):
+                # the sha key above already decided this is a new summary
+                summary = generate_response(prompt=prompt, context=self.commit_context(sha, budget),
+                                            use_local=use_local, model_name=local_llm, use_cache=False).strip()
+            if cache and not is_failed_response(summary):
+                cache.set(keys[sha], summary)
+            return summary
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs or config.range_workers)) as executor:
+            futures = {executor.submit(summarize, sha): (sha, subject) for sha, subject in missing}
+            for done, future in enumerate(as_completed(futures), start=1):
+                sha, subject = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    print(f"❌ [{done}/{len(missing)}] {sha[:10]}: {e}")
+                    continue
+                if is_failed_response(summary):
+                    print(f"⚠️ [{done}/{len(missing)}] {sha[:10]}: no summary generated")
+                    continue
+                summaries[sha] = summary
+                print(f"✨ [{done}/{len(missing)}] {sha[:10]} {subject}")
+        return summaries
+
+    def branch_context(self, base: str, commits: List[Tuple[str, str]], summaries: Dict[str, str],
+                       use_local: bool, local_llm: str, jobs: int) -> str:
+        """The input of the final prompt: the commit summaries in order, collapsed to fit, and the diff stat"""
+        prompt = load_prompt("pull_request")
+        budget = token_budget_for(local_llm if use_local else config.remote_model, prompt)
+        stat = self.git_output(self.commands["diff_stat"] + [f"{base}...HEAD"])
+        stat_lines = stat.splitlines()
+        if len(stat_lines) > 50:
+            stat = "\n".join(stat_lines[:49] + [f" ... {len(stat_lines) - 50} more files", stat_lines[-1]])
+
+        entries = [f"### {sha[:10]} {subject}\n{summaries[sha]}" for sha, subject in commits if sha in summaries]
+        entries = collapse_summaries(entries, load_prompt("commit_summary"), budget - estimate_tokens(stat),
+                                     use_local=use_local, model_name=local_llm,
+                                     max_workers=jobs or config.range_workers)
+        return "\n\n".join(entries) + (f"\n\n### Files changed (git diff --stat)\n{stat}" if stat else "")
+
+    def run(self, base: str = "", use_local: bool = False, local_llm: str = "", jobs: int = 0) -> Optional[str]:
+        """
+        Args:
+            base: The branch the pull request goes to, origin's default branch if empty
+            use_local: Whether to use a local model
+            local_llm: The name of the local model to use
+            jobs: The maximum number of commits summarized at once (defaults to the config)
+
+        Returns:
+            Optional[str]: The description, None when there was nothing to describe
+        """
+        try:
+            run_command(self.commands["is_git_repo"])
+            base = base or self.default_base()
+            if not base:
+                print("\n❌ No base branch found, pass one with --base.")
+                sys.exit(1)
+
+            commits = self.list_commits(base)
+            if not commits:
+                print(f"\n❌ No commits found between {base} and HEAD.")
+                sys.exit(0)
+
+            start = time.perf_counter()
+            print(f"✨ Describing {len(commits)} commits on top of {base}...")
+            with span("pr.summaries", commits=len(commits)):
+                summaries = self.summarize_commits(commits, load_prompt("commit_summary"), use_local, local_llm, jobs)
+            if not summaries:
+                print("\n❌ No commit summaries generated.")
+                sys.exit(1)
+
+            with span("pr.reduce"):
+                context = self.branch_context(base, commits, summaries, use_local, local_llm, jobs)
+            print("\n" + "=" * 50)
+            print("PULL REQUEST DESCRIPTION:")
+            print("=" * 50)
+            description = print_stream(stream_response(prompt=load_prompt("pull_request"), context=context,
+                                                       use_local=use_local, model_name=local_llm)).strip()
+            print("=" * 50)
+            print(f"📝 {len(commits)} commits described in {time.perf_counter() - start:.2f}s")
+            return description or None
+        except KeyboardInterrupt:
+            print("\n\n❌ AI pull request exited.")
+            return None
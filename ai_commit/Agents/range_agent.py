@@ -0,0 +1,195 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+from ai_commit.core.config import config
+from ai_commit.core.llm import is_failed_response
+from ai_commit.Agents.base_agent import BaseAgent
+from ai_commit.Agents.commit_agent import CommitAgent
+from ai_commit.core.tracing import span
+from ai_commit.core.utils import run_command, stream_command
+
+
+class RangeCommitAgent(BaseAgent):
+    """
+    Regenerates the commit messages of every commit in a revision range, e.g. before rewording
+    or squash-merging a feature branch. Commits are processed concurrently on a bounded pool and
+    the results are written as a reword plan for `git rebase -i` or as git notes.
+    """
+
+    NOTES_REF = "ai-commit"
+
+    def __init__(self):
+        self.commands = {
+            "is_git_repo": ["git", "rev-parse", "--git-dir"],
+            "list_commits": ["git", "rev-list", "--reverse", "--no-merges"],
+            "show_commit": ["git", "show", "--format=", "--no-color", "--no-ext-diff"],
+            "parents": ["git", "rev-list", "--parents", "-n", "1"],
+            "rebase_commits": ["git", "log", "--reverse", "--topo-order", "--format=%H%x00%P%x00%s"],
+            "add_note": ["git", "notes", f"--ref={self.NOTES_REF}", "add", "-f", "-m"],
+        }
+        self.commit_agent = CommitAgent()
+
+    def list_commits(self, revision_range: str) -> List[str]:
+        """Return the shas of the non-merge commits in the range, oldest first"""
+        output = run_command(self.commands["list_commits"] + [revision_range])
+        return output.split()
+
+    def generate_for_commit(self, sha: str, use_local: bool, local_llm: str) -> str:
+        """Read the diff of a commit and generate a new message for it"""
+        with span("range.commit", sha=sha[:10]):
+            # streamed so the time budget scales with the size of the commit
+            diff = "".join(stream_command(self.commands["show_commit"] + [sha]))
+            if not diff.strip():
+                return ""
+            with span("diff.prepare"):
+                diff = self.commit_agent.prepare_diff(diff, local_llm if use_local else "", verbose=False)
+            # the commit's own message would be the closest example
+            message = self.commit_agent.generate_commit_message(diff, use_local, local_llm, examples=False).strip()
+        return "" if is_failed_response(message) else message
+
+    def generate_messages(self, shas: List[str], use_local: bool, local_llm: str, jobs: int) -> Dict[str, str]:
+        """
+        Generate the messages of all the commits concurrently
+
+        Returns:
+            Dict[str, str]: The new message of every commit that got one, by sha
+        """
+        messages = {}
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = {
+                executor.submit(self.generate_for_commit, sha, use_local, local_llm): sha
+                for sha in shas
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                sha = futures[future]
+                try:
+                    message = future.result()
+                except Exception as e:
+                    print(f"❌ [{done}/{len(shas)}] {sha[:10]}: {e}")
+                    continue
+                if not message:
+                    print(f"⚠️ [{done}/{len(shas)}] {sha[:10]}: no message generated")
+                    continue
+                messages[sha] = message
+                print(f"✨ [{done}/{len(shas)}] {sha[:10]} {message.splitlines()[0]}")
+        return messages
+
+    def write_notes(self, shas: List[str], messages: Dict[str, str]) -> None:
+        """Attach every message to its commit as a note under refs/notes/ai-commit"""
+        # git notes updates a single ref, so the notes are written one after another
+        for sha in shas:
+            if sha in messages:
+                run_command(self.commands["add_note"] + [messages[sha], sha])
+        print(f"\n📝 Wrote {len(messages)} notes. Show them with: git log --notes={self.NOTES_REF}")
+
+    def rebase_commits(self, shas: List[str]) -> Tuple[List[Tuple[str, str]], str]:
+        """
+        The commits `git rebase -i` replays to reword the range: all of them from the parent of
+        the oldest commit of the range up to HEAD, not only those of the range, since the rebase
+        rewrites the whole current branch and drops every commit its todo list leaves out
+
+        Returns:
+            Tuple[List[Tuple[str, str]], str]: The sha and subject of every commit to replay,
+                oldest first, and the rebase base (a sha or --root)
+
+        Raises:
+            ValueError: When rebasing would lose history: a merge (it would be flattened) or a
+                commit of the range that isn't on the current branch
+        """
+        # the first commit of the range is rebased on its parent, a root commit needs --root
+        parents = run_command(self.commands["parents"] + [shas[0]]).split()[1:]
+        base = parents[0] if parents else "--root"
+        output = run_command(self.commands["rebase_commits"] + ["HEAD" if base == "--root" else f"{base}..HEAD"])
+
+        commits = []
+        merges = []
+        for line in output.splitlines():
+            sha, commit_parents, subject = line.split("\0", 2)
+            commits.append((sha, subject))
+            if len(commit_parents.split()) > 1:
+                merges.append(sha)
+        missing = set(shas) - {sha for sha, _ in commits}
+        if missing:
+            raise ValueError(f"{len(missing)} commits of the range are not on the current branch. Check out the "
+                             "branch they are on, or write the messages as notes with --output notes.")
+        if merges:
+            raise ValueError(f"{merges[0][:10]} is a merge, which rewording with `git rebase -i` would flatten. "
+                             "Write the messages as notes with --output notes instead.")
+        return commits, base
+
+    def write_reword_plan(self, commits: List[Tuple[str, str]], messages: Dict[str, str]) -> str:
+        """
+        Write every message to a file and a `git rebase -i` todo list that picks every commit
+        and amends those with a new message
+
+        Args:
+            commits: The sha and subject of every commit the rebase replays, see rebase_commits
+            messages: The new messages by sha
+
+        Returns:
+            str: The path of the todo list
+        """
+        git_dir = run_command(self.commands["is_git_repo"])
+        plan_dir = os.path.abspath(os.path.join(git_dir, "ai-commit", "reword"))
+        os.makedirs(plan_dir, exist_ok=True)
+
+        lines = []
+        for sha, subject in commits:
+            lines.append(f"pick {sha} {subject}")
+            if sha in messages:
+                message_path = os.path.join(plan_dir, f"{sha}.txt")
+                with open(message_path, "w", encoding="utf-8") as f:
+                    f.write(messages[sha] + "\n")
+                message_path = message_path.replace("\\", "/")
+                lines.append(f'exec git commit --amend --only --no-verify --allow-empty -F "{message_path}"')
+
+        plan_path = os.path.join(plan_dir, "git-rebase-todo")
+        with open(plan_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return plan_path
+
+    def run(self, revision_range: str = "", use_local: bool = False, local_llm: str = "",
+            jobs: int = 0, output: str = "plan") -> None:
+        """
+        Args:
+            revision_range: The commits to process, e.g. main..HEAD
+            use_local: Whether to use a local model
+            local_llm: The name of the local model to use
+            jobs: The maximum number of commits processed at once (defaults to the config)
+            output: "plan" to write a reword plan, "notes" to write git notes
+        """
+        try:
+            run_command(self.commands["is_git_repo"])
+
+            shas = self.list_commits(revision_range)
+            if not shas:
+                print(f"\n❌ No commits found in range '{revision_range}'.")
+                sys.exit(0)
+
+            if output == "plan":
+                # checked before generating anything, a plan that can't be applied is wasted work
+                try:
+                    commits, base = self.rebase_commits(shas)
+                except ValueError as e:
+                    print(f"\n❌ {e}")
+                    sys.exit(1)
+
+            jobs = jobs or config.range_workers
+            print(f"✨ Generating messages for {len(shas)} commits with up to {jobs} parallel jobs...")
+            messages = self.generate_messages(shas, use_local, local_llm, jobs)
+            if not messages:
+                print("\n❌ No commit messages generated.")
+                sys.exit(1)
+
+            if output == "notes":
+                self.write_notes(shas, messages)
+                return
+
+            plan_path = self.write_reword_plan(commits, messages)
+            print(f"\n📝 Wrote a reword plan for {len(messages)} commits to {plan_path}")
+            print("Review it, then apply it with:")
+            print(f'  GIT_SEQUENCE_EDITOR="cp \'{plan_path}\'" git rebase -i {base}')
+        except KeyboardInterrupt:
+            print("\n\n❌ AI commit exited.")
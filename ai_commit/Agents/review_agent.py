@@ -1,55 +1,195 @@
-import subprocess
-import ollama
 import sys
-import os
-from ai_commit.commit_agent import run_command
-from ai_commit.generate_llm_message import generate_message
-from ai_commit.generate_remote_message import generate_remote_message
-# Define a system prompt to guide the AI for code reviews
-
-commands = {
-    "is_git_repo": ["git", "rev-parse", "--git-dir"],
-    "clear_screen": ["cls" if os.name == "nt" else "clear"],
-    "commit": ["git", "commit", "-m"],
-    "get_stashed_changes": ["git", "diff", "--cached"],
-}
-
-
-
-    
-
-def run_command(command: list[str] | str):
-    try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            check=True,
-            timeout=10,
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Error: \n{e.stderr}")
-        sys.exit(1)
-
-def review_code(local_llm, use_local=False):
-    try:
-        run_command(commands["is_git_repo"])
-
-
-        staged_changes=run_command(commands["get_stashed_changes"])
-
-        if not staged_changes.strip():
-            print("\n❌ No staged changes detected. Please stage your changes first.")
-            sys.exit(0)
-        
-        if use_local:
-            generate_message(staged_changes, local_llm, "code_review")
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Tuple
+
+from ai_commit.core.cache import ResponseCache, get_response_cache
+from ai_commit.core.config import config
+from ai_commit.core.diff import DiffPreprocessor, FileDiff, iter_file_diffs, token_budget_for
+from ai_commit.core.llm import generate_response, get_llm_provider, is_failed_response
+from ai_commit.Agents.base_agent import BaseAgent
+from ai_commit.core.tracing import span
+from ai_commit.core.utils import load_prompt, run_command, stream_command
+
+# the object name git reports for the missing side of an added or deleted file
+NULL_SHA = "0" * 40
+
+
+class StagedFile:
+    """One entry of `git diff --cached --raw`: a staged file and the blobs on both sides"""
+
+    def __init__(self, status: str, old_sha: str, new_sha: str, path: str, old_path: str = ""):
+        self.status = status
+        self.old_sha = old_sha
+        self.new_sha = new_sha
+        self.path = path
+        # the path before a rename or copy
+        self.old_path = old_path
+
+    @property
+    def deleted(self) -> bool:
+        return self.new_sha == NULL_SHA
+
+    def paths(self) -> List[str]:
+        return [self.old_path, self.path] if self.old_path else [self.path]
+
+
+def parse_raw_diff(output: str) -> List[StagedFile]:
+    """
+    Parse the output of `git diff --raw -z --no-abbrev`: a ":modes shas status" field followed by
+    one path, or by two for renames and copies
+
+    Args:
+        output: The NUL separated output
+
+    Returns:
+        List[StagedFile]: The staged files, in diff order
+    """
+    fields = output.split("\0")
+    files = []
+    index = 0
+    while index < len(fields) - 1:
+        meta = fields[index].lstrip("\n")
+        if not meta.startswith(":"):
+            index += 1
+            continue
+        _, _, old_sha, new_sha, status = meta[1:].split(" ", 4)
+        if status[:1] in ("R", "C"):
+            files.append(StagedFile(status, old_sha, new_sha, fields[index + 2], old_path=fields[index + 1]))
+            index += 3
         else:
-            generate_remote_message(staged_changes, "code_review", "review")
+            files.append(StagedFile(status, old_sha, new_sha, fields[index + 1]))
+            index += 2
+    return files
+
+
+class ReviewAgent(BaseAgent):
+    """
+    Reviews the staged changes file by file. The files are reviewed concurrently on a bounded
+    pool and every review is printed as soon as it is done. Reviews are cached by the blobs of
+    the file on both sides of the diff, the prompt and the model, so the staged blob hashes alone
+    tell which files need a new review: re-running after touching one file only reviews that one,
+    and only its diff is read.
+    """
+
+    def __init__(self):
+        self.commands = {
+            "is_git_repo": ["git", "rev-parse", "--git-dir"],
+            "list_staged": ["git", "diff", "--cached", "--raw", "-z", "--no-abbrev", "-M"],
+            "staged_diff": ["git", "-c", "core.quotePath=false", "diff", "--cached", "--no-color", "--no-ext-diff",
+                            "-M", "--"],
+        }
+
+    def list_staged(self) -> List[StagedFile]:
+        return parse_raw_diff(run_command(self.commands["list_staged"]))
+
+    def read_diffs(self, files: List[StagedFile]) -> Dict[str, str]:
+        """The diff of every file in one streamed `git diff`, by path"""
+        paths = [path for staged in files for path in staged.paths()]
+        return {FileDiff(text).path: text for text in iter_file_diffs(stream_command(self.commands["staged_diff"] + paths))}
+
+    @staticmethod
+    def cache_key(staged: StagedFile, prompt: str, identity: Dict[str, str]) -> str:
+        """The key of a file's review: its blobs, the prompt and the provider and model"""
+        return ResponseCache.make_key(task="review", path=staged.path, old_sha=staged.old_sha,
+                                      new_sha=staged.new_sha, prompt=prompt, **identity)
+
+    def review_file(self, diff: str, prompt: str, use_local: bool, local_llm: str) -> str:
+        """Review the diff of one file, after the preprocessing filters and trimmed to the model context"""
+        preprocessor = DiffPreprocessor.from_names(config.diff_filters)
+        budget = token_budget_for(local_llm if use_local else config.remote_model, prompt)
+        result = preprocessor.process(diff, token_budget=budget)
+        if not result.text.strip() or result.text.lstrip().startswith(DiffPreprocessor.STAT_TITLE.strip()):
+            # a lockfile, generated or binary file: nothing the model could review
+            return ""
+        # the blob cache of review() already decided this is a new review
+        return generate_response(prompt=prompt, context=result.text, use_local=use_local, model_name=local_llm,
+                                 use_cache=False).strip()
+
+    def review(self, use_local: bool, local_llm: str, jobs: int = 0) -> Iterator[Tuple[StagedFile, str, bool]]:
+        """
+        Review every staged file, cached reviews first, then the others in the order they finish
+
+        Yields:
+            Tuple[StagedFile, str, bool]: The file, its review (empty when there was nothing to
+                review or it failed) and whether it came from the cache
+        """
+        prompt = load_prompt("code_review")
+        cache = get_response_cache() if config.cache_enabled else None
+        identity = get_llm_provider(use_local, local_llm).cache_identity()
+
+        pending: List[Tuple[StagedFile, str]] = []
+        for staged in self.list_staged():
+            if staged.deleted:
+                yield staged, "", False
+                continue
+            key = self.cache_key(staged, prompt, identity)
+            cached = cache.get(key) if cache else None
+            if cached is not None:
+                cache.record("hits")
+                yield staged, cached, True
+            else:
+                pending.append((staged, key))
+        if cache and pending:
+            cache.record("misses", len(pending))
+        if not pending:
+            return
+
+        with span("review.diff", files=len(pending)):
+            diffs = self.read_diffs([staged for staged, _ in pending])
+
+        def run(staged: StagedFile, key: str) -> str:
+            with span("review.file", path=staged.path):
+                review = self.review_file(diffs.get(staged.path, ""), prompt, use_local, local_llm)
+            if cache and review and not is_failed_response(review):
+                cache.set(key, review)
+            return review
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs or config.review_workers)) as executor:
+            futures = {executor.submit(run, staged, key): staged for staged, key in pending}
+            try:
+                for future in as_completed(futures):
+                    staged = futures[future]
+                    try:
+                        review = future.result()
+                    except Exception as e:
+                        print(f"❌ {staged.path}: {e}")
+                        review = ""
+                    yield staged, "" if is_failed_response(review) else review, False
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def run(self, use_local: bool = False, local_llm: str = "", jobs: int = 0) -> None:
+        """
+        Args:
+            use_local: Whether to use a local model
+            local_llm: The name of the local model to use
+            jobs: The maximum number of files reviewed at once (defaults to the config)
+        """
+        try:
+            run_command(self.commands["is_git_repo"])
+            start = time.perf_counter()
+            reviewed = cached = skipped = 0
+            for staged, review, from_cache in self.review(use_local, local_llm, jobs):
+                if not review:
+                    skipped += 1
+                    continue
+                reviewed += 1
+                cached += from_cache
+                print("\n" + "=" * 50)
+                print(f"{staged.path}{' (cached)' if from_cache else ''}")
+                print("=" * 50)
+                print(review)
 
+            if not reviewed and not skipped:
+                print("\n❌ No staged changes detected. Please stage your changes first.")
+                sys.exit(0)
+            print(f"\n🔍 Reviewed {reviewed} files in {time.perf_counter() - start:.2f}s, {cached} from the cache"
+                  + (f", {skipped} skipped (deleted, generated or failed)" if skipped else ""))
+        except KeyboardInterrupt:
+            print("\n\n❌ AI code-review exited.")
 
-    except KeyboardInterrupt:
-        print("\n\n❌ AI code-review exited.")
 
+def review_code(local_llm: str, use_local: bool = False, jobs: int = 0) -> None:
+    ReviewAgent().run(use_local=use_local, local_llm=local_llm, jobs=jobs)
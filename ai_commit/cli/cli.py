@@ -2,8 +2,11 @@ import argparse
 import sys
 from typing import List, Optional
 
-from ai_commit.Agents.commit_agent import CommitAgent
+from ai_commit.Agents import load_agent
 from ai_commit.core.config import config
+from ai_commit.core import tracing
+from ai_commit.core.llm import start_warm_up
+from ai_commit.core.utils import CommandError
 
 
 def create_parser() -> argparse.ArgumentParser:
@@ -31,11 +34,102 @@ def create_parser() -> argparse.ArgumentParser:
         )
     )
 
+    # Map-reduce generation for large diffs
+    parser.add_argument(
+        "-m", "--map-reduce",
+        action="store_true",
+        help="Summarize the diff per file and hunk in parallel before writing the commit message."
+    )
+
+    # Diff preprocessing
+    parser.add_argument(
+        "--raw-diff",
+        action="store_true",
+        help="Send the staged diff as is, without dropping lockfiles, generated code or trimming it to the model context."
+    )
+
+    # Multiple candidates
+    parser.add_argument(
+        "-n", "--candidates",
+        type=int,
+        default=1,
+        help="Generate several commit messages in parallel and pick one."
+    )
+
+    # Batch generation over a revision range
+    parser.add_argument(
+        "--range",
+        type=str,
+        metavar="REVISION_RANGE",
+        help="Generate new messages for every commit in a revision range, e.g. main..HEAD."
+    )
+
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=0,
+        help="Maximum number of commits (with --range or -pr) or files (with --review) processed in parallel."
+    )
+
+    parser.add_argument(
+        "--output",
+        choices=["plan", "notes"],
+        default="plan",
+        help="Write the --range messages as a reword plan for `git rebase -i` or as git notes."
+    )
+
+    # Response cache
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read or write the local LLM response cache."
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="TRACE_FILE",
+        help="Print a breakdown of where the time went, and write a JSON trace (chrome://tracing) to TRACE_FILE if given."
+    )
+
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Show hit/miss statistics of the local LLM response cache."
+    )
+
+    parser.add_argument(
+        "--index-history",
+        action="store_true",
+        help="Index the commit history now, for the examples of similar past commits in the commit prompt."
+    )
+
+    # Background daemon
+    parser.add_argument(
+        "--daemon",
+        choices=["start", "stop", "status", "serve"],
+        help="Manage the background daemon that keeps models warm and serves the CLI and the commit hook."
+    )
+
+    parser.add_argument(
+        "--install-hook",
+        action="store_true",
+        help="Install a prepare-commit-msg hook that fills in the message from the running daemon."
+    )
+
     # Pull request description
     parser.add_argument(
         "-pr", "--pull-request",
         action="store_true",
-        help="Generate a pull request description."
+        help="Generate a pull request description of the current branch from summaries of its commits."
+    )
+
+    parser.add_argument(
+        "--base",
+        type=str,
+        default="",
+        help="The branch the pull request goes to with -pr, origin's default branch if not given."
     )
 
     # Code review
@@ -52,6 +146,12 @@ def create_parser() -> argparse.ArgumentParser:
         help="Check spam emails and unsubscribe from recurring emails."
     )
 
+    parser.add_argument(
+        "--email-summary",
+        action="store_true",
+        help="With -e, print a table of the checked emails per sender."
+    )
+
     parser.add_argument(
         "-v", "--voice",
         action="store_true",
@@ -86,11 +186,64 @@ def main() -> None:
     parser = create_parser()
     args = parser.parse_args()
 
-    if args.commit:
+    if args.no_cache:
+        config.cache_enabled = False
+
+    if args.profile is not None:
+        tracing.tracer.enable()
+    try:
+        run(parser, args)
+    except CommandError as e:
+        # a git command failed, e.g. outside a repository
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        tracing.finish(args.profile)
+
+
+def run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Dispatch the parsed arguments to the agent that handles them"""
+    if args.daemon:
+        from ai_commit.core.daemon import daemon_command
+        sys.exit(daemon_command(args.daemon))
+    elif args.install_hook:
+        from ai_commit.hooks.prepare_commit_msg import install_hook
+        sys.exit(install_hook())
+    elif args.cache_stats:
+        from ai_commit.core.cache import get_response_cache
+        get_response_cache().print_stats()
+    elif args.index_history:
+        from ai_commit.core.history import index_history_command
+        sys.exit(index_history_command())
+    elif args.range:
+        if args.local and not validate_local_model(args.local):
+            sys.exit(1)
+        start_warm_up(bool(args.local), args.local or "")
+        range_agent = load_agent("range")()
+        range_agent.run(revision_range=args.range, use_local=bool(args.local), local_llm=args.local or "",
+                        jobs=args.jobs, output=args.output)
+    elif args.commit:
+        if args.local and not validate_local_model(args.local):
+            sys.exit(1)
+        # the model loads while the agent is imported and reads the staged diff
+        warm_up = start_warm_up(bool(args.local), args.local or "")
+        commit_agent = load_agent("commit")()
+        commit_agent.run(use_local=bool(args.local), local_llm=args.local or "", map_reduce=args.map_reduce,
+                         candidates=max(1, args.candidates), raw_diff=args.raw_diff, warm_up=warm_up)
+    elif args.pull_request:
+        if args.local and not validate_local_model(args.local):
+            sys.exit(1)
+        start_warm_up(bool(args.local), args.local or "")
+        pr_agent = load_agent("pr")()
+        pr_agent.run(base=args.base, use_local=bool(args.local), local_llm=args.local or "", jobs=args.jobs)
+    elif args.review:
         if args.local and not validate_local_model(args.local):
             sys.exit(1)
-        commit_agent = CommitAgent()
-        commit_agent.run(use_local=bool(args.local), local_llm=args.local or "")
+        review_code = load_agent("review")
+        review_code(args.local or "", use_local=bool(args.local), jobs=args.jobs)
+    elif args.email:
+        run_email_agent = load_agent("email")
+        run_email_agent(summary=args.email_summary)
     else:
         parser.print_help()
 
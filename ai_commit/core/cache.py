@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from ai_commit.core.config import config
+from ai_commit.core import tracing
+
+
+class ResponseCache:
+    """
+    On-disk cache for llm responses
+
+    Every entry is a small json file named after the hash of its key. The file mtime is bumped on
+    every hit, so evicting the oldest mtimes first gives least recently used eviction. Identical
+    requests that run at the same time are collapsed into one generation, both between threads
+    (in-process events) and between processes (a lock file next to the entry).
+    """
+
+    STAT_NAMES = ("hits", "misses", "stores", "evictions", "collapsed")
+
+    def __init__(self, directory: str, max_entries: int = 500, max_bytes: int = 50 * 1024 * 1024,
+                 max_age: float = 7 * 24 * 3600, lock_timeout: float = 300):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock_timeout = lock_timeout
+        self.stats_path = os.path.join(directory, "stats.json")
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+
+    @staticmethod
+    def make_key(**parts: Any) -> str:
+        """
+        Hash the parts of a request (prompt, context, provider, model, options...) into a cache key
+        """
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.lock")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached response for the key, or None if it is missing or expired
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("created", 0) > self.max_age:
+            self._remove(path)
+            return None
+
+        try:
+            # mark the entry as recently used for lru eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry.get("response")
+
+    def set(self, key: str, response: str) -> None:
+        """
+        Store a response and evict old entries if the cache is over its limits
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+
+        self.record("stores")
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop expired entries, then the least recently used ones until the cache fits its limits
+
+        Returns:
+            int: The number of entries removed
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for item in it:
+                    if item.name.endswith(".json") and item.name != "stats.json":
+                        stat = item.stat()
+                        entries.append((stat.st_mtime, stat.st_size, item.path))
+        except OSError:
+            return 0
+
+        entries.sort()
+        now = time.time()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+
+        for mtime, size, path in entries:
+            remaining = len(entries) - removed
+            expired = now - mtime > self.max_age
+            if not expired and remaining <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+            total_bytes -= size
+            removed += 1
+
+        if removed:
+            self.record("evictions", removed)
+        return removed
+
+    def clear(self) -> None:
+        """Remove every cached response"""
+        try:
+            with os.scandir(self.directory) as it:
+                for item in it:
+                    if item.name.endswith(".json"):
+                        self._remove(item.path)
+        except OSError:
+            pass
+
+    def get_or_generate(self, key: str, generate: Callable[[], str], bypass: bool = False,
+                        should_store: Callable[[str], bool] = bool) -> str:
+        """
+        Return the cached response for the key, or generate and store it. Concurrent calls with
+        the same key wait for the first one instead of generating the same response again.
+
+        Args:
+            key: The cache key of the request
+            generate: Produces the response on a miss
+            bypass: Skip the cached value and always generate a fresh response (it is still stored)
+            should_store: Decides whether a generated response is good enough to be cached
+        """
+        if not bypass:
+            cached = self.get(key)
+            if cached is not None:
+                self.record("hits")
+                return cached
+
+        # collapse concurrent identical requests from this process
+        with self._lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if not owner:
+            event.wait(self.lock_timeout)
+            cached = self.get(key)
+            if cached is not None:
+                self.record("collapsed")
+                return cached
+
+        held = owner and self._acquire_file_lock(key)
+        try:
+            if owner and not bypass:
+                # another process may have generated the response while we waited on its lock
+                cached = self.get(key)
+                if cached is not None:
+                    self.record("collapsed")
+                    return cached
+
+            self.record("misses")
+            response = generate()
+            if should_store(response):
+                self.set(key, response)
+            return response
+        finally:
+            if held:
+                self._release_file_lock(key)
+            if owner:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+    def _acquire_file_lock(self, key: str) -> bool:
+        """
+        Take the cross-process lock for the key, waiting while another process holds it
+
+        Returns:
+            bool: True if the lock is held, False if the other process stored the response
+                  while we waited (or the cache directory can't be written)
+        """
+        lock_path = self._lock_path(key)
+        deadline = time.time() + self.lock_timeout
+
+        while True:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return True
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(lock_path) > self.lock_timeout
+                except OSError:
+                    continue
+                if stale or time.time() > deadline:
+                    self._remove(lock_path)
+                    continue
+                if self.get(key) is not None:
+                    return False
+                time.sleep(0.05)
+            except OSError:
+                # read-only or missing cache directory, just generate without the lock
+                return False
+
+    def _release_file_lock(self, key: str) -> None:
+        self._remove(self._lock_path(key))
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def record(self, name: str, count: int = 1) -> None:
+        """Bump a counter in the persisted hit/miss stats, best effort"""
+        tracing.count(f"cache.{name}", count)
+        with self._lock:
+            stats = self.stats()
+            stats[name] = stats.get(name, 0) + count
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(stats, f)
+                os.replace(tmp_path, self.stats_path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return the persisted cache counters"""
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+        return {name: int(stats.get(name, 0)) for name in self.STAT_NAMES}
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        lookups = stats["hits"] + stats["misses"] + stats["collapsed"]
+        hit_rate = (stats["hits"] + stats["collapsed"]) / lookups * 100 if lookups else 0.0
+        print(f"📦 Response cache: {self.directory}")
+        for name in self.STAT_NAMES:
+            print(f"  {name:<10} {stats[name]}")
+        print(f"  {'hit rate':<10} {hit_rate:.1f}%")
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the shared response cache configured from the environment"""
+    global _response_cache
+    # worker threads must share one instance, its in-flight map collapses their duplicate requests
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                directory=config.cache_dir,
+                max_entries=config.cache_max_entries,
+                max_bytes=config.cache_max_bytes,
+                max_age=config.cache_max_age
+            )
+        return _response_cache
@@ -0,0 +1,113 @@
+"""
+Charset handling of email bodies
+
+The charset a message declares for its text part is tried first, then UTF-8, then whatever
+was detected for earlier mail of the same sender. chardet only runs when all of them fail, and
+only on a bounded sample of the payload: detection is by far the slowest part of decoding a
+large newsletter, and its confidence hardly improves after the first few kilobytes.
+"""
+import codecs
+from collections import OrderedDict
+from typing import Any, Optional
+
+import chardet
+
+from ai_commit.core.tracing import count, span
+
+# labels that say nothing about the bytes
+UNKNOWN_CHARSETS = {"unknown-8bit", "x-unknown", "unknown", "default", "8bit"}
+
+
+def normalize_charset(charset: Any) -> Optional[str]:
+    """
+    The python codec name of a declared charset, e.g. "UTF8" -> "utf-8", or None when the label
+    is missing, unknown or not a text encoding
+    """
+    if not charset:
+        return None
+    label = str(charset).strip().strip('"\'').lower()
+    if not label or label in UNKNOWN_CHARSETS:
+        return None
+    try:
+        info = codecs.lookup(label)
+    except LookupError:
+        return None
+    # e.g. base64 or zlib are codecs too, but not charsets
+    if not getattr(info, "_is_text_encoding", True):
+        return None
+    return info.name
+
+
+def _strict(payload: bytes, encoding: Optional[str]) -> Optional[str]:
+    if not encoding:
+        return None
+    try:
+        return payload.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+class PayloadDecoder:
+    """
+    Decodes email payloads, remembering the detected encoding of every sender
+
+    Args:
+        sample_bytes: How much of a payload chardet looks at
+        max_senders: How many senders' encodings are remembered, the least recently used are
+                     forgotten first
+    """
+
+    def __init__(self, sample_bytes: int = 4096, max_senders: int = 1024):
+        self.sample_bytes = sample_bytes
+        self.max_senders = max_senders
+        self._senders: "OrderedDict[str, str]" = OrderedDict()
+
+    def _remember(self, sender: Optional[str], encoding: str) -> None:
+        if not sender:
+            return
+        self._senders[sender] = encoding
+        self._senders.move_to_end(sender)
+        while len(self._senders) > self.max_senders:
+            self._senders.popitem(last=False)
+
+    def detect(self, payload: bytes) -> Optional[str]:
+        """chardet's guess for the first sample_bytes of the payload"""
+        with span("email.detect_charset", bytes=min(len(payload), self.sample_bytes)):
+            encoding = chardet.detect(payload[:self.sample_bytes])["encoding"]
+        count("email.charset_detections")
+        return normalize_charset(encoding)
+
+    def decode(self, payload: bytes, charset: Any = None, sender: Optional[str] = None) -> str:
+        """
+        Decode a payload
+
+        Args:
+            payload: The bytes of the text part, transfer encoding already removed
+            charset: The charset the part declares, if any
+            sender: The sender of the message, whose detected encoding is reused for its next
+                    messages, e.g. a sender_key()
+
+        Returns:
+            str: The text, undecodable bytes replaced
+        """
+        declared = normalize_charset(charset)
+        text = _strict(payload, declared)
+        if text is not None:
+            count("email.charset_declared")
+            return text
+        text = _strict(payload, "utf-8")
+        if text is not None:
+            return text
+
+        encoding = self._senders.get(sender) if sender else None
+        text = _strict(payload, encoding)
+        if text is not None:
+            count("email.charset_cached")
+            self._senders.move_to_end(sender)
+            return text
+
+        encoding = self.detect(payload) or declared
+        if not encoding:
+            return payload.decode("utf-8", errors="replace")
+        self._remember(sender, encoding)
+        return payload.decode(encoding, errors="replace")
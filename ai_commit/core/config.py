@@ -8,6 +8,151 @@ class Config:
         self.api_key = os.environ.get("AI_API_KEY", "")
         self.api_url = os.environ.get("AI_API_URL", "")
         self.common_models = ["llama2", "llama3", "llama-coder", "vicuna"]
+        self.remote_model = "gpt-3.5-turbo"
+
+        # time budget of git commands, streamed diffs get extra time per MB read
+        self.command_timeout = float(os.environ.get("AI_COMMIT_GIT_TIMEOUT", "10"))
+        self.command_timeout_per_mb = float(os.environ.get("AI_COMMIT_GIT_TIMEOUT_PER_MB", "2"))
+
+        # diff preprocessing before it goes to the model
+        self.diff_filters = [
+            name.strip() for name in
+            os.environ.get("AI_COMMIT_DIFF_FILTERS", "lockfiles,generated,binary,minified,whitespace,renames").split(",")
+            if name.strip()
+        ]
+        # build output directories the generated filter drops, relative to the repository root
+        # (a build/ deeper down is often source, e.g. in gradle or bazel projects)
+        self.generated_dirs = [
+            name.strip().strip("/") for name in
+            os.environ.get("AI_COMMIT_GENERATED_DIRS", "dist,build,vendor").split(",")
+            if name.strip().strip("/")
+        ]
+        self.diff_token_budget = int(os.environ.get("AI_COMMIT_DIFF_TOKEN_BUDGET", "0"))
+        self.output_token_reserve = 1024
+        self.default_context_window = 8192
+        self.context_windows = {
+            "gpt-3.5-turbo": 16385,
+            "gpt-4o": 128000,
+            "gpt-4": 8192,
+            "llama2": 4096,
+            "llama3": 8192,
+            "llama3.1": 131072,
+            "llama3.2": 131072,
+            "llama-coder": 16384,
+            "codellama": 16384,
+            "mistral": 32768,
+            "qwen2.5": 32768,
+            "vicuna": 4096,
+        }
+
+        # map-reduce generation for large diffs
+        self.map_reduce_threshold = int(os.environ.get("AI_COMMIT_MAP_REDUCE_THRESHOLD", "24000"))
+        self.map_reduce_chunk_size = int(os.environ.get("AI_COMMIT_MAP_REDUCE_CHUNK_SIZE", "8000"))
+        self.map_reduce_workers = int(os.environ.get("AI_COMMIT_MAP_REDUCE_WORKERS", "4"))
+
+        # batch generation over a revision range
+        self.range_workers = int(os.environ.get("AI_COMMIT_RANGE_WORKERS", "4"))
+
+        # few-shot examples from the repository's own history: how many similar past commits go
+        # into the commit prompt (0 disables it, it also needs numpy), the length of their hashed
+        # feature vectors and how many changed lines of a commit are hashed
+        self.history_examples = int(os.environ.get("AI_COMMIT_HISTORY_EXAMPLES", "3"))
+        self.history_dims = int(os.environ.get("AI_COMMIT_HISTORY_DIMS", "256"))
+        self.history_max_lines = int(os.environ.get("AI_COMMIT_HISTORY_MAX_LINES", "200"))
+
+        # files reviewed in parallel by the review agent
+        self.review_workers = int(os.environ.get("AI_COMMIT_REVIEW_WORKERS", "4"))
+
+        # background generation of the next commit message candidates
+        self.prefetch_count = int(os.environ.get("AI_COMMIT_PREFETCH", "1"))
+
+        # how long ollama keeps a model loaded after a request, e.g. "30m" (ollama's default if unset)
+        self.ollama_keep_alive = os.environ.get("AI_COMMIT_OLLAMA_KEEP_ALIVE") or None
+
+        # load the model / open the api connection while git and the prompts are read
+        self.warm_up = os.environ.get("AI_COMMIT_WARM_UP", "1") != "0"
+
+        # background daemon serving generations over a unix socket
+        self.daemon_enabled = os.environ.get("AI_COMMIT_DAEMON", "1") != "0"
+        self.daemon_socket = os.environ.get(
+            "AI_COMMIT_DAEMON_SOCKET",
+            os.path.join(
+                os.environ.get("XDG_RUNTIME_DIR") or os.path.join(
+                    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ai-commit"
+                ),
+                "ai-commit.sock"
+            )
+        )
+        self.daemon_keep_alive = os.environ.get("AI_COMMIT_DAEMON_KEEP_ALIVE", "2h")
+        self.daemon_idle_timeout = float(os.environ.get("AI_COMMIT_DAEMON_IDLE_TIMEOUT", str(10 * 3600)))
+        # seconds a client waits for the next reply of the daemon before giving up, and the
+        # shorter wait of the prepare-commit-msg hook, which blocks `git commit` meanwhile
+        self.daemon_timeout = float(os.environ.get("AI_COMMIT_DAEMON_TIMEOUT", "300"))
+        self.hook_timeout = float(os.environ.get("AI_COMMIT_HOOK_TIMEOUT", "30"))
+        # set in the daemon process itself so it never forwards requests to itself
+        self.in_daemon = False
+
+        # latency-aware routing between providers, e.g. "local:llama3,remote:gpt-4o-mini": requests
+        # go to the fastest healthy one, the next one joins when it is slower than its p95
+        self.router_enabled = os.environ.get("AI_COMMIT_ROUTER", "0") == "1"
+        self.router_providers = [
+            spec.strip() for spec in os.environ.get("AI_COMMIT_ROUTER_PROVIDERS", "").split(",") if spec.strip()
+        ]
+        self.router_hedge = os.environ.get("AI_COMMIT_ROUTER_HEDGE", "1") != "0"
+        self.router_hedge_min = float(os.environ.get("AI_COMMIT_ROUTER_HEDGE_MIN", "0.5"))
+        self.router_window = int(os.environ.get("AI_COMMIT_ROUTER_WINDOW", "50"))
+        self.router_history_path = os.environ.get(
+            "AI_COMMIT_ROUTER_HISTORY",
+            os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ai-commit", "router.json")
+        )
+
+        # on-disk llm response cache
+        self.cache_enabled = os.environ.get("AI_COMMIT_CACHE", "1") != "0"
+        self.cache_dir = os.environ.get(
+            "AI_COMMIT_CACHE_DIR",
+            os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ai-commit", "responses")
+        )
+        self.cache_max_entries = int(os.environ.get("AI_COMMIT_CACHE_MAX_ENTRIES", "500"))
+        self.cache_max_bytes = int(os.environ.get("AI_COMMIT_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.cache_max_age = float(os.environ.get("AI_COMMIT_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+
+        # imap mailbox of the email agent
+        self.imap_server = os.environ.get("AI_COMMIT_IMAP_SERVER", "imap.gmail.com")
+        self.imap_port = int(os.environ.get("AI_COMMIT_IMAP_PORT", "993"))
+        self.imap_ssl = os.environ.get("AI_COMMIT_IMAP_SSL", "1") != "0"
+        self.imap_user = os.environ.get("AI_COMMIT_IMAP_USER", "")
+        self.imap_password = os.environ.get("AI_COMMIT_IMAP_PASSWORD", "")
+        self.imap_batch_size = int(os.environ.get("AI_COMMIT_IMAP_BATCH_SIZE", "200"))
+        self.imap_body_bytes = int(os.environ.get("AI_COMMIT_IMAP_BODY_BYTES", str(64 * 1024)))
+        # bytes of a body chardet looks at when neither its declared charset nor utf-8 fits
+        self.email_charset_sample = int(os.environ.get("AI_COMMIT_EMAIL_CHARSET_SAMPLE", "4096"))
+        # local sync state, so every run only fetches the mail that arrived since the last one
+        self.email_state = os.environ.get("AI_COMMIT_EMAIL_STATE", "1") != "0"
+        self.email_state_path = os.environ.get(
+            "AI_COMMIT_EMAIL_STATE_PATH",
+            os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ai-commit", "email.sqlite3")
+        )
+
+        # unsubscribe requests of the email agent
+        self.unsubscribe_workers = int(os.environ.get("AI_COMMIT_UNSUBSCRIBE_WORKERS", "8"))
+        self.unsubscribe_per_host = int(os.environ.get("AI_COMMIT_UNSUBSCRIBE_PER_HOST", "2"))
+        self.unsubscribe_timeout = float(os.environ.get("AI_COMMIT_UNSUBSCRIBE_TIMEOUT", "10"))
+
+        # spam scoring of the email agent: a json rule set (the built-in one if unset), the score
+        # that flags an email and how much of the body is scanned
+        self.spam_rules = os.environ.get("AI_COMMIT_SPAM_RULES", "")
+        self.spam_threshold = float(os.environ.get("AI_COMMIT_SPAM_THRESHOLD", "1"))
+        self.spam_scan_chars = int(os.environ.get("AI_COMMIT_SPAM_SCAN_CHARS", str(32 * 1024)))
+
+        # http transport for the remote api
+        self.http_connect_timeout = float(os.environ.get("AI_COMMIT_HTTP_CONNECT_TIMEOUT", "5"))
+        self.http_read_timeout = float(os.environ.get("AI_COMMIT_HTTP_READ_TIMEOUT", "120"))
+        self.http_max_retries = int(os.environ.get("AI_COMMIT_HTTP_MAX_RETRIES", "3"))
+        self.http_backoff_base = float(os.environ.get("AI_COMMIT_HTTP_BACKOFF_BASE", "0.5"))
+        self.http_backoff_max = float(os.environ.get("AI_COMMIT_HTTP_BACKOFF_MAX", "8"))
+        self.http_pool_size = int(os.environ.get("AI_COMMIT_HTTP_POOL_SIZE", "8"))
+        self.http_compress = os.environ.get("AI_COMMIT_HTTP_GZIP", "0") == "1"
+        self.http_compress_threshold = int(os.environ.get("AI_COMMIT_HTTP_GZIP_THRESHOLD", str(64 * 1024)))
 
     def validate_api_credentials(self) -> bool:
         return self.api_key and self.api_url
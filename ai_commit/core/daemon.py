@@ -0,0 +1,319 @@
+"""
+Long-lived background daemon for ai-commit
+
+The daemon keeps the providers, the pooled http connections and the response cache of one
+process alive for the whole day, keeps the local ollama models loaded, and serves generations to
+the `ai-commit` cli and the prepare-commit-msg hook over a unix socket. The client half of this
+module only uses the standard library, so thin clients stay cheap to start.
+
+Protocol: the client sends one json object per connection on a single line, e.g.
+{"op": "generate", "prompt": ..., "context": ...}, and the daemon answers with one or more json
+lines. Complete streams end with {"done": true}, failures (a stream cut short too) are reported
+as {"error": "..."}.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, Generator, Iterator, Optional
+
+from ai_commit.core.config import config
+
+# how often the daemon reloads the local models it has served, so ollama never evicts them
+REFRESH_INTERVAL = 10 * 60
+
+
+class DaemonClient:
+    """
+    Talks to a running daemon, every method degrades to None when there is none
+
+    Args:
+        socket_path: The socket of the daemon, the configured one by default
+        connect_timeout: Seconds to wait for the connection
+        timeout: Seconds to wait for every reply, e.g. between two tokens of a stream
+            (defaults to the config)
+    """
+
+    def __init__(self, socket_path: str = "", connect_timeout: float = 1.0, timeout: float = 0):
+        self.socket_path = socket_path or config.daemon_socket
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout or config.daemon_timeout
+
+    def available(self) -> bool:
+        return hasattr(socket, "AF_UNIX") and os.path.exists(self.socket_path)
+
+    def _open(self, op: str, **payload: Any) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.socket_path)
+            # generations can take minutes, but a hung daemon must not block the caller forever
+            sock.settimeout(self.timeout)
+            sock.sendall(json.dumps({"op": op, **payload}).encode("utf-8") + b"\n")
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _replies(self, sock: socket.socket) -> Iterator[Dict[str, Any]]:
+        with sock, sock.makefile("r", encoding="utf-8") as replies:
+            for line in replies:
+                reply = json.loads(line)
+                if "error" in reply:
+                    raise RuntimeError(reply["error"])
+                yield reply
+
+    def call(self, op: str, **payload: Any) -> Optional[Dict[str, Any]]:
+        """
+        Send a request and return the first reply, or None when the daemon can't be reached,
+        fails or doesn't answer within the timeout
+        """
+        if not self.available():
+            return None
+        try:
+            return next(self._replies(self._open(op, **payload)), None)
+        except (OSError, ValueError, RuntimeError):
+            return None
+
+    def generate(self, prompt: str, context: str, use_local: bool = False, model_name: str = "",
+                 use_cache: bool = True, **kwargs: Any) -> Optional[str]:
+        reply = self.call("generate", prompt=prompt, context=context, use_local=use_local,
+                          model_name=model_name, use_cache=use_cache, kwargs=kwargs)
+        return reply.get("response") if reply else None
+
+    def stream(self, prompt: str, context: str, use_local: bool = False, model_name: str = "",
+               use_cache: bool = True, **kwargs: Any) -> Optional[Generator[str, None, bool]]:
+        """
+        Returns:
+            Optional[Generator[str, None, bool]]: The token stream, or None when the daemon can't
+                be reached. It returns whether the daemon completed the answer. Iterating it raises
+                RuntimeError when the daemon reports an error and OSError when it stops answering.
+        """
+        if not self.available():
+            return None
+        try:
+            sock = self._open("stream", prompt=prompt, context=context, use_local=use_local,
+                              model_name=model_name, use_cache=use_cache, kwargs=kwargs)
+        except OSError:
+            return None
+        return self._tokens(sock)
+
+    def _tokens(self, sock: socket.socket) -> Generator[str, None, bool]:
+        for reply in self._replies(sock):
+            if "token" in reply:
+                yield reply["token"]
+            elif reply.get("done"):
+                return True
+        return False
+
+
+class DaemonServer:
+    """Serves generation requests on a unix socket until it is stopped or idle for too long"""
+
+    def __init__(self, socket_path: str = "", idle_timeout: float = 0):
+        self.socket_path = socket_path or config.daemon_socket
+        self.idle_timeout = idle_timeout or config.daemon_idle_timeout
+        self.started = time.time()
+        self.last_request = time.time()
+        self.requests = 0
+        self.local_models = set()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def handle(self, conn: socket.socket) -> None:
+        with conn, conn.makefile("rw", encoding="utf-8") as stream:
+            def reply(**message: Any) -> None:
+                stream.write(json.dumps(message) + "\n")
+                stream.flush()
+
+            try:
+                request = json.loads(stream.readline() or "{}")
+                with self._lock:
+                    self.last_request = time.time()
+                    self.requests += 1
+                self.dispatch(request, reply)
+            except (OSError, ValueError) as e:
+                # the client went away or sent garbage, nothing to answer
+                print(f"⚠️ Dropped request: {e}")
+            except Exception as e:
+                try:
+                    reply(error=str(e))
+                except OSError:
+                    pass
+
+    def dispatch(self, request: Dict[str, Any], reply) -> None:
+        from ai_commit.core.llm import generate_response, is_failed_response, stream_response, warm_up
+        from ai_commit.core.streaming import TrackedStream
+
+        op = request.get("op")
+        if request.get("use_local") and request.get("model_name"):
+            self.local_models.add(request["model_name"])
+
+        if op == "ping":
+            reply(ok=True, pid=os.getpid(), uptime=time.time() - self.started, requests=self.requests,
+                  local_models=sorted(self.local_models))
+        elif op == "generate":
+            reply(response=generate_response(
+                request["prompt"], request["context"], request.get("use_local", False),
+                request.get("model_name", ""), request.get("use_cache", True), **request.get("kwargs", {})
+            ))
+        elif op == "stream":
+            stream = TrackedStream(stream_response(
+                request["prompt"], request["context"], request.get("use_local", False),
+                request.get("model_name", ""), request.get("use_cache", True), **request.get("kwargs", {})
+            ))
+            for token in stream:
+                reply(token=token)
+            # done only marks a complete answer, the client must not take a cut stream for one
+            if stream.completed:
+                reply(done=True)
+            else:
+                reply(error="the model stopped before the end of the answer")
+        elif op == "warm_up":
+            warm_up(request.get("use_local", False), request.get("model_name", ""))
+            reply(ok=True)
+        elif op == "commit_message":
+            from ai_commit.Agents.commit_agent import CommitAgent
+            from ai_commit.core.history import start_history_update
+
+            agent = CommitAgent()
+            use_local = request.get("use_local", False)
+            model_name = request.get("model_name", "")
+            # the daemon serves every repository, the examples come from the one the hook runs in
+            agent.repo = request.get("repo")
+            if agent.repo:
+                start_history_update(agent.repo)
+            diff = agent.prepare_diff(request["diff"], model_name if use_local else "", verbose=False)
+            message = agent.generate_commit_message(diff, use_local, model_name, examples=bool(agent.repo)).strip()
+            reply(response="" if is_failed_response(message) else message)
+        elif op == "shutdown":
+            reply(ok=True)
+            self._stop.set()
+        else:
+            reply(error=f"unknown op {op!r}")
+
+    def keep_models_loaded(self) -> None:
+        """Reload the local models now and then, so the first request of the day doesn't pay for it"""
+        from ai_commit.core.llm import LocalLLMProvider
+
+        while not self._stop.wait(REFRESH_INTERVAL):
+            for model_name in list(self.local_models):
+                try:
+                    LocalLLMProvider(model_name).load_model()
+                except Exception as e:
+                    print(f"⚠️ Could not keep {model_name} loaded: {e}")
+
+    def serve_forever(self) -> None:
+        # the daemon answers requests itself instead of forwarding them, and keeps models loaded
+        config.in_daemon = True
+        config.ollama_keep_alive = config.ollama_keep_alive or config.daemon_keep_alive
+
+        if DaemonClient(self.socket_path).call("ping"):
+            print(f"❌ A daemon is already listening on {self.socket_path}")
+            return
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)  # left over by a daemon that died
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # only the current user may talk to the daemon
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen(16)
+        server.settimeout(1.0)
+        threading.Thread(target=self.keep_models_loaded, daemon=True).start()
+        print(f"✨ ai-commit daemon {os.getpid()} listening on {self.socket_path}", flush=True)
+
+        try:
+            while not self._stop.is_set():
+                if time.time() - self.last_request > self.idle_timeout:
+                    print("💤 Idle for too long, shutting down", flush=True)
+                    break
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+def start_daemon(wait: float = 5.0) -> bool:
+    """
+    Start the daemon as a detached background process
+
+    Returns:
+        bool: Whether the daemon answers within the wait time
+    """
+    client = DaemonClient()
+    if client.call("ping"):
+        return True
+
+    log_dir = os.path.dirname(config.cache_dir)
+    os.makedirs(log_dir, exist_ok=True)
+    with open(os.path.join(log_dir, "daemon.log"), "a", encoding="utf-8") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "ai_commit.core.daemon"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+            close_fds=True
+        )
+
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        if client.call("ping"):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def daemon_command(action: str) -> int:
+    """
+    Run a `ai-commit --daemon` action: start, stop, status or serve (in the foreground)
+
+    Returns:
+        int: The exit code
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        print("❌ The daemon needs unix sockets, which this platform does not support.")
+        return 1
+
+    client = DaemonClient()
+    if action == "serve":
+        DaemonServer().serve_forever()
+        return 0
+    if action == "start":
+        if start_daemon():
+            print(f"✨ ai-commit daemon is running on {client.socket_path}")
+            return 0
+        print("❌ The daemon did not start, see daemon.log next to the response cache.")
+        return 1
+    if action == "stop":
+        if client.call("shutdown"):
+            print("✨ ai-commit daemon stopped")
+        else:
+            print("ai-commit daemon is not running")
+        return 0
+
+    status = client.call("ping")
+    if not status:
+        print("ai-commit daemon is not running")
+        return 1
+    print(f"✨ ai-commit daemon {status['pid']} on {client.socket_path}")
+    print(f"  uptime     {status['uptime'] / 60:.0f} min")
+    print(f"  requests   {status['requests']}")
+    print(f"  models     {', '.join(status['local_models']) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    DaemonServer().serve_forever()
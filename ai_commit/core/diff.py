@@ -0,0 +1,419 @@
+import copy
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ai_commit.core.config import config
+
+# every file section in `git diff` output starts with this header
+FILE_HEADER = re.compile(r"^diff --git ", re.MULTILINE)
+HUNK_HEADER = re.compile(r"^@@ ", re.MULTILINE)
+# the first line of the old and the new side of a hunk
+HUNK_RANGE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+
+
+def split_diff(diff: str) -> List[str]:
+    """
+    Split a unified git diff into one piece per file
+
+    Args:
+        diff: The full output of `git diff`
+
+    Returns:
+        List[str]: The diff of every file, header included
+    """
+    starts = [match.start() for match in FILE_HEADER.finditer(diff)]
+    if not starts:
+        return [diff] if diff.strip() else []
+
+    starts.append(len(diff))
+    return [diff[start:end] for start, end in zip(starts, starts[1:])]
+
+
+def iter_file_diffs(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Group a streamed diff into one piece per file, yielding every file as soon as the next one
+    starts. Only the file being read is held in memory.
+
+    Args:
+        lines: The lines of a `git diff`, line endings included
+    """
+    current: List[str] = []
+    for line in lines:
+        if line.startswith("diff --git ") and current:
+            yield "".join(current)
+            current = []
+        current.append(line)
+    if current:
+        yield "".join(current)
+
+
+def split_hunks(file_diff: str) -> List[str]:
+    """
+    Split the diff of a single file into its hunks, each one prefixed with the file header
+    so the model still knows which file it is looking at
+
+    Args:
+        file_diff: The diff of one file
+
+    Returns:
+        List[str]: The hunks of the file
+    """
+    starts = [match.start() for match in HUNK_HEADER.finditer(file_diff)]
+    if not starts:
+        return [file_diff]
+
+    header = file_diff[:starts[0]]
+    starts.append(len(file_diff))
+    return [header + file_diff[start:end] for start, end in zip(starts, starts[1:])]
+
+
+def chunk_diff(diff: str, max_chunk_size: int) -> List[str]:
+    """
+    Split a diff into chunks of at most max_chunk_size characters. Files are kept whole
+    when they fit, bigger files are split by hunk, and a single hunk that is still too
+    large is cut into plain slices.
+
+    Args:
+        diff: The full output of `git diff`
+        max_chunk_size: The maximum number of characters per chunk
+
+    Returns:
+        List[str]: The chunks, in diff order
+    """
+    chunks = []
+    for file_diff in split_diff(diff):
+        if len(file_diff) <= max_chunk_size:
+            chunks.append(file_diff)
+            continue
+
+        for hunk in split_hunks(file_diff):
+            for start in range(0, len(hunk), max_chunk_size):
+                chunks.append(hunk[start:start + max_chunk_size])
+    return chunks
+
+
+# rough token estimate shared by every model, good enough to budget prompts
+CHARS_PER_TOKEN = 4
+
+LOCKFILES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb",
+    "poetry.lock", "Pipfile.lock", "uv.lock", "pdm.lock", "Cargo.lock", "go.sum",
+    "composer.lock", "Gemfile.lock", "Podfile.lock", "mix.lock", "flake.lock",
+}
+# generated wherever they are, the build output directories of config.generated_dirs only
+# count at the repository root
+GENERATED_PATTERNS = re.compile(
+    r"(^|/)(node_modules|__generated__)/"
+    r"|\.min\.(js|css)$|\.map$|_pb2(_grpc)?\.pyi?$|\.pb\.go$|\.g\.dart$|\.snap$"
+)
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "auto-generated", "autogenerated")
+# generated files announce themselves in their first lines
+GENERATED_MARKER_LINES = 10
+DOC_EXTENSIONS = (".md", ".rst", ".txt", ".adoc")
+CONFIG_EXTENSIONS = (".json", ".yaml", ".yml", ".toml", ".ini", ".cfg", ".xml", ".lock")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class FileDiff:
+    """The diff of a single file, split into its header and its hunks"""
+
+    def __init__(self, text: str):
+        hunks = split_hunks(text)
+        first_hunk = HUNK_HEADER.search(text)
+        self.header = text[:first_hunk.start()] if first_hunk else text
+        self.hunks = [hunk[len(self.header):] for hunk in hunks] if first_hunk else []
+        self.path = self._parse_path()
+        # position of the file in the original diff
+        self.index = 0
+
+    def _parse_path(self) -> str:
+        for line in self.header.splitlines():
+            if line.startswith("+++ ") and line != "+++ /dev/null":
+                return line[4:].split("\t")[0][2:] if line[4:].startswith("b/") else line[4:]
+            if line.startswith("rename to "):
+                return line[len("rename to "):]
+        first_line = self.header.split("\n", 1)[0]
+        if " b/" in first_line:
+            return first_line.rsplit(" b/", 1)[1]
+        for line in self.header.splitlines():
+            if line.startswith("--- a/"):
+                return line[6:]
+        return first_line
+
+    @property
+    def name(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def is_binary(self) -> bool:
+        return "\nBinary files " in self.header or "GIT binary patch" in self.header
+
+    @property
+    def is_rename(self) -> bool:
+        return "\nrename from " in self.header
+
+    def changed_lines(self, hunk: str = None) -> Tuple[int, int]:
+        """Count the added and deleted lines of one hunk, or of the whole file"""
+        additions = deletions = 0
+        for text in [hunk] if hunk is not None else self.hunks:
+            for line in text.splitlines():
+                if line.startswith("+"):
+                    additions += 1
+                elif line.startswith("-"):
+                    deletions += 1
+        return additions, deletions
+
+    def weight(self) -> float:
+        """How much a hunk of this file is worth in the prompt compared to the other files"""
+        path = self.path.lower()
+        if "test" in path:
+            return 0.7
+        if path.endswith(CONFIG_EXTENSIONS):
+            return 0.6
+        if path.endswith(DOC_EXTENSIONS):
+            return 0.5
+        return 1.0
+
+    def stat_line(self, note: str = "") -> str:
+        """A `git diff --stat` style summary line"""
+        additions, deletions = self.changed_lines()
+        line = f" {self.path} | {additions + deletions} (+{additions} -{deletions})"
+        return f"{line} {note}" if note else line
+
+    def text(self) -> str:
+        return self.header + "".join(self.hunks)
+
+
+# Filters get the diff of one file and return it (possibly with fewer hunks), or None to drop
+# the whole file. Dropped files are listed in the --stat summary appended to the prompt.
+
+def drop_lockfiles(file_diff: FileDiff) -> Optional[FileDiff]:
+    return None if file_diff.name in LOCKFILES else file_diff
+
+
+def drop_generated(file_diff: FileDiff) -> Optional[FileDiff]:
+    path = file_diff.path
+    if GENERATED_PATTERNS.search(path) or path.startswith(tuple(f"{name}/" for name in config.generated_dirs)):
+        return None
+    # the markers only count in the first lines of the file, a hunk further down that mentions
+    # one (e.g. a check for "DO NOT EDIT") is a change like any other
+    match = HUNK_RANGE.match(file_diff.hunks[0]) if file_diff.hunks else None
+    if match and min(int(match.group(1)), int(match.group(2))) <= 1:
+        head = file_diff.hunks[0].splitlines()[1:1 + GENERATED_MARKER_LINES]
+        if any(marker in line for line in head for marker in GENERATED_MARKERS):
+            return None
+    return file_diff
+
+
+def drop_minified(file_diff: FileDiff) -> Optional[FileDiff]:
+    lines = [line for hunk in file_diff.hunks for line in hunk.splitlines() if line.startswith(("+", "-"))]
+    if lines and sum(len(line) for line in lines) / len(lines) > 500:
+        return None
+    return file_diff
+
+
+def drop_binary(file_diff: FileDiff) -> Optional[FileDiff]:
+    return None if file_diff.is_binary else file_diff
+
+
+def drop_whitespace_hunks(file_diff: FileDiff) -> Optional[FileDiff]:
+    """Drop the hunks that only change whitespace, and the file if nothing else is left"""
+    if not file_diff.hunks:
+        return file_diff
+
+    kept = []
+    for hunk in file_diff.hunks:
+        removed, added = [], []
+        for line in hunk.splitlines()[1:]:
+            if line.startswith("-"):
+                removed.extend(line[1:].split())
+            elif line.startswith("+"):
+                added.extend(line[1:].split())
+        if removed != added:
+            kept.append(hunk)
+
+    if not kept:
+        return None
+    file_diff.hunks = kept
+    return file_diff
+
+
+def collapse_renames(file_diff: FileDiff) -> Optional[FileDiff]:
+    """Shrink a pure rename (no content change) to its rename lines"""
+    if file_diff.is_rename and not file_diff.hunks:
+        lines = file_diff.header.splitlines()
+        keep = [lines[0]] + [line for line in lines if line.startswith(("rename from ", "rename to "))]
+        file_diff.header = "\n".join(keep) + "\n"
+    return file_diff
+
+
+# filter registry, AI_COMMIT_DIFF_FILTERS picks which ones run and in what order
+FILTERS: Dict[str, Callable[[FileDiff], Optional[FileDiff]]] = {
+    "lockfiles": drop_lockfiles,
+    "generated": drop_generated,
+    "binary": drop_binary,
+    "minified": drop_minified,
+    "whitespace": drop_whitespace_hunks,
+    "renames": collapse_renames,
+}
+
+
+class PreprocessResult:
+    """The preprocessed diff and how much it saved"""
+
+    def __init__(self, text: str, original: str, dropped: List[str]):
+        self.text = text
+        self.dropped = dropped
+        self.original_bytes = len(original.encode("utf-8"))
+        self.bytes = len(text.encode("utf-8"))
+        self.original_tokens = estimate_tokens(original)
+        self.tokens = estimate_tokens(text)
+
+    def report(self) -> str:
+        saved_bytes = self.original_bytes - self.bytes
+        saved_tokens = self.original_tokens - self.tokens
+        return (
+            f"🧹 Diff preprocessing saved {saved_bytes:,} bytes (~{saved_tokens:,} tokens): "
+            f"{self.original_bytes:,} → {self.bytes:,} bytes, {len(self.dropped)} files or hunks left out"
+        )
+
+
+class DiffPreprocessor:
+    """
+    Cleans up a diff before it goes to the model: filters drop low-value files and hunks, then
+    the diff is fit into a token budget by keeping the most informative hunks
+    """
+
+    STAT_TITLE = "\n# Left out of this prompt (git diff --stat):\n"
+
+    def __init__(self, filters: List[Callable[[FileDiff], Optional[FileDiff]]] = None):
+        self.filters = list(FILTERS.values()) if filters is None else filters
+
+    @classmethod
+    def from_names(cls, names: List[str]) -> "DiffPreprocessor":
+        """Build a preprocessor from filter names of the registry, unknown names are ignored"""
+        return cls([FILTERS[name] for name in names if name in FILTERS])
+
+    def filter(self, files: List[FileDiff]) -> Tuple[List[FileDiff], List[str]]:
+        """Run every filter on every file, returning the kept files and the stat lines of the dropped ones"""
+        kept, dropped = [], []
+        for file_diff in files:
+            for file_filter in self.filters:
+                result = file_filter(file_diff)
+                if result is None:
+                    dropped.append(file_diff.stat_line(f"[{file_filter.__name__.replace('_', ' ')}]"))
+                    break
+                file_diff = result
+            else:
+                kept.append(file_diff)
+        return kept, dropped
+
+    def fit_budget(self, files: List[FileDiff], token_budget: int) -> Tuple[List[FileDiff], List[str]]:
+        """
+        Keep the most informative hunks that fit in the token budget. File headers are kept
+        first so the model still sees every touched file, then hunks are picked greedily by
+        changed lines per token, weighted by the kind of file. The files are not modified,
+        trimmed copies are returned.
+        """
+        dropped = []
+        budget = token_budget
+
+        files = sorted(files, key=lambda f: f.weight(), reverse=True)
+        header_tokens = sum(estimate_tokens(f.header) for f in files)
+        while files and header_tokens > budget:
+            file_diff = files.pop()
+            header_tokens -= estimate_tokens(file_diff.header)
+            dropped.append(file_diff.stat_line("[over budget]"))
+        budget -= header_tokens
+
+        candidates = []
+        for file_diff in files:
+            for index, hunk in enumerate(file_diff.hunks):
+                tokens = estimate_tokens(hunk)
+                changed = sum(file_diff.changed_lines(hunk))
+                candidates.append((file_diff.weight() * (changed + 1) / max(tokens, 1), tokens, id(file_diff), index))
+
+        keep = set()
+        for _, tokens, file_id, index in sorted(candidates, reverse=True):
+            if tokens <= budget:
+                keep.add((file_id, index))
+                budget -= tokens
+
+        trimmed = []
+        for file_diff in files:
+            hunks = [hunk for index, hunk in enumerate(file_diff.hunks) if (id(file_diff), index) in keep]
+            if len(hunks) < len(file_diff.hunks):
+                total = len(file_diff.hunks)
+                dropped.append(file_diff.stat_line(f"[{total - len(hunks)} of {total} hunks over budget]"))
+                file_diff = copy.copy(file_diff)
+                file_diff.hunks = hunks
+            trimmed.append(file_diff)
+        return trimmed, dropped
+
+    def cap_summary(self, dropped: List[str], token_budget: int) -> List[str]:
+        """Shorten the summary of what was left out to the budget, counting the rest in one line"""
+        lines, tokens = [], estimate_tokens(self.STAT_TITLE)
+        for line in dropped:
+            tokens += estimate_tokens(line) + 1
+            if tokens > token_budget:
+                lines.append(f" ... and {len(dropped) - len(lines)} more files")
+                break
+            lines.append(line)
+        return lines
+
+    def render(self, files: List[FileDiff], dropped: List[str]) -> str:
+        """Join the kept files in diff order, followed by the summary of what was left out"""
+        files = sorted(files, key=lambda f: f.index)
+        text = "".join(f.text() for f in files)
+        if dropped:
+            text += self.STAT_TITLE + "\n".join(dropped) + "\n"
+        return text
+
+    def process(self, diff: str, token_budget: int = 0) -> PreprocessResult:
+        """
+        Args:
+            diff: The full output of `git diff`
+            token_budget: The maximum number of tokens of the result, 0 for no limit
+
+        Returns:
+            PreprocessResult: The cleaned up diff and the savings
+        """
+        files = []
+        for index, text in enumerate(split_diff(diff)):
+            file_diff = FileDiff(text)
+            file_diff.index = index
+            files.append(file_diff)
+
+        files, dropped = self.filter(files)
+        text = self.render(files, dropped)
+        if token_budget and estimate_tokens(text) > token_budget:
+            # the summary of what is left out takes room too, so fit once more without that room.
+            # with thousands of files left out, the summary itself gets at most a quarter
+            trimmed, over_budget = self.fit_budget(files, token_budget)
+            summary = self.cap_summary(dropped + over_budget, token_budget // 4)
+            summary_tokens = estimate_tokens(self.STAT_TITLE + "\n".join(summary))
+            if estimate_tokens(self.render(trimmed, summary)) > token_budget:
+                trimmed, over_budget = self.fit_budget(files, token_budget - summary_tokens)
+                summary = self.cap_summary(dropped + over_budget, summary_tokens)
+            text = self.render(trimmed, summary)
+            dropped = dropped + over_budget
+        return PreprocessResult(text, diff, dropped)
+
+
+def token_budget_for(model_name: str, prompt: str = "") -> int:
+    """
+    The number of diff tokens that fit in the context window of a model, once the prompt and
+    room for the answer are taken out. AI_COMMIT_DIFF_TOKEN_BUDGET overrides it.
+    """
+    if config.diff_token_budget:
+        return config.diff_token_budget
+
+    model = model_name.lower()
+    # the longest matching prefix wins, e.g. llama3.2 over llama3
+    matches = [name for name in config.context_windows if model.startswith(name)]
+    window = config.context_windows[max(matches, key=len)] if matches else config.default_context_window
+    return max(window - estimate_tokens(prompt) - config.output_token_reserve, 512)
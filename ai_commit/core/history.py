@@ -0,0 +1,470 @@
+"""
+Local similarity index over the commit history of a repository
+
+Every past commit is turned into a small vector of hashed features: the directories, names and
+extensions of the files it touches, the identifiers on its changed lines and the words of its
+message. The vectors are appended to memory-mapped numpy arrays under the git directory, next to
+the commit shas and messages. Updates are incremental: only the commits since the last indexed
+HEAD are read, with one streamed `git log -p`, and progress is saved after every batch so an
+interrupted first build carries on where it stopped. The staged diff is hashed the same way and
+the most similar past commits become few-shot examples of the commit prompt, so generated
+messages follow the repository's own conventions. numpy is optional: without it there are no
+examples.
+"""
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ai_commit.core.config import config
+from ai_commit.core.diff import CHARS_PER_TOKEN
+from ai_commit.core.tracing import count, span
+from ai_commit.core.utils import stream_command
+
+# identifiers and words of at least three characters
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+# the first line of every commit in the `git log` output, followed by its message
+COMMIT_MARKER = "\x01"
+# messages that say nothing about the conventions of a repository
+SKIPPED_MESSAGES = ("Merge ", "fixup!", "squash!", "amend!")
+EXAMPLES_TITLE = "### EXAMPLES FROM THIS REPOSITORY ###"
+CODE_CHANGES_TITLE = "### CODE CHANGES ###"
+
+
+def numpy_available() -> bool:
+    return importlib.util.find_spec("numpy") is not None
+
+
+def feature_weights(paths: Iterable[str], changed: Iterable[str], message: str = "") -> Dict[str, float]:
+    """
+    The features of a change and their weights: the paths weigh most, then the identifiers of
+    the changed lines, then the words of the message
+
+    Args:
+        paths: The paths of the changed files
+        changed: The added and removed lines
+        message: The commit message, if any
+    """
+    features: Dict[str, float] = {}
+    for path in paths:
+        parts = path.lower().split("/")
+        for part in parts[:-1]:
+            features["d:" + part] = 2.0
+        features["f:" + parts[-1]] = 2.0
+        _, dot, extension = parts[-1].rpartition(".")
+        if dot:
+            features["e:" + extension] = 1.5
+    for line in changed:
+        for word in IDENTIFIER.findall(line):
+            features.setdefault("w:" + word.lower(), 1.0)
+    for word in IDENTIFIER.findall(message):
+        features.setdefault("w:" + word.lower(), 0.5)
+    return features
+
+
+def diff_features(lines: Iterable[str], max_lines: int) -> Tuple[List[str], List[str]]:
+    """The changed files and the first max_lines changed lines of a diff"""
+    paths: List[str] = []
+    changed: List[str] = []
+    for line in lines:
+        if line.startswith("diff --git "):
+            paths.append(line.rstrip("\n").rsplit(" b/", 1)[-1])
+        elif line.startswith(("+", "-")) and not line.startswith(("+++", "---")) and len(changed) < max_lines:
+            changed.append(line[1:])
+    return paths, changed
+
+
+def hash_features(rows: List[Dict[str, float]], dims: int) -> Any:
+    """
+    The signed hashed feature vectors of the rows, L2 normalized
+
+    Returns:
+        numpy.ndarray: A float32 matrix of len(rows) x dims
+    """
+    import numpy as np
+
+    indices: List[int] = []
+    columns: List[int] = []
+    values: List[float] = []
+    for row, features in enumerate(rows):
+        for feature, weight in features.items():
+            digest = zlib.crc32(feature.encode("utf-8"))
+            indices.append(row)
+            columns.append(digest % dims)
+            # the sign bit keeps colliding features from adding up
+            values.append(weight if digest & 0x80000000 else -weight)
+    matrix = np.zeros((len(rows), dims), dtype=np.float32)
+    np.add.at(matrix, (np.asarray(indices, dtype=np.intp), np.asarray(columns, dtype=np.intp)),
+              np.asarray(values, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-6)
+
+
+def iter_log_commits(lines: Iterable[str], max_lines: int) -> Iterator[Tuple[str, str, List[str], List[str]]]:
+    """
+    Split the output of `git log -p --format=%x01%H%n%B%x01` into commits
+
+    Yields:
+        Tuple: The sha, the message, the changed files and the first max_lines changed lines
+    """
+    sha: Optional[str] = None
+    message: List[str] = []
+    diff: List[str] = []
+    in_message = False
+
+    def commit() -> Tuple[str, str, List[str], List[str]]:
+        paths, changed = diff_features(diff, max_lines)
+        return sha, "".join(message).strip(), paths, changed
+
+    for line in lines:
+        if in_message:
+            end = line.rstrip("\n")
+            if end.endswith(COMMIT_MARKER):
+                message.append(end[:-1])
+                in_message = False
+            else:
+                message.append(line)
+        elif line.startswith(COMMIT_MARKER) and len(line) >= 41:
+            if sha is not None:
+                yield commit()
+            sha, message, diff, in_message = line[1:41], [], [], True
+        elif sha is not None and (line.startswith(("diff --git ", "+", "-"))):
+            # only the lines diff_features looks at, the rest of a large commit isn't kept
+            if line.startswith("diff --git ") or len(diff) < max_lines * 2:
+                diff.append(line)
+    if sha is not None:
+        yield commit()
+
+
+def git_output(args: List[str], cwd: Optional[str] = None) -> Optional[str]:
+    """The output of a git command, None when it fails"""
+    result = subprocess.run(["git", *args], capture_output=True, text=True, encoding="utf-8", errors="replace",
+                            cwd=cwd)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+class HistoryIndex:
+    """
+    The hashed feature vectors, shas and messages of a repository's commits
+
+    Files of the index directory, rows in the order the commits were indexed:
+        vectors.i8    count x dims int8 feature vectors, every row scaled to +-127
+        scales.f32    count float32 scales that turn a row back into the unit vector
+        shas.bin      count x 20 byte binary shas
+        offsets.u64   count x (start, end) of the message in messages.bin
+        messages.bin  the utf-8 messages, trimmed to max_message_chars
+        meta.json     the row count and the HEAD the index is up to date with
+
+    The data files only ever grow: rows are written before meta.json counts them, so a reader
+    maps a consistent prefix while an update appends to it.
+
+    Args:
+        directory: The index directory, e.g. .git/ai-commit/history
+        dims: The length of the feature vectors
+        max_lines: The changed lines of a commit that are hashed
+        batch_size: Commits written (and progress saved) at once
+    """
+
+    VERSION = 2
+    max_message_chars = 1000
+
+    def __init__(self, directory: str, dims: int = 256, max_lines: int = 200, batch_size: int = 2048):
+        self.directory = directory
+        self.dims = dims
+        self.max_lines = max_lines
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self.path("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") == self.VERSION and meta.get("dims") == self.dims:
+                return meta
+        except (OSError, ValueError):
+            pass
+        # missing, or written with other settings: rows are overwritten from the start
+        return {"version": self.VERSION, "dims": self.dims, "count": 0, "message_bytes": 0, "head": None,
+                "pending": None}
+
+    def save_meta(self, meta: Dict[str, Any]) -> None:
+        tmp_path = f"{self.path('meta.json')}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.path("meta.json"))
+
+    @property
+    def count(self) -> int:
+        return self.load_meta()["count"]
+
+    def size_bytes(self) -> int:
+        """The disk size of the rows the index counts"""
+        meta = self.load_meta()
+        return meta["count"] * (self.dims + 4 + 20 + 16) + meta["message_bytes"]
+
+    def _write_at(self, name: str, offset: int, data: bytes) -> None:
+        path = self.path(name)
+        with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+            f.seek(offset)
+            f.write(data)
+
+    def append(self, meta: Dict[str, Any], commits: List[Tuple[str, str, List[str], List[str]]]) -> None:
+        """Write a batch of parsed commits after the rows of meta, and count them in meta"""
+        import numpy as np
+
+        vectors = hash_features([feature_weights(paths, changed, message) for _, message, paths, changed in commits],
+                                self.dims)
+        messages = [message[:self.max_message_chars].encode("utf-8") for _, message, _, _ in commits]
+        ends = np.cumsum([len(message) for message in messages], dtype=np.uint64) + np.uint64(meta["message_bytes"])
+        starts = ends - np.asarray([len(message) for message in messages], dtype=np.uint64)
+
+        # int8 rows convert to float32 three times faster than float16 ones at half the size
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-6) / 127
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+
+        rows = meta["count"]
+        self._write_at("vectors.i8", rows * self.dims, quantized.tobytes())
+        self._write_at("scales.f32", rows * 4, scales.astype(np.float32).tobytes())
+        self._write_at("shas.bin", rows * 20, b"".join(bytes.fromhex(sha) for sha, _, _, _ in commits))
+        self._write_at("offsets.u64", rows * 16, np.stack([starts, ends], axis=1).tobytes())
+        self._write_at("messages.bin", meta["message_bytes"], b"".join(messages))
+        meta["count"] = rows + len(commits)
+        meta["message_bytes"] = int(ends[-1])
+
+    def _index_range(self, meta: Dict[str, Any], cwd: Optional[str]) -> None:
+        pending = meta["pending"]
+        revisions = f"{pending['base']}..{pending['target']}" if pending["base"] else pending["target"]
+        command = ["git", "-c", "core.quotePath=false", "log", "--no-merges", "-p", "--unified=0", "--no-color",
+                   "--no-ext-diff", "--no-renames", f"--format={COMMIT_MARKER}%H%n%B{COMMIT_MARKER}",
+                   f"--skip={pending['done']}", revisions]
+        if cwd:
+            command[1:1] = ["-C", cwd]
+        batch = []
+        for commit in iter_log_commits(stream_command(command), self.max_lines):
+            batch.append(commit)
+            if len(batch) >= self.batch_size:
+                self.append(meta, batch)
+                pending["done"] += len(batch)
+                self.save_meta(meta)
+                batch = []
+        if batch:
+            self.append(meta, batch)
+            pending["done"] += len(batch)
+        meta["head"] = pending["target"]
+        meta["pending"] = None
+        self.save_meta(meta)
+
+    def update(self, cwd: Optional[str] = None) -> int:
+        """
+        Index the commits that aren't indexed yet. Commits a rebase or reset left behind stay in
+        the index, they are still examples of how this repository writes messages.
+
+        Args:
+            cwd: The repository, the current directory by default
+
+        Returns:
+            int: The number of commits added, -1 when another process is updating the index
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if not self._acquire():
+            return -1
+        try:
+            with self._lock, span("history.update"):
+                meta = self.load_meta()
+                before = meta["count"]
+                while True:
+                    if meta["pending"] is None:
+                        head = git_output(["rev-parse", "HEAD"], cwd)
+                        if not head or head == meta["head"]:
+                            break
+                        base = git_output(["merge-base", meta["head"], head], cwd) if meta["head"] else None
+                        meta["pending"] = {"target": head, "base": base, "done": 0}
+                    self._index_range(meta, cwd)
+                count("history.indexed", meta["count"] - before)
+                return meta["count"] - before
+        finally:
+            self._release()
+
+    def _acquire(self) -> bool:
+        lock_path = self.path("update.lock")
+        try:
+            if time.time() - os.path.getmtime(lock_path) > 600:
+                # left behind by a killed process
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except OSError:
+            return False
+
+    def _release(self) -> None:
+        try:
+            os.remove(self.path("update.lock"))
+        except OSError:
+            pass
+
+    def search(self, diff: str, k: int = 3, min_score: float = 0.1) -> List[Tuple[float, str, str]]:
+        """
+        The past commits most similar to a diff
+
+        Args:
+            diff: The diff to find examples for, e.g. the staged changes
+            k: The number of commits to return
+            min_score: The lowest cosine similarity of a returned commit
+
+        Returns:
+            List[Tuple[float, str, str]]: The similarity, sha and message of every commit, best
+                first, without repeated messages
+        """
+        import numpy as np
+
+        meta = self.load_meta()
+        rows = meta["count"]
+        if not rows or k <= 0:
+            return []
+        with span("history.search", rows=rows):
+            paths, changed = diff_features(diff.splitlines(), self.max_lines)
+            query = hash_features([feature_weights(paths, changed)], self.dims)[0]
+            vectors = np.memmap(self.path("vectors.i8"), dtype=np.int8, mode="r", shape=(rows, self.dims))
+            scales = np.memmap(self.path("scales.f32"), dtype=np.float32, mode="r", shape=(rows,))
+            scores = np.empty(rows, dtype=np.float32)
+            step = 16384
+            for start in range(0, rows, step):
+                end = start + step
+                scores[start:end] = (vectors[start:end].astype(np.float32) @ query) * scales[start:end]
+            candidates = min(rows, k * 4)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+
+            offsets = np.memmap(self.path("offsets.u64"), dtype=np.uint64, mode="r", shape=(rows, 2))
+            results: List[Tuple[float, str, str]] = []
+            seen = set()
+            with open(self.path("shas.bin"), "rb") as shas, open(self.path("messages.bin"), "rb") as messages:
+                for row in top:
+                    if scores[row] < min_score or len(results) >= k:
+                        break
+                    start, end = (int(value) for value in offsets[row])
+                    messages.seek(start)
+                    message = messages.read(end - start).decode("utf-8", errors="replace").strip()
+                    subject = message.split("\n", 1)[0]
+                    if not message or subject.startswith(SKIPPED_MESSAGES) or subject in seen:
+                        continue
+                    seen.add(subject)
+                    shas.seek(int(row) * 20)
+                    results.append((float(scores[row]), shas.read(20).hex(), message))
+        return results
+
+
+_indexes: Dict[str, HistoryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_history_index(cwd: Optional[str] = None) -> Optional[HistoryIndex]:
+    """
+    The index of the repository in cwd (the current directory by default), shared by its
+    worktrees, or None outside a repository or without numpy
+    """
+    if config.history_examples <= 0 or not numpy_available():
+        return None
+    git_dir = git_output(["rev-parse", "--git-common-dir"], cwd)
+    if not git_dir:
+        return None
+    directory = os.path.join(os.path.abspath(os.path.join(cwd or "", git_dir)), "ai-commit", "history")
+    with _indexes_lock:
+        if directory not in _indexes:
+            _indexes[directory] = HistoryIndex(directory, config.history_dims, config.history_max_lines)
+        return _indexes[directory]
+
+
+def start_history_update(cwd: Optional[str] = None) -> Optional[threading.Thread]:
+    """Bring the index of the repository in cwd up to date on a background thread"""
+    index = get_history_index(cwd)
+    if index is None:
+        return None
+
+    def run() -> None:
+        try:
+            index.update(cwd)
+        except Exception:
+            # e.g. git failed, the examples come from what is already indexed
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def index_history_command() -> int:
+    """
+    Run `ai-commit --index-history`: bring the index of the current repository up to date in the
+    foreground and print its size
+
+    Returns:
+        int: The exit code
+    """
+    if not numpy_available():
+        print("❌ The history index needs numpy: pip install 'agent-balu[history]'")
+        return 1
+    if config.history_examples <= 0:
+        print("❌ Examples from the history are disabled (AI_COMMIT_HISTORY_EXAMPLES=0).")
+        return 1
+    index = get_history_index()
+    if index is None:
+        print("❌ Not a git repository.")
+        return 1
+    start = time.perf_counter()
+    added = index.update()
+    if added < 0:
+        print("❌ The index is being updated by another process.")
+        return 1
+    print(f"✨ Indexed {added} new commits in {time.perf_counter() - start:.2f}s")
+    print(f"📚 History index: {index.directory}")
+    print(f"  {'commits':<10} {index.count}")
+    print(f"  {'size':<10} {index.size_bytes() / (1024 * 1024):.1f} MB")
+    return 0
+
+
+def examples_token_reserve() -> int:
+    """The prompt tokens the few-shot examples may take at most"""
+    if config.history_examples <= 0 or not numpy_available():
+        return 0
+    return config.history_examples * HistoryIndex.max_message_chars // CHARS_PER_TOKEN + 50
+
+
+def with_examples(prompt: str, diff: str, cwd: Optional[str] = None) -> str:
+    """
+    Add the messages of the past commits most similar to the diff to a prompt, as examples of
+    the repository's conventions. The examples go before the code changes section of the prompt.
+
+    Args:
+        prompt: The commit prompt
+        diff: The staged diff
+        cwd: The repository, the current directory by default
+    """
+    index = get_history_index(cwd)
+    if index is None:
+        return prompt
+    try:
+        found = index.search(diff, config.history_examples)
+    except (OSError, ValueError):
+        # a damaged index gives no examples, the next update rewrites what it counts
+        return prompt
+    if not found:
+        return prompt
+    examples = "\n\n".join(f"Example {number}:\n{message}" for number, (_, _, message) in enumerate(found, start=1))
+    section = (f"{EXAMPLES_TITLE}\nMessages of past commits with similar changes. Follow their style and "
+               f"conventions (prefixes, tense, length), not their content:\n\n{examples}\n\n")
+    position = prompt.find(CODE_CHANGES_TITLE)
+    if position < 0:
+        return f"{prompt}\n\n{section}"
+    return prompt[:position] + section + prompt[position:]
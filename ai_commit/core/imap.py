@@ -0,0 +1,279 @@
+"""
+Batched IMAP fetching for the email agent
+
+Instead of downloading every message with its attachments (one `FETCH n (RFC822)` round trip per
+email), the headers the agent looks at and the body structure are fetched for a whole range of
+UIDs at once with BODY.PEEK, which also leaves the messages unread. The text part is then
+fetched, again in batches and capped in size, only for the messages that still need it.
+"""
+import base64
+import binascii
+import quopri
+import re
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesHeaderParser
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from ai_commit.core.tracing import count, span
+
+# the headers the email agent classifies and unsubscribes with
+HEADER_FIELDS = ("SUBJECT", "FROM", "DATE", "LIST-UNSUBSCRIBE", "LIST-UNSUBSCRIBE-POST")
+
+_OPEN, _CLOSE = object(), object()
+_TOKEN = re.compile(rb'(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?)')
+_QUOTED_ESCAPE = re.compile(rb"\\(.)")
+_LITERAL_MARKER = re.compile(rb"\{\d+\}\s*$")
+_MESSAGE_START = re.compile(rb"^\d+ \(")
+# the origin of a partial fetch, BODY[1]<0> is answered for BODY.PEEK[1]<0.65536>
+_ORIGIN = re.compile(r"<\d+>$")
+
+
+def _batches(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), max(size, 1)):
+        yield items[start:start + size]
+
+
+def uid_set(uids: Iterable[int]) -> str:
+    """
+    Compress uids into an IMAP sequence set, e.g. [1, 2, 3, 4, 7, 9, 10] into "1:4,7,9:10"
+    """
+    ranges: List[str] = []
+    ordered = sorted(set(int(uid) for uid in uids))
+    start = end = None
+    for uid in ordered + [None]:
+        if start is not None and uid == end + 1:
+            end = uid
+            continue
+        if start is not None:
+            ranges.append(str(start) if start == end else f"{start}:{end}")
+        start = end = uid
+    return ",".join(ranges)
+
+
+def _text_tokens(text: bytes) -> Iterator[Any]:
+    for match in _TOKEN.finditer(text):
+        opening, closing, quoted, atom = match.groups()
+        if opening:
+            yield _OPEN
+        elif closing:
+            yield _CLOSE
+        elif quoted is not None:
+            yield _QUOTED_ESCAPE.sub(rb"\1", quoted).decode("utf-8", "replace")
+        elif atom:
+            yield None if atom.upper() == b"NIL" else atom.decode("utf-8", "replace")
+
+
+def _tokens(chunks: Iterable[Any]) -> Iterator[Any]:
+    for chunk in chunks:
+        if isinstance(chunk, tuple):
+            # imaplib splits a response at every literal: (text ending in {size}, literal bytes)
+            text, literal = chunk
+            yield from _text_tokens(_LITERAL_MARKER.sub(b"", text))
+            yield literal
+        else:
+            yield from _text_tokens(chunk)
+
+
+def _parse(tokens: Iterator[Any]) -> List[Any]:
+    stack: List[List[Any]] = [[]]
+    for token in tokens:
+        if token is _OPEN:
+            stack.append([])
+        elif token is _CLOSE:
+            if len(stack) > 1:
+                item = stack.pop()
+                stack[-1].append(item)
+        else:
+            stack[-1].append(token)
+    # a truncated response still gives what was read
+    while len(stack) > 1:
+        item = stack.pop()
+        stack[-1].append(item)
+    return stack[0]
+
+
+def parse_fetch_response(data: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Parse the data imaplib returns for a FETCH or UID FETCH command
+
+    Args:
+        data: The response data, bytes and (text, literal) tuples
+
+    Returns:
+        List[Dict[str, Any]]: The items of every message by upper case name, e.g. "UID",
+        "BODYSTRUCTURE" or "BODY[1]". Literals are bytes, atoms and strings are str, NIL is None.
+    """
+    messages: List[List[Any]] = []
+    for chunk in data:
+        if chunk is None:
+            continue
+        head = chunk[0] if isinstance(chunk, tuple) else chunk
+        if _MESSAGE_START.match(head):
+            messages.append([])
+        if messages:
+            messages[-1].append(chunk)
+
+    results = []
+    for chunks in messages:
+        parsed = _parse(_tokens(chunks))
+        # sequence number, then the list of item names and values
+        if len(parsed) < 2 or not isinstance(parsed[1], list):
+            continue
+        items = parsed[1]
+        results.append({
+            _ORIGIN.sub("", name.upper()): value
+            for name, value in zip(items[::2], items[1::2])
+            if isinstance(name, str)
+        })
+    return results
+
+
+def _upper(value: Any) -> str:
+    return value.upper() if isinstance(value, str) else ""
+
+
+def _describe_part(node: List[Any], section: str) -> Dict[str, Any]:
+    # type, subtype, parameters, id, description, encoding, size...
+    params = node[2] if len(node) > 2 and isinstance(node[2], list) else []
+    params = {_upper(name).lower(): value for name, value in zip(params[::2], params[1::2])}
+    size = node[6] if len(node) > 6 else None
+    return {
+        "section": section,
+        "type": f"{_upper(node[0])}/{_upper(node[1]) if len(node) > 1 else ''}".lower(),
+        "encoding": _upper(node[5]) if len(node) > 5 else "",
+        "charset": params.get("charset"),
+        "size": int(size) if isinstance(size, str) and size.isdigit() else None,
+    }
+
+
+def _find_plain_part(node: List[Any], section: str) -> Optional[Dict[str, Any]]:
+    if node and isinstance(node[0], list):
+        # multipart: the parts come first, then the subtype and extension data
+        for index, child in enumerate(node, 1):
+            if not isinstance(child, list):
+                break
+            found = _find_plain_part(child, f"{section}.{index}" if section else str(index))
+            if found:
+                return found
+        return None
+    if len(node) < 7 or _upper(node[0]) != "TEXT" or _upper(node[1]) != "PLAIN":
+        return None
+    # the disposition of a text part comes after its line count and md5
+    disposition = node[9] if len(node) > 9 else None
+    if isinstance(disposition, list) and disposition and _upper(disposition[0]) == "ATTACHMENT":
+        return None
+    return _describe_part(node, section)
+
+
+def find_text_part(structure: Any) -> Optional[Dict[str, Any]]:
+    """
+    Find the part of a message that get_email_body would read in a BODYSTRUCTURE: the first
+    inline text/plain part of a multipart message, or the body of a single part message
+
+    Returns:
+        Optional[Dict[str, Any]]: The "section" to fetch, its mime "type", transfer "encoding",
+        declared "charset" and "size", or None when there is no such part
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+    if isinstance(structure[0], list):
+        return _find_plain_part(structure, "")
+    # every message has a part 1, for a single part message it is the whole body
+    return _describe_part(structure, "1")
+
+
+def decode_transfer_encoding(data: bytes, encoding: str) -> bytes:
+    """
+    Undo the content transfer encoding of a fetched part, which may be cut short by a partial fetch
+    """
+    encoding = (encoding or "").upper()
+    if encoding == "BASE64":
+        compact = b"".join(data.split())
+        # drop the incomplete quantum at the end of a partial fetch
+        compact = compact[:len(compact) - len(compact) % 4]
+        try:
+            return base64.b64decode(compact)
+        except binascii.Error:
+            return data
+    if encoding == "QUOTED-PRINTABLE":
+        return quopri.decodestring(data)
+    return data
+
+
+def fetch_headers(mail: Any, uids: Sequence[int], batch_size: int = 200,
+                  fields: Sequence[str] = HEADER_FIELDS) -> Iterator[Dict[str, Any]]:
+    """
+    Fetch the given header fields and the body structure of the messages, batch_size uids per
+    round trip
+
+    Args:
+        mail: A logged in imaplib connection with a mailbox selected
+        uids: The uids of the messages
+        batch_size: The number of messages per UID FETCH command
+        fields: The header fields to fetch
+
+    Yields:
+        Dict[str, Any]: The "uid", the parsed "headers" (an EmailMessage without body) and the
+        "text_part" of every message, see find_text_part()
+    """
+    query = f"(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({' '.join(fields)})])"
+    parser = BytesHeaderParser(policy=policy.default)
+    for batch in _batches(list(uids), batch_size):
+        with span("imap.fetch_headers", messages=len(batch)):
+            status, data = mail.uid("FETCH", uid_set(batch), query)
+        count("imap.round_trips")
+        if status != "OK":
+            print(f"⚠️ Failed to fetch the headers of {len(batch)} emails.")
+            continue
+        for item in parse_fetch_response(data):
+            header = next((value for name, value in item.items() if name.startswith("BODY[HEADER")), None)
+            uid = item.get("UID")
+            if not isinstance(header, bytes) or not isinstance(uid, str):
+                # e.g. an unsolicited flags update
+                continue
+            count("imap.bytes_read", len(header))
+            headers: EmailMessage = parser.parsebytes(header)
+            yield {"uid": int(uid), "headers": headers, "text_part": find_text_part(item.get("BODYSTRUCTURE"))}
+
+
+def fetch_text_parts(mail: Any, messages: Iterable[Dict[str, Any]], batch_size: int = 200,
+                     max_bytes: int = 64 * 1024) -> Dict[int, bytes]:
+    """
+    Fetch the first max_bytes of the text part of the messages returned by fetch_headers()
+
+    Messages are grouped by the section of their text part so every UID FETCH asks for the same
+    section, which is 1 or 1.1 for almost all mail.
+
+    Returns:
+        Dict[int, bytes]: The text part by uid, transfer encoding removed but not decoded to str
+    """
+    by_section: Dict[str, List[Dict[str, Any]]] = {}
+    for message in messages:
+        if message.get("text_part"):
+            by_section.setdefault(message["text_part"]["section"], []).append(message)
+
+    bodies: Dict[int, bytes] = {}
+    for section, group in by_section.items():
+        encodings = {message["uid"]: message["text_part"]["encoding"] for message in group}
+        for batch in _batches(group, batch_size):
+            with span("imap.fetch_bodies", messages=len(batch), section=section):
+                status, data = mail.uid(
+                    "FETCH", uid_set(message["uid"] for message in batch), f"(UID BODY.PEEK[{section}]<0.{max_bytes}>)"
+                )
+            count("imap.round_trips")
+            if status != "OK":
+                print(f"⚠️ Failed to fetch the body of {len(batch)} emails.")
+                continue
+            for item in parse_fetch_response(data):
+                payload = item.get(f"BODY[{section}]")
+                uid = item.get("UID")
+                if not isinstance(uid, str) or int(uid) not in encodings:
+                    continue
+                if isinstance(payload, str):
+                    # short parts may come back as a quoted string instead of a literal
+                    payload = payload.encode("utf-8")
+                if isinstance(payload, bytes):
+                    count("imap.bytes_read", len(payload))
+                    bodies[int(uid)] = decode_transfer_encoding(payload, encodings[int(uid)])
+    return bodies
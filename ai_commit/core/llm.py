@@ -1,10 +1,29 @@
 import os
-
-from urllib3 import response 
-import ollama
-import requests
 import json
-from typing import Dict, Any, Optional, Literal, override
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Generator, Iterator, List, Optional, Literal, Tuple
+
+from ai_commit.core.cache import ResponseCache, get_response_cache
+from ai_commit.core.config import config
+from ai_commit.core.diff import CHARS_PER_TOKEN, estimate_tokens
+from ai_commit.core.streaming import TrackedStream, iter_openai_deltas, iter_sse_data
+from ai_commit.core.tracing import count, span, tracer
+from ai_commit.core.utils import load_prompt
+
+# ollama, requests and the http transport are imported inside the providers that use them,
+# so importing this module (and starting the cli) stays cheap
+
+# placeholder messages the providers return when generation fails, these are never cached
+GENERATION_FAILED = "Failed to generate commit message"
+GENERATION_ERROR = "Failed to generate commit message due to an error"
+
+
+def is_failed_response(response: str) -> bool:
+    """Check if a provider response is empty or one of the failure placeholders"""
+    return not response or not response.strip() or response in (GENERATION_FAILED, GENERATION_ERROR)
 
 
 class LLMProvider:
@@ -16,58 +35,293 @@ class LLMProvider:
         #generate  a response from llms
         raise NotImplementedError("Subclasses must implement this method")
 
+    def stream_response(self, prompt: str, context: str, **kwargs) -> Generator[str, None, bool]:
+        """
+        Generate a response token by token. Providers without streaming support yield the
+        whole response at once.
+
+        Returns:
+            bool: Whether the answer is complete. Providers report errors and stop early instead
+                of raising, a stream that returns False must not be cached.
+        """
+        response = self.generate_response(prompt, context, **kwargs)
+        if response:
+            yield response
+        return not is_failed_response(response)
+
+    def cache_identity(self, **kwargs) -> Dict[str, str]:
+        """Describe the provider and model so identical requests share a cache entry"""
+        return {"provider": type(self).__name__}
+
+    def warm_up(self) -> None:
+        """Get ready for the first request (load the model, open the connection), a no-op by default"""
+
+class OllamaSession:
+    """
+    A conversation with a local model about one prompt and context, e.g. the commit prompt and a diff
+
+    The first answer is generated from the whole prompt, laid out with the instructions first and
+    the diff after them so the same request is always the same prefix. ollama returns the tokens of
+    that prompt and answer as `context`: regenerations and follow-ups send only their short
+    instruction along with those tokens, so the prompt and the diff are neither sent nor tokenized
+    again, and ollama only evaluates the new instruction while its KV cache still holds the prefix.
+    When the first answer did not come from this session (the response cache or the daemon), the
+    session is primed with a generate that only evaluates the prompt before the first regeneration.
+
+    Args:
+        provider: The provider of the model
+        prompt: The system prompt
+        context: The context of the prompt, e.g. the diff
+    """
+
+    def __init__(self, provider: "LocalLLMProvider", prompt: str, context: str):
+        self.provider = provider
+        self.prompt = provider.format_prompt(prompt, context)
+        # the tokens of the prompt and the first answer, every regeneration starts from them
+        self.base_context: Optional[List[int]] = None
+        # the tokens of the latest turn, follow-ups continue the conversation from there
+        self.last_context: Optional[List[int]] = None
+        # kind ("prompt", "prime", "regenerate" or "follow_up"), whether it started from the context,
+        # prompt tokens evaluated and seconds it took
+        self.turns: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, response: Dict[str, Any], context_reused: bool = False) -> None:
+        """Keep the context and the prompt evaluation stats of a finished turn"""
+        self.provider.record_stats(response)
+        with self._lock:
+            self.turns.append({
+                "kind": kind,
+                "context_reused": context_reused,
+                "prompt_eval_count": response.get("prompt_eval_count") or 0,
+                "prompt_eval_seconds": (response.get("prompt_eval_duration") or 0) / 1e9,
+            })
+            tokens = response.get("context")
+            if tokens:
+                if not context_reused and self.base_context is None:
+                    self.base_context = list(tokens)
+                self.last_context = list(tokens)
+
+    def _stream(self, kind: str, prompt: str, tokens: Optional[List[int]], **kwargs) -> Generator[str, None, bool]:
+        """Stream a turn, returning whether ollama sent its final chunk"""
+        import ollama
+
+        stream = ollama.generate(
+            model=self.provider.model_name,
+            prompt=prompt,
+            context=tokens,
+            options=self.provider.generation_options(**kwargs),
+            keep_alive=config.ollama_keep_alive,
+            stream=True
+        )
+        for chunk in stream:
+            token = chunk.get("response", "")
+            if token:
+                yield token
+            if chunk.get("done"):
+                self.record(kind, chunk, context_reused=tokens is not None)
+                return True
+        return False
+
+    def prime(self, **kwargs) -> bool:
+        """
+        Evaluate the prompt without answering it, so regenerations have a context to start from
+
+        Returns:
+            Whether the session has a context now
+        """
+        import ollama
+
+        with span("ollama.prime"):
+            stream = ollama.generate(
+                model=self.provider.model_name,
+                prompt=self.prompt,
+                options={**self.provider.generation_options(**kwargs), "num_predict": 0},
+                keep_alive=config.ollama_keep_alive,
+                stream=True
+            )
+            try:
+                for chunk in stream:
+                    if chunk.get("response"):
+                        # the server ignores num_predict, don't wait for a whole answer
+                        break
+                    if chunk.get("done"):
+                        self.record("prime", chunk)
+                        break
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+        return self.base_context is not None
+
+    def stream(self, **kwargs) -> Generator[str, None, bool]:
+        """Answer the whole prompt"""
+        return (yield from self._stream("prompt", self.prompt, None, **kwargs))
+
+    def regenerate(self, **kwargs) -> Generator[str, None, bool]:
+        """A new answer to the prompt, from the evaluated prompt and first answer when there are any"""
+        if self.base_context is None and not self.prime(**kwargs):
+            count("ollama.context_missed")
+            return (yield from self._stream("regenerate", self.prompt, None, **kwargs))
+        count("ollama.context_reused")
+        return (yield from self._stream("regenerate", load_prompt("regenerate"), self.base_context, **kwargs))
+
+    def follow_up(self, instruction: str, **kwargs) -> Generator[str, None, bool]:
+        """Continue the conversation with an instruction, e.g. to make the answer shorter"""
+        if self.last_context is None and self.base_context is None and not self.prime(**kwargs):
+            count("ollama.context_missed")
+            return (yield from self._stream("follow_up", self.prompt, None, **kwargs))
+        tokens = self.last_context or self.base_context
+        count("ollama.context_reused")
+        return (yield from self._stream("follow_up", instruction, tokens, **kwargs))
+
+    def report(self) -> str:
+        """Compare the prompt evaluation of the first answer and the latest regeneration or follow-up"""
+        with self._lock:
+            first = next((turn for turn in self.turns if not turn["context_reused"]), None)
+            latest = self.turns[-1] if self.turns else None
+        if latest is None or latest["kind"] == "prompt":
+            return ""
+
+        def describe(turn: Dict[str, Any]) -> str:
+            return f"{turn['prompt_eval_count']:,} prompt tokens in {turn['prompt_eval_seconds']:.2f}s"
+
+        if not latest["context_reused"]:
+            return f"🧠 no context was reused: this message evaluated the whole prompt again ({describe(latest)})"
+        line = f"🧠 this message evaluated {describe(latest)}"
+        if first and first["kind"] == "prime":
+            return line + f", priming the session with the prompt of the first message {describe(first)}"
+        return line + (f", the first one {describe(first)}" if first else "")
+
+
 class LocalLLMProvider(LLMProvider):
     """
     provider for local llm models using ollama
 
     """
 
+    # the sessions of the process by model and prompt, shared by all the provider instances
+    _sessions: "OrderedDict[str, OllamaSession]" = OrderedDict()
+    _sessions_lock = threading.Lock()
+    max_sessions = 8
+
     def __init__(self, model_name:str):
         self.model_name = model_name
 
+    def cache_identity(self, **kwargs) -> Dict[str, str]:
+        return {"provider": "ollama", "model": self.model_name}
+
+    def record_stats(self, response: Dict[str, Any]) -> None:
+        """Count the token numbers and server side durations ollama reports with the final chunk"""
+        if not tracer.enabled:
+            return
+        count("ollama.prompt_eval_count", response.get("prompt_eval_count") or 0)
+        count("ollama.eval_count", response.get("eval_count") or 0)
+        for name in ("load_duration", "prompt_eval_duration", "eval_duration"):
+            count(f"ollama.{name}_ms", (response.get(name) or 0) / 1e6)
+
+    def format_prompt(self, prompt: str, context: str) -> str:
+        # the instructions come first and never change, so every request about the same
+        # changes starts with the same tokens
+        return f"{prompt}\n\nHere are the changes:\n\n{context}"
+
+    def session(self, prompt: str, context: str) -> OllamaSession:
+        """Return the session of this model about the prompt and context, started on first use"""
+        formatted = self.format_prompt(prompt, context)
+        key = hashlib.sha256(f"{self.model_name}\0{formatted}".encode("utf-8")).hexdigest()
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = OllamaSession(self, prompt, context)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def generation_options(self, **kwargs) -> Dict[str, Any]:
+        return {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            **kwargs.get("options", {})
+        }
+
+    def load_model(self) -> None:
+        """Load the model into memory (or keep it there) without generating anything"""
+        import ollama
+
+        ollama.generate(model=self.model_name, prompt="", keep_alive=config.ollama_keep_alive)
+
+    def warm_up(self) -> None:
+        self.load_model()
 
     def generate_response(self, prompt: str, context: str, **kwargs) -> str:
         try:
             print(f"Using local model: {self.model_name}")
             print("Generating response from Ollama...")
             
-            # Format the prompt properly for the model
-            formatted_prompt = f"{prompt}\n\nHere are the changes:\n\n{context}"
-            
+            import ollama
+
             # Set streaming to False to get the full response at once
             response = ollama.generate(
                 model=self.model_name,
-                prompt=formatted_prompt,
-                options={
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "stream": False,
-                    **kwargs.get("options", {})
-                }
+                prompt=self.format_prompt(prompt, context),
+                options=self.generation_options(**kwargs),
+                keep_alive=config.ollama_keep_alive,
+                stream=False
             )
             
             # Debug the response
             if not response or "response" not in response:
                 print("❌ Error: Empty response from Ollama")
                 print(f"Response data: {response}")
-                return "Failed to generate commit message"
+                return GENERATION_FAILED
                 
             result = response.get("response", "")
+            self.session(prompt, context).record("prompt", response)
             print(f"Response generated successfully ({len(result)} characters)")
             return result
         except Exception as e:
             print(f"❌ Error generating response from local model: {e}")
             import traceback
             traceback.print_exc()
-            return "Failed to generate commit message due to an error"
+            return GENERATION_ERROR
+
+    def stream_response(self, prompt: str, context: str, **kwargs) -> Generator[str, None, bool]:
+        """Stream the response chunks from Ollama as they are generated"""
+        try:
+            return (yield from self.session(prompt, context).stream(**kwargs))
+        except Exception as e:
+            print(f"\n❌ Error streaming response from local model: {e}")
+            return False
+
+    def regenerate_response(self, prompt: str, context: str, **kwargs) -> Generator[str, None, bool]:
+        """
+        Stream a new answer to a prompt this process answered before, reusing the evaluated
+        prompt of the earlier answer (see OllamaSession)
+        """
+        try:
+            return (yield from self.session(prompt, context).regenerate(**kwargs))
+        except Exception as e:
+            print(f"\n❌ Error streaming response from local model: {e}")
+            return False
 
 class RemoteLLMProvider(LLMProvider):
     """Provider for remote API-based LLM models"""
-    def __init__(self):
-        self.api_url = os.environ.get("AI_API_URL", "")
-        self.api_key = os.environ.get("AI_API_KEY", "")
+    def __init__(self, model: str = "", chat_format: Optional[bool] = None, api_url: Optional[str] = None,
+                 api_key: Optional[str] = None):
+        """
+        Args:
+            model: The model to request, defaults to gpt-3.5-turbo
+            chat_format: Force the OpenAI-compatible chat format (True) or the generic
+                prompt/context format (False), by default only openai.com urls use the chat format
+            api_url: The api url, AI_API_URL by default
+            api_key: The api key, AI_API_KEY by default
+        """
+        self.api_url = api_url or os.environ.get("AI_API_URL", "")
+        self.api_key = api_key or os.environ.get("AI_API_KEY", "")
         # Default model to use with OpenAI
-        self.default_model = "gpt-3.5-turbo"
+        self.default_model = model or config.remote_model
+        self.chat_format = chat_format
 
     def validate_credentials(self) -> bool:
         """Check if API credentials are valid"""
@@ -82,53 +336,79 @@ class RemoteLLMProvider(LLMProvider):
             return False
             
         return True
+
+    def cache_identity(self, **kwargs) -> Dict[str, str]:
+        return {"provider": self.api_url, "model": kwargs.get("model", self.default_model)}
+
+    def warm_up(self) -> None:
+        """Import the http stack and open the connection to the api while the caller is busy"""
+        if not self.api_url or not self.api_key:
+            return
+        from ai_commit.core.transport import get_transport
+
+        url = self.api_url if self.api_url.startswith(("http://", "https://")) else f"https://{self.api_url}"
+        get_transport().warm_up(url)
         
+    def prepare_request(self, prompt: str, context: str, stream: bool = False,
+                        **kwargs) -> Tuple[Dict[str, str], Dict[str, Any], bool]:
+        """
+        Build the headers and the payload of a request
+
+        Returns:
+            Tuple: The headers, the json payload and whether the chat format is used
+        """
+        if not self.api_url.startswith(("http://", "https://")):
+            self.api_url = f"https://{self.api_url}"
+            
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        # Check if this is OpenAI API
+        is_openai = self.chat_format if self.chat_format is not None else "openai.com" in self.api_url
+        
+        if is_openai:
+            # Format for OpenAI API
+            data = {
+                "model": kwargs.get("model", self.default_model),
+                "messages": [
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": context}
+                ],
+                "temperature": kwargs.get("temperature", 0.7),
+                "max_tokens": kwargs.get("max_tokens", 500)
+            }
+            if stream:
+                data["stream"] = True
+            else:
+                print(f"Using OpenAI model: {data['model']}")
+        else:
+            # Generic API format
+            data = {
+                "prompt": prompt,
+                "context": context,
+                **kwargs
+            }
+        return headers, data, is_openai
+
     def generate_response(self, prompt: str, context: str, **kwargs) -> str:
         """Generate a response using a remote LLM API"""
+        import requests
+        from ai_commit.core.transport import get_transport
 
         if not self.validate_credentials():
             return ""
 
         try:
-            if not self.api_url.startswith(("http://", "https://")):
-                self.api_url = f"https://{self.api_url}"
-                
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
+            headers, data, is_openai = self.prepare_request(prompt, context, **kwargs)
             
-            # Check if this is OpenAI API
-            is_openai = "openai.com" in self.api_url
-            
-            if is_openai:
-                # Format for OpenAI API
-                data = {
-                    "model": kwargs.get("model", self.default_model),
-                    "messages": [
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": context}
-                    ],
-                    "temperature": kwargs.get("temperature", 0.7),
-                    "max_tokens": kwargs.get("max_tokens", 500)
-                }
-                print(f"Using OpenAI model: {data['model']}")
-            else:
-                # Generic API format
-                data = {
-                    "prompt": prompt,
-                    "context": context,
-                    **kwargs
-                }
-            
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                data=json.dumps(data)
-            )
+            response = get_transport().post_json(self.api_url, data, headers=headers)
             
             if response.status_code == 200:
-                response_json = response.json()
+                count("http.bytes_received", len(response.content))
+                with span("llm.parse"):
+                    response_json = response.json()
                 if is_openai:
                     # Extract content from OpenAI response format
                     try:
@@ -152,12 +432,256 @@ class RemoteLLMProvider(LLMProvider):
             import traceback
             traceback.print_exc()
             return ""
+
+    def stream_response(self, prompt: str, context: str, **kwargs) -> Generator[str, None, bool]:
+        """Stream the content deltas of an OpenAI-compatible server-sent events response"""
+        import requests
+        from ai_commit.core.transport import get_transport
+
+        if not self.validate_credentials():
+            return False
+
+        headers, data, is_openai = self.prepare_request(prompt, context, stream=True, **kwargs)
+        if not is_openai:
+            # the generic api has no streaming format, yield the full response instead
+            return (yield from super().stream_response(prompt, context, **kwargs))
+
+        try:
+            response = get_transport().post_json(self.api_url, data, headers=headers, stream=True)
+            if response.status_code != 200:
+                print(f"\n❌ Error: API returned status code {response.status_code}")
+                if response.text:
+                    print(f"Response: {response.text}")
+                return False
+
+            def body() -> Iterator[bytes]:
+                # chunk_size=None hands over the data as soon as it arrives
+                for chunk in response.iter_content(chunk_size=None):
+                    count("http.bytes_received", len(chunk))
+                    yield chunk
+
+            with response:
+                completed = yield from iter_openai_deltas(iter_sse_data(body()))
+            if not completed:
+                print("\n❌ Error: the API closed the stream before the end of the answer")
+            return completed
+        except requests.exceptions.RequestException as e:
+            print(f"\n❌ Error connecting to API: {e}")
+            return False
             
+# provider registry, the sdk each provider talks to is only imported when it generates
+PROVIDERS = {
+    "local": LocalLLMProvider,
+    "remote": RemoteLLMProvider,
+}
+
 def get_llm_provider(use_local: bool = False, model_name: str= "") -> LLMProvider:
+    if config.router_enabled:
+        # routes between the selected provider and the others, see core.router
+        from ai_commit.core.router import build_router
+
+        return build_router(use_local, model_name)
     if use_local and model_name:
-        return LocalLLMProvider(model_name)
-    return RemoteLLMProvider()
+        return PROVIDERS["local"](model_name)
+    return PROVIDERS["remote"]()
+
+def daemon_client():
+    """Return a client of the running daemon, or None when requests are generated in-process"""
+    # a profiled run generates in-process, the daemon's phases would be invisible otherwise.
+    # So does a run without the cache (--no-cache, AI_COMMIT_CACHE=0): the daemon reads and
+    # fills its cache whatever the settings of the client are
+    if not config.daemon_enabled or config.in_daemon or tracer.enabled or not config.cache_enabled:
+        return None
+    from ai_commit.core.daemon import DaemonClient
+
+    client = DaemonClient()
+    return client if client.available() else None
+
+def warm_up(use_local: bool = False, model_name: str = "") -> None:
+    """Load the model or open the connection ahead of the first request, in the daemon if one runs"""
+    client = daemon_client()
+    if client and client.call("warm_up", use_local=use_local, model_name=model_name):
+        return
+    get_llm_provider(use_local, model_name).warm_up()
+
+class WarmUp:
+    """
+    Runs warm_up() on a background thread while the caller reads the diff and the prompts, and
+    measures how much of it was hidden behind that work
+    """
+
+    def __init__(self, use_local: bool = False, model_name: str = ""):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.needed: Optional[float] = None
+        self.failed = False
+        threading.Thread(target=self._run, args=(use_local, model_name), daemon=True).start()
+
+    def _run(self, use_local: bool, model_name: str) -> None:
+        try:
+            warm_up(use_local, model_name)
+        except Exception:
+            # the real request reports the problem, e.g. ollama not running
+            self.failed = True
+        finally:
+            self.finished = time.perf_counter()
+
+    def mark_needed(self) -> None:
+        """Record when the caller is ready to send the first request"""
+        if self.needed is None:
+            self.needed = time.perf_counter()
+
+    def report(self) -> str:
+        """Describe the warm-up, empty while it is still running or when it failed"""
+        if self.finished is None or self.failed:
+            return ""
+        duration = self.finished - self.started
+        hidden = min(duration, (self.needed or self.finished) - self.started)
+        return f"🔥 warm-up took {duration:.2f}s, {hidden:.2f}s of it overlapped with git and prompt I/O"
+
+def start_warm_up(use_local: bool = False, model_name: str = "") -> Optional[WarmUp]:
+    """Start warming up the provider in the background, unless it is disabled in the config"""
+    if not config.warm_up:
+        return None
+    return WarmUp(use_local and bool(model_name), model_name)
+
+def traced_generate(provider: LLMProvider, prompt: str, context: str, **kwargs) -> str:
+    """provider.generate_response, timed and counted when profiling"""
+    with span("llm.generate", provider=type(provider).__name__):
+        response = provider.generate_response(prompt, context, **kwargs)
+    if tracer.enabled:
+        count("llm.tokens_in", estimate_tokens(prompt) + estimate_tokens(context))
+        count("llm.tokens_out", estimate_tokens(response or ""))
+    return response
+
+def traced_stream(provider: LLMProvider, prompt: str, context: str, **kwargs) -> Generator[str, None, bool]:
+    """
+    provider.stream_response, split into the wait for the first token and the generation
+
+    Returns:
+        bool: Whether the provider completed the answer
+    """
+    if not tracer.enabled:
+        return (yield from provider.stream_response(prompt, context, **kwargs))
+
+    count("llm.tokens_in", estimate_tokens(prompt) + estimate_tokens(context))
+    start = first_token = time.perf_counter()
+    chunks = characters = 0
+    stream = TrackedStream(provider.stream_response(prompt, context, **kwargs))
+    try:
+        for token in stream:
+            if not chunks:
+                first_token = time.perf_counter()
+                tracer.add_span("llm.first_token", start, first_token, provider=type(provider).__name__)
+            chunks += 1
+            characters += len(token)
+            yield token
+    finally:
+        tracer.add_span("llm.tokens", first_token, time.perf_counter(), provider=type(provider).__name__,
+                        chunks=chunks)
+        count("llm.tokens_out", characters / CHARS_PER_TOKEN)
+    return stream.completed
+
+def generate_response(prompt: str, context:str, use_local: bool = False, model_name:str = "",
+                      use_cache: bool = True, **kwargs) -> str:
+    """
+    Generate a response with the selected provider, going through the response cache
+
+    Args:
+        prompt: The system prompt
+        context: The input for the prompt, e.g. the staged diff
+        use_local: Whether to use a local model
+        model_name: The name of the local model to use
+        use_cache: Set to False to skip the cached response and generate a new one
+    """
+    client = daemon_client()
+    if client:
+        response = client.generate(prompt, context, use_local, model_name, use_cache, **kwargs)
+        if response is not None:
+            return response
+
+    provider = get_llm_provider(use_local, model_name)
+    if not config.cache_enabled:
+        return traced_generate(provider, prompt, context, **kwargs)
+
+    key = ResponseCache.make_key(
+        prompt=prompt,
+        context=context,
+        options=kwargs,
+        **provider.cache_identity(**kwargs)
+    )
+    return get_response_cache().get_or_generate(
+        key,
+        lambda: traced_generate(provider, prompt, context, **kwargs),
+        bypass=not use_cache,
+        should_store=lambda response: not is_failed_response(response)
+    )
+
+def stream_response(prompt: str, context: str, use_local: bool = False, model_name: str = "",
+                    use_cache: bool = True, **kwargs) -> Generator[str, None, bool]:
+    """
+    Stream a response with the selected provider. A cached response is yielded in one piece,
+    otherwise the tokens are yielded as they arrive and the response is cached once the provider
+    completed it.
+
+    Args:
+        prompt: The system prompt
+        context: The input for the prompt, e.g. the staged diff
+        use_local: Whether to use a local model
+        model_name: The name of the local model to use
+        use_cache: Set to False to skip the cached response and generate a new one
+
+    Returns:
+        bool: Whether the answer is complete
+    """
+    client = daemon_client()
+    stream = client.stream(prompt, context, use_local, model_name, use_cache, **kwargs) if client else None
+    if stream is not None:
+        tracked = TrackedStream(stream)
+        started = False
+        try:
+            for token in tracked:
+                started = True
+                yield token
+            if tracked.completed:
+                return True
+            if started:
+                print("\n❌ Error: the daemon closed the stream before the end of the answer")
+                return False
+        except (OSError, ValueError, RuntimeError) as e:
+            if started:
+                # the tokens are already shown, generating again in-process would repeat them
+                print(f"\n❌ Error streaming response from the daemon: {e}")
+                return False
+        # nothing came from the daemon, generate in-process instead
 
-def generate_response(prompt: str, context:str, use_local: bool = False, model_name:str = "", **kwargs) -> str:
     provider = get_llm_provider(use_local, model_name)
-    return provider.generate_response(prompt, context, **kwargs)
\ No newline at end of file
+    if not config.cache_enabled:
+        return (yield from traced_stream(provider, prompt, context, **kwargs))
+
+    cache = get_response_cache()
+    key = ResponseCache.make_key(
+        prompt=prompt,
+        context=context,
+        options=kwargs,
+        **provider.cache_identity(**kwargs)
+    )
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            cache.record("hits")
+            yield cached
+            return True
+
+    cache.record("misses")
+    tokens = []
+    stream = TrackedStream(traced_stream(provider, prompt, context, **kwargs))
+    for token in stream:
+        tokens.append(token)
+        yield token
+
+    response = "".join(tokens)
+    # a stream cut short is not the answer to this request, the next one asks again
+    if stream.completed and not is_failed_response(response):
+        cache.set(key, response)
+    return stream.completed
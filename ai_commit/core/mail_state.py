@@ -0,0 +1,167 @@
+"""
+Local sync state of the email agent
+
+A small SQLite database remembers, per account and mailbox, the UIDVALIDITY and the highest UID
+already processed, so every run only fetches the messages that arrived since the last one. It
+also keeps the classification of every processed message and what was decided for every sender
+(unsubscribed, kept...), so a sender is only ever asked about once.
+"""
+import json
+import os
+import sqlite3
+import time
+from email.utils import parseaddr
+from typing import Any, Dict, Iterable, Optional, Set
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mailboxes (
+    account TEXT NOT NULL,
+    mailbox TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    last_uid INTEGER NOT NULL,
+    synced REAL NOT NULL,
+    PRIMARY KEY (account, mailbox)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    account TEXT NOT NULL,
+    mailbox TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    subject TEXT,
+    should_unsubscribe INTEGER NOT NULL,
+    links TEXT NOT NULL,
+    classified REAL NOT NULL,
+    PRIMARY KEY (account, mailbox, uid)
+);
+CREATE TABLE IF NOT EXISTS senders (
+    sender TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    links TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# sender statuses that mean the sender needs no more attention
+HANDLED_STATUSES = ("unsubscribed", "kept")
+
+
+def sender_key(sender: Any) -> str:
+    """The lower case address of a From header, e.g. "News <News@Shop.example>" -> "news@shop.example" """
+    name, address = parseaddr(str(sender or ""))
+    return (address or name).strip().lower()
+
+
+class MailState:
+    """
+    SQLite store of the email agent's progress
+
+    A run opens the mailbox with begin(), which returns the highest UID processed so far (0 when
+    the mailbox was never synced or its UIDVALIDITY changed), notes the UIDs it fetched with
+    mark_fetched(), and advances the mailbox with commit() once they were all handled. A run that
+    is interrupted before commit() fetches the same messages again next time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        self._mailbox: Optional[Dict[str, Any]] = None
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> "MailState":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def begin(self, account: str, mailbox: str, uidvalidity: int) -> int:
+        """
+        Start syncing a mailbox
+
+        Args:
+            account: The user and server of the mailbox
+            mailbox: The name of the mailbox, e.g. "inbox"
+            uidvalidity: The UIDVALIDITY the server announced when the mailbox was selected
+
+        Returns:
+            int: The highest UID already processed, 0 if every message has to be fetched
+        """
+        row = self._db.execute(
+            "SELECT uidvalidity, last_uid FROM mailboxes WHERE account = ? AND mailbox = ?", (account, mailbox)
+        ).fetchone()
+        last_uid = 0
+        if row and row[0] == uidvalidity:
+            last_uid = row[1]
+        elif row:
+            # the server renumbered the mailbox, the old uids mean nothing anymore
+            with self._db:
+                self._db.execute("DELETE FROM messages WHERE account = ? AND mailbox = ?", (account, mailbox))
+                self._db.execute("DELETE FROM mailboxes WHERE account = ? AND mailbox = ?", (account, mailbox))
+        self._mailbox = {"account": account, "mailbox": mailbox, "uidvalidity": uidvalidity,
+                         "last_uid": last_uid, "fetched": last_uid}
+        return last_uid
+
+    def mark_fetched(self, uids: Iterable[int]) -> None:
+        """Note uids fetched by this run, commit() advances the mailbox past them"""
+        if self._mailbox is not None:
+            self._mailbox["fetched"] = max([self._mailbox["fetched"], *uids])
+
+    def commit(self) -> None:
+        """Record every uid passed to mark_fetched() as processed"""
+        current = self._mailbox
+        if current is None or current["fetched"] <= current["last_uid"]:
+            return
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO mailboxes (account, mailbox, uidvalidity, last_uid, synced) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (current["account"], current["mailbox"], current["uidvalidity"], current["fetched"], time.time())
+            )
+        current["last_uid"] = current["fetched"]
+
+    def record_messages(self, messages: Iterable[Dict[str, Any]]) -> None:
+        """
+        Store the classification of messages of the mailbox being synced
+
+        Args:
+            messages: Dicts with the "UID", "Sender", "Subject", "Should Unsubscribe" and
+                      "Unsubscribe Links" of every message, as the email agent builds them
+        """
+        current = self._mailbox
+        if current is None:
+            return
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO messages "
+                "(account, mailbox, uid, sender, subject, should_unsubscribe, links, classified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (current["account"], current["mailbox"], int(message["UID"]), sender_key(message["Sender"]),
+                     str(message["Subject"] or ""), int(bool(message["Should Unsubscribe"])),
+                     json.dumps(list(message["Unsubscribe Links"])), now)
+                    for message in messages
+                ]
+            )
+
+    def sender_status(self, sender: Any) -> Optional[str]:
+        row = self._db.execute("SELECT status FROM senders WHERE sender = ?", (sender_key(sender),)).fetchone()
+        return row[0] if row else None
+
+    def set_sender_status(self, sender: Any, status: str, links: Iterable[str] = ()) -> None:
+        """Record what was done about a sender: "unsubscribed", "kept" or "failed" """
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO senders (sender, status, links, updated) VALUES (?, ?, ?, ?)",
+                (sender_key(sender), status, json.dumps(list(links)), time.time())
+            )
+
+    def handled_senders(self) -> Set[str]:
+        """The senders that need no more attention, see sender_key()"""
+        placeholders = ", ".join("?" for _ in HANDLED_STATUSES)
+        rows = self._db.execute(f"SELECT sender FROM senders WHERE status IN ({placeholders})", HANDLED_STATUSES)
+        return {row[0] for row in rows}
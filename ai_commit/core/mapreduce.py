@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from ai_commit.core.diff import estimate_tokens
+from ai_commit.core.llm import generate_response
+from ai_commit.core.tracing import span
+
+
+def summarize_chunks(chunks: List[str], prompt: str, use_local: bool = False, model_name: str = "",
+                     max_workers: int = 4, **kwargs) -> List[str]:
+    """
+    Map step: summarize every chunk of a diff concurrently on a bounded thread pool
+
+    Args:
+        chunks: The diff chunks to summarize
+        prompt: The prompt used for every chunk
+        use_local: Whether to use a local model
+        model_name: The name of the local model to use
+        max_workers: The maximum number of requests in flight at once
+
+    Returns:
+        List[str]: One summary per chunk, in the same order as the chunks
+    """
+    def summarize(chunk: str) -> str:
+        return generate_response(
+            prompt=prompt,
+            context=chunk,
+            use_local=use_local,
+            model_name=model_name,
+            **kwargs
+        )
+
+    with span("mapreduce.map", chunks=len(chunks)), ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(executor.map(summarize, chunks))
+
+
+def reduce_context(summaries: List[str], notes: str = "") -> str:
+    """Join the chunk summaries (and optional notes about the input) into the context of the reduce prompt"""
+    context = "Summaries of the individual files and hunks:\n\n" + "\n\n".join(summaries)
+    return f"{context}\n\n{notes}" if notes else context
+
+
+def collapse_summaries(summaries: List[str], prompt: str, token_budget: int, use_local: bool = False,
+                       model_name: str = "", max_workers: int = 4, **kwargs) -> List[str]:
+    """
+    Shorten a list of summaries until they fit a token budget together: consecutive summaries
+    are grouped into inputs of at most half the budget and every group is summarized again,
+    as many rounds as it takes. Order is kept, so later summaries still come after earlier ones.
+
+    Args:
+        summaries: The summaries, in order
+        prompt: The prompt that summarizes a group of summaries
+        token_budget: The number of tokens the result has to fit in
+        use_local: Whether to use a local model
+        model_name: The name of the local model to use
+        max_workers: The maximum number of requests in flight at once
+
+    Returns:
+        List[str]: The summaries themselves when they fit, otherwise the group summaries
+    """
+    while len(summaries) > 1 and sum(estimate_tokens(summary) + 1 for summary in summaries) > token_budget:
+        groups: List[List[str]] = [[]]
+        group_tokens = 0
+        for summary in summaries:
+            tokens = estimate_tokens(summary) + 1
+            if groups[-1] and group_tokens + tokens > token_budget // 2:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(summary)
+            group_tokens += tokens
+        if len(groups) == len(summaries):
+            # every summary is over half the budget alone, grouping can't shorten anything
+            break
+        with span("mapreduce.collapse", summaries=len(summaries), groups=len(groups)):
+            collapsed = summarize_chunks(["\n\n".join(group) for group in groups], prompt, use_local, model_name,
+                                         max_workers, **kwargs)
+        summaries = [summary.strip() for summary in collapsed if summary and summary.strip()]
+    return summaries
+
+
+def map_reduce_response(chunks: List[str], map_prompt: str, reduce_prompt: str, use_local: bool = False,
+                        model_name: str = "", max_workers: int = 4, use_cache: bool = True, notes: str = "",
+                        **kwargs) -> str:
+    """
+    Generate one response for an input that is too large for a single prompt. Every chunk is
+    summarized on its own, then a single short reduce pass turns the summaries into the result.
+
+    Args:
+        chunks: The pieces of the input, e.g. the files and hunks of a diff
+        map_prompt: The prompt used to summarize each chunk
+        reduce_prompt: The prompt used to write the final response from the summaries
+        use_local: Whether to use a local model
+        model_name: The name of the local model to use
+        max_workers: The maximum number of map requests in flight at once
+        use_cache: Set to False to write a new reduced response, chunk summaries are still reused
+        notes: Extra context for the reduce pass that doesn't need summarizing
+
+    Returns:
+        str: The reduced response
+    """
+    print(f"Summarizing {len(chunks)} chunks with up to {max_workers} parallel requests...")
+    summaries = summarize_chunks(chunks, map_prompt, use_local, model_name, max_workers, **kwargs)
+    summaries = [summary.strip() for summary in summaries if summary and summary.strip()]
+
+    if not summaries:
+        print("❌ Error: No chunk summaries were generated.")
+        return ""
+
+    return generate_response(
+        prompt=reduce_prompt,
+        context=reduce_context(summaries, notes),
+        use_local=use_local,
+        model_name=model_name,
+        use_cache=use_cache,
+        **kwargs
+    )
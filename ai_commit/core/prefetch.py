@@ -0,0 +1,93 @@
+import queue
+import threading
+from typing import Callable, Iterator, List, Optional
+
+
+class Prefetcher:
+    """
+    Generates responses in the background while the user is busy reading the current one
+
+    The generate callable returns a token stream. Workers stop consuming it as soon as the
+    prefetcher is cancelled, which closes the underlying request. The workers are daemon threads
+    so quitting never waits for a generation that nobody is going to look at.
+    """
+
+    def __init__(self, generate: Callable[[], Iterator[str]]):
+        self.generate = generate
+        self._lock = threading.Lock()
+        self._pending = 0
+        # every batch of workers is bound to the event and queue that were current when it
+        # started, so cancelled workers can never leak results into a later batch
+        self._cancelled = threading.Event()
+        self._results: "queue.Queue[str]" = queue.Queue()
+
+    @property
+    def pending(self) -> int:
+        """The number of candidates still being generated"""
+        with self._lock:
+            return self._pending
+
+    def start(self, count: int = 1) -> None:
+        """Start generating count candidates in parallel"""
+        with self._lock:
+            self._pending += count
+            cancelled, results = self._cancelled, self._results
+        for _ in range(count):
+            threading.Thread(target=self._worker, args=(cancelled, results), daemon=True).start()
+
+    def _worker(self, cancelled: threading.Event, results: "queue.Queue[str]") -> None:
+        tokens = []
+        stream = None
+        try:
+            stream = self.generate()
+            for token in stream:
+                if cancelled.is_set():
+                    return
+                tokens.append(token)
+        except Exception as e:
+            print(f"\n⚠️ Background generation failed: {e}")
+            tokens = []
+        finally:
+            if stream is not None:
+                stream.close()
+            message = "".join(tokens).strip()
+            with self._lock:
+                if not cancelled.is_set():
+                    self._pending -= 1
+                    if message:
+                        results.put(message)
+                    # wakes up take() when the last worker finished without a result
+                    results.put("")
+
+    def take(self) -> Optional[str]:
+        """
+        Return the next finished candidate, waiting for a running worker if none is ready yet
+
+        Returns:
+            Optional[str]: The candidate, or None when every worker failed or was cancelled
+        """
+        while True:
+            try:
+                message = self._results.get(block=self.pending > 0, timeout=None)
+            except queue.Empty:
+                return None
+            if message:
+                return message
+
+    def take_all(self) -> List[str]:
+        """Wait for every running worker and return all the finished candidates"""
+        messages = []
+        while self.pending > 0 or not self._results.empty():
+            message = self.take()
+            if message is None:
+                break
+            messages.append(message)
+        return messages
+
+    def cancel(self) -> None:
+        """Stop every running worker and drop the candidates that are not taken yet"""
+        with self._lock:
+            self._cancelled.set()
+            self._cancelled = threading.Event()
+            self._results = queue.Queue()
+            self._pending = 0
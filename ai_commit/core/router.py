@@ -0,0 +1,348 @@
+"""
+Latency-aware routing between llm providers
+
+ProviderRouter is an LLMProvider over several candidates (e.g. the local model and the remote
+api). It keeps a rolling history of every candidate's time to first token and failures, sends a
+request to the fastest healthy one, and when that one hasn't produced a token by its p95 latency
+(the hedge deadline) starts the next one as well. The first candidate to produce a token wins,
+the others are cancelled: they stop reading their response at their next token, which closes
+the connection. A candidate that fails before producing anything is replaced by the next one
+right away. The history is kept in a small json file so short cli runs still learn from the
+previous ones.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Generator, List, Optional, Tuple
+
+from ai_commit.core.config import config
+from ai_commit.core.llm import PROVIDERS, LLMProvider, is_failed_response
+from ai_commit.core.streaming import TrackedStream
+from ai_commit.core.tracing import count, span
+
+# the last event of an attempt: it completed its answer (with or without tokens), or it failed,
+# was cancelled or stopped early
+_DONE = object()
+_FAILED = object()
+
+
+class ProviderStats:
+    """
+    Rolling first token latencies and outcomes of one provider and model
+
+    Args:
+        window: How many of the latest requests are kept
+    """
+
+    def __init__(self, window: int = 50):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        """Record a request, latency is the time to its first token (None when it failed)"""
+        self.outcomes.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+        elif not ok:
+            self.consecutive_failures += 1
+            self.last_failure = time.time()
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-th percentile (0-100) of the recent first token latencies, None without history"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self, max_error_rate: float = 0.5, cooldown: float = 60.0) -> bool:
+        """
+        Whether to route requests to the provider: unhealthy after three failures in a row or too
+        many recent failures, until cooldown seconds passed since the last one
+        """
+        if time.time() - self.last_failure > cooldown:
+            return True
+        return self.consecutive_failures < 3 and self.error_rate <= max_error_rate
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latencies": list(self.latencies),
+            "outcomes": list(self.outcomes),
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure": self.last_failure,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], window: int = 50) -> "ProviderStats":
+        stats = cls(window)
+        stats.latencies.extend(float(value) for value in data.get("latencies", []))
+        stats.outcomes.extend(bool(value) for value in data.get("outcomes", []))
+        stats.consecutive_failures = int(data.get("consecutive_failures", 0))
+        stats.last_failure = float(data.get("last_failure", 0.0))
+        return stats
+
+
+class RouterHistory:
+    """
+    The ProviderStats of every provider, persisted as json
+
+    Args:
+        path: The json file, or "" to keep the history in memory only
+        window: How many of the latest requests are kept per provider
+    """
+
+    def __init__(self, path: str = "", window: int = 50):
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats: Dict[str, ProviderStats] = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._stats = {key: ProviderStats.from_dict(value, window) for key, value in data.items()}
+            except (OSError, ValueError, AttributeError):
+                pass
+
+    def get(self, key: str) -> ProviderStats:
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = ProviderStats(self.window)
+            return self._stats[key]
+
+    def record(self, key: str, latency: Optional[float], ok: bool) -> None:
+        stats = self.get(key)
+        with self._lock:
+            stats.record(latency, ok)
+
+    def save(self) -> None:
+        """Write the history to its file, best effort"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {key: stats.to_dict() for key, stats in self._stats.items()}
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+class ProviderRouter(LLMProvider):
+    """
+    Routes every request to the fastest healthy provider, hedging and failing over to the others
+
+    Args:
+        providers: The candidates, in order of preference while there is no history
+        history: The latency and error history, shared by the routers of a process by default
+        hedge: Start the next candidate when the first one is slower than its p95 latency
+        hedge_min: The shortest hedge deadline in seconds, so a fast provider's normal jitter
+                   doesn't double every request
+        hedge_default: The hedge deadline of a provider without latency history
+    """
+
+    def __init__(self, providers: List[LLMProvider], history: Optional[RouterHistory] = None,
+                 hedge: bool = True, hedge_min: float = 0.5, hedge_default: float = 5.0):
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = providers
+        self.history = history or get_router_history()
+        self.hedge = hedge
+        self.hedge_min = hedge_min
+        self.hedge_default = hedge_default
+
+    @staticmethod
+    def provider_key(provider: LLMProvider, **kwargs) -> str:
+        identity = provider.cache_identity(**kwargs)
+        return f"{identity.get('provider', type(provider).__name__)}:{identity.get('model', '')}"
+
+    def cache_identity(self, **kwargs) -> Dict[str, str]:
+        return {"provider": "router", "model": "|".join(self.provider_key(p, **kwargs) for p in self.providers)}
+
+    def warm_up(self) -> None:
+        for provider in self.providers:
+            try:
+                provider.warm_up()
+            except Exception:
+                # the request reports it, e.g. ollama not running
+                pass
+
+    def ranked(self, **kwargs) -> List[Tuple[LLMProvider, str]]:
+        """
+        The candidates in the order to try them: healthy before unhealthy, then by median first
+        token latency, providers without history in their configured order after those with one
+        """
+        def rank(item: Tuple[int, LLMProvider]) -> Tuple[bool, float, int]:
+            index, provider = item
+            stats = self.history.get(self.provider_key(provider, **kwargs))
+            median = stats.percentile(50)
+            return (not stats.healthy(), median if median is not None else float("inf"), index)
+
+        ordered = sorted(enumerate(self.providers), key=rank)
+        return [(provider, self.provider_key(provider, **kwargs)) for _, provider in ordered]
+
+    def hedge_delay(self, key: str) -> float:
+        p95 = self.history.get(key).percentile(95)
+        return max(self.hedge_min, p95 if p95 is not None else self.hedge_default)
+
+    def _attempt(self, provider: LLMProvider, key: str, prompt: str, context: str, kwargs: Dict[str, Any],
+                 cancelled: threading.Event, events: "queue.Queue[Tuple[str, Any]]") -> None:
+        """
+        Stream one candidate's response into events, until it ends or the race is decided. The
+        last event is _DONE when the provider completed its answer, _FAILED otherwise.
+        """
+        started = time.perf_counter()
+        first: Optional[float] = None
+        stream = None
+        tracked: Optional[TrackedStream] = None
+        try:
+            with span("router.attempt", provider=key):
+                tracked = TrackedStream(provider.stream_response(prompt, context, **kwargs))
+                stream = iter(tracked)
+                for token in stream:
+                    if not token:
+                        continue
+                    if first is None:
+                        first = time.perf_counter() - started
+                    if cancelled.is_set():
+                        break
+                    events.put((key, token))
+        except Exception as e:
+            print(f"\n⚠️ {key} failed: {e}")
+        finally:
+            if stream is not None:
+                stream.close()
+            if first is not None:
+                self.history.record(key, first, True)
+            elif not cancelled.is_set():
+                self.history.record(key, None, False)
+            # a cancelled attempt without a token says nothing about the provider
+            events.put((key, _DONE if tracked is not None and tracked.completed else _FAILED))
+
+    def _race(self, prompt: str, context: str, kwargs: Dict[str, Any]) -> Generator[str, None, bool]:
+        """Yield the tokens of the first candidate to answer, return whether it completed the answer"""
+        pending = self.ranked(**kwargs)
+        events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        cancelled: Dict[str, threading.Event] = {}
+        winner: Optional[str] = None
+
+        def start() -> float:
+            provider, key = pending.pop(0)
+            cancelled[key] = threading.Event()
+            threading.Thread(
+                target=self._attempt, args=(provider, key, prompt, context, kwargs, cancelled[key], events),
+                daemon=True
+            ).start()
+            # the next candidate joins when this one is slower than usual
+            return time.perf_counter() + self.hedge_delay(key) if self.hedge else float("inf")
+
+        running = 1
+        deadline = start()
+        try:
+            while running:
+                timeout = None
+                if winner is None and pending and deadline != float("inf"):
+                    timeout = max(0.0, deadline - time.perf_counter())
+                try:
+                    key, token = events.get(timeout=timeout)
+                except queue.Empty:
+                    count("router.hedges")
+                    running += 1
+                    deadline = start()
+                    continue
+                if token is _DONE or token is _FAILED:
+                    running -= 1
+                    if key == winner:
+                        return token is _DONE
+                    if winner is None and pending and not cancelled[key].is_set():
+                        # failed before its first token, the next candidate takes its place
+                        count("router.failovers")
+                        running += 1
+                        deadline = start()
+                    continue
+                if winner is None:
+                    winner = key
+                    for other, event in cancelled.items():
+                        if other != winner:
+                            event.set()
+                if key == winner:
+                    yield token
+        finally:
+            # the caller stopped early or the winner finished, nobody reads the others anymore
+            for event in cancelled.values():
+                event.set()
+            self.history.save()
+
+    def stream_response(self, prompt: str, context: str, **kwargs) -> Generator[str, None, bool]:
+        return (yield from self._race(prompt, context, kwargs))
+
+    def generate_response(self, prompt: str, context: str, **kwargs) -> str:
+        stream = TrackedStream(self._race(prompt, context, kwargs))
+        response = "".join(stream)
+        if is_failed_response(response):
+            print("❌ Error: none of the providers answered")
+            return ""
+        if not stream.completed:
+            # half an answer must not be taken (and cached) for the whole one
+            return ""
+        return response
+
+
+_history: Optional[RouterHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_router_history() -> RouterHistory:
+    """Return the history shared by the routers of this process, loaded from the config's path"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = RouterHistory(config.router_history_path, config.router_window)
+        return _history
+
+
+def parse_provider(spec: str) -> LLMProvider:
+    """
+    Build a provider from a spec like "local:llama3", "remote:gpt-4o-mini" or
+    "remote:gpt-4o@https://api.example.com/v1/chat/completions"
+    """
+    kind, _, model = spec.strip().partition(":")
+    model, _, url = model.partition("@")
+    if kind not in PROVIDERS:
+        raise ValueError(f"Unknown provider {kind!r} in {spec!r}, expected one of {sorted(PROVIDERS)}")
+    if kind == "local":
+        if not model:
+            raise ValueError(f"The local provider needs a model, e.g. local:llama3, got {spec!r}")
+        return PROVIDERS["local"](model)
+    return PROVIDERS["remote"](model, api_url=url or None)
+
+
+def build_router(use_local: bool = False, model_name: str = "") -> LLMProvider:
+    """
+    The router over the providers of AI_COMMIT_ROUTER_PROVIDERS, or over the selected provider
+    and the remote api when the local model is selected and api credentials are set. A single
+    candidate is returned as it is.
+    """
+    if config.router_providers:
+        providers = [parse_provider(spec) for spec in config.router_providers]
+    elif use_local and model_name:
+        providers = [PROVIDERS["local"](model_name)]
+        if config.validate_api_credentials():
+            providers.append(PROVIDERS["remote"]())
+    else:
+        providers = [PROVIDERS["remote"]()]
+    if len(providers) == 1:
+        return providers[0]
+    return ProviderRouter(providers, hedge=config.router_hedge, hedge_min=config.router_hedge_min)
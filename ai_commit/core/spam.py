@@ -0,0 +1,200 @@
+"""
+Weighted spam scoring for the email agent
+
+The rules (keywords, link patterns and header checks, each with a weight) are compiled once
+into a single regex, so scoring an email is one pass over a bounded part of its lowered subject
+and body instead of one lowered copy of the whole text per keyword. The same pass collects the
+unsubscribe links. score_batch() scans the emails of a whole batch with one regex call.
+"""
+import json
+import re
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from ai_commit.core.config import config
+
+# the keywords of the original is_spam, plus the bulk mail headers as weaker evidence that
+# can't flag an email on their own: the defaults flag exactly the emails is_spam flagged
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"name": "unsubscribe", "type": "keyword", "pattern": "unsubscribe", "weight": 1.0},
+    {"name": "discount", "type": "keyword", "pattern": "discount", "weight": 1.0},
+    {"name": "promotion", "type": "keyword", "pattern": "promotion", "weight": 1.0},
+    {"name": "offer", "type": "keyword", "pattern": "offer", "weight": 1.0},
+    {"name": "deal", "type": "keyword", "pattern": "deal", "weight": 1.0},
+    {"name": "unsubscribe_link", "type": "link", "pattern": r"https?://[^\s]*unsubscribe[^\s]*", "weight": 0.0},
+    {"name": "list_unsubscribe", "type": "header", "header": "list-unsubscribe", "weight": 0.4},
+    {"name": "bulk_precedence", "type": "header", "header": "precedence", "pattern": "bulk|list", "weight": 0.4},
+]
+
+RULE_TYPES = ("keyword", "link", "header")
+
+
+def load_rules(path: str) -> List[Dict[str, Any]]:
+    """
+    Read a rule set from a json file: a list of {"name", "type", "pattern", "weight"} objects,
+    header rules name their "header" and may omit the pattern
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    for rule in rules:
+        if rule.get("type") not in RULE_TYPES:
+            raise ValueError(f"Unknown spam rule type {rule.get('type')!r} in {path}, expected one of {RULE_TYPES}")
+    return rules
+
+
+class SpamScorer:
+    """
+    Scores emails against a weighted rule set
+
+    Keyword and link rules are matched in the lowered subject and body, so link patterns are
+    written in lower case. Of a body longer than max_chars, only its start and its last quarter
+    of max_chars are scanned, which keeps the footer with the unsubscribe link. Every rule counts
+    once however often it matches. Header rules match when the header is present (and its value
+    matches the rule's pattern, if any). An email is spam when its score reaches the threshold.
+    """
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, threshold: float = 1.0,
+                 max_chars: int = 32 * 1024):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.threshold = threshold
+        self.max_chars = max_chars
+
+        # links first, so a url is matched whole instead of as the keywords inside it
+        self._text_rules = [rule for rule in self.rules if rule["type"] == "link"]
+        self._links = [re.compile(rule["pattern"]) for rule in self._text_rules]
+        self._text_rules += [rule for rule in self.rules if rule["type"] == "keyword"]
+        # the matched text tells which keyword matched: with capturing groups the regex engine
+        # could no longer skip ahead to the characters a pattern starts with
+        self._keyword_index = {
+            rule["pattern"].lower(): index
+            for index, rule in enumerate(self._text_rules) if rule["type"] == "keyword"
+        }
+        keywords = [re.escape(keyword) for keyword in self._keyword_index]
+        self._regex = self._compile([link.pattern for link in self._links] + keywords)
+        self._keywords = self._compile(keywords)
+        self._header_rules = [
+            (rule, rule["header"].lower(), re.compile(rule["pattern"], re.IGNORECASE) if rule.get("pattern") else None)
+            for rule in self.rules if rule["type"] == "header"
+        ]
+
+    @staticmethod
+    def _compile(patterns: List[str]) -> Optional["re.Pattern[str]"]:
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+    def _text(self, subject: Any, body: Any) -> str:
+        body = body or ""
+        if len(body) > self.max_chars:
+            tail = self.max_chars // 4
+            body = f"{body[:self.max_chars - tail]}\n{body[len(body) - tail:]}"
+        return f"{subject or ''}\n{body}"
+
+    @staticmethod
+    def _new_result() -> Dict[str, Any]:
+        return {"_hits": set(), "links": []}
+
+    def _collect(self, matches: Iterable["re.Match[str]"], original: Optional[str], result: Dict[str, Any]) -> None:
+        """
+        Note the rules of matches found in the lowered original text, original is None when
+        lowering changed the length of the text
+        """
+        hits = result["_hits"]
+        for match in matches:
+            text = match.group()
+            index = self._keyword_index.get(text)
+            if index is not None:
+                hits.add(index)
+                continue
+            index = next((index for index, link in enumerate(self._links) if link.fullmatch(text)), None)
+            if index is None:
+                continue
+            hits.add(index)
+            # urls are case sensitive, keep them as written
+            result["links"].append(text if original is None else original[match.start():match.end()])
+            if self._keywords is not None:
+                # a keyword inside the link still counts
+                hits.update(self._keyword_index[keyword] for keyword in self._keywords.findall(text))
+
+    def _finish(self, result: Dict[str, Any], headers: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+        hits = result.pop("_hits")
+        names = [self._text_rules[index]["name"] for index in sorted(hits)]
+        score = sum(self._text_rules[index].get("weight", 1.0) for index in hits)
+        if headers:
+            lowered = {str(name).lower(): value for name, value in headers.items() if value}
+            for rule, header, pattern in self._header_rules:
+                value = lowered.get(header)
+                if value and (pattern is None or pattern.search(str(value))):
+                    names.append(rule["name"])
+                    score += rule.get("weight", 1.0)
+        result["rules"] = names
+        result["score"] = score
+        result["spam"] = score >= self.threshold
+        result["links"] = list(dict.fromkeys(result["links"]))
+        return result
+
+    def score(self, subject: Any, body: Any = "", headers: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Score one email
+
+        Returns:
+            Dict[str, Any]: The "score", whether it is "spam", the names of the matched "rules"
+            and the "links" matched by link rules
+        """
+        result = self._new_result()
+        if self._regex is not None:
+            text = self._text(subject, body)
+            lowered = text.lower()
+            self._collect(self._regex.finditer(lowered), text if len(text) == len(lowered) else None, result)
+        return self._finish(result, headers)
+
+    def score_batch(self, emails: Iterable[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Score many emails with a single scan: their texts are joined and every match is mapped
+        back to its email
+
+        Args:
+            emails: Mappings with the "subject", "body" and optionally the "headers" of every email
+
+        Returns:
+            List[Dict[str, Any]]: The result of every email, see score()
+        """
+        emails = list(emails)
+        results = [self._new_result() for _ in emails]
+        if self._regex is not None and emails:
+            texts = [self._text(item.get("subject"), item.get("body")) for item in emails]
+            starts = []
+            position = 0
+            for text in texts:
+                starts.append(position)
+                # the newline separator ends links and keywords at the end of every text
+                position += len(text) + 1
+            joined = "\n".join(texts)
+            lowered = joined.lower()
+            if len(lowered) != len(joined):
+                # the positions would be off, scan the emails one by one
+                return [self.score(item.get("subject"), item.get("body"), item.get("headers")) for item in emails]
+            matches_by_email: Dict[int, List["re.Match[str]"]] = {}
+            for match in self._regex.finditer(lowered):
+                matches_by_email.setdefault(bisect_right(starts, match.start()) - 1, []).append(match)
+            for index, matches in matches_by_email.items():
+                self._collect(matches, joined, results[index])
+        return [self._finish(result, item.get("headers")) for result, item in zip(results, emails)]
+
+
+_scorer: Optional[SpamScorer] = None
+_scorer_lock = threading.Lock()
+
+
+def get_spam_scorer() -> SpamScorer:
+    """Return the shared scorer, with the rules of AI_COMMIT_SPAM_RULES or the default ones"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            _scorer = SpamScorer(
+                rules=load_rules(config.spam_rules) if config.spam_rules else None,
+                threshold=config.spam_threshold,
+                max_chars=config.spam_scan_chars
+            )
+        return _scorer
@@ -0,0 +1,323 @@
+"""
+Incremental decoding of streamed llm responses
+
+SSEDecoder turns the raw bytes of a server-sent events response into event payloads, whatever
+the chunk boundaries are (lines and utf-8 characters split over several reads). The token
+streams of the providers return whether the model finished its answer, TrackedStream keeps that
+for callers that iterate them with a for loop. CodeFenceFilter
+removes code from streamed text as it arrives, including fences split over several tokens.
+Both only look at each character a bounded number of times, so a whole response is processed in
+linear time.
+"""
+import codecs
+import json
+import re
+from typing import Generator, Iterable, Iterator, List, Optional, Tuple, Union
+
+# skips the argument checks of json.loads, which add up over one call per token
+_decode_json = json.JSONDecoder().raw_decode
+
+
+class SSEDecoder:
+    """
+    Incremental text/event-stream parser. Feed it the response body in any chunks, it returns
+    the data of every event completed so far:
+
+        decoder = SSEDecoder()
+        for chunk in response.iter_content(chunk_size=None):
+            for data in decoder.feed(chunk):
+                ...
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+        self._data: List[str] = []
+
+    def feed(self, chunk: Union[bytes, str]) -> List[str]:
+        """Add a chunk of the body, returning the data of the events it completed"""
+        text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if not text:
+            return []
+        buffer = self._buffer + text if self._buffer else text
+
+        lines = buffer.split("\n")
+        # only the unfinished last line is carried over, it is never longer than one line
+        self._buffer = lines.pop()
+
+        events: List[str] = []
+        data = self._data
+        # the common lines are handled inline, this runs once per line of the whole response
+        for line in lines:
+            if line.endswith("\r"):
+                line = line[:-1]
+            if line.startswith("data: "):
+                data.append(line[6:])
+            elif not line:
+                if data:
+                    events.append(data[0] if len(data) == 1 else "\n".join(data))
+                    data.clear()
+            else:
+                self._line(line, events)
+        return events
+
+    def close(self) -> List[str]:
+        """Flush the event the stream ended in, for servers that don't end with a blank line"""
+        events: List[str] = []
+        tail = self._buffer + self._decoder.decode(b"", final=True)
+        self._buffer = ""
+        if tail:
+            self._line(tail.rstrip("\r"), events)
+        self._line("", events)
+        return events
+
+    def _line(self, line: str, events: List[str]) -> None:
+        if not line:
+            # a blank line dispatches the event
+            if self._data:
+                events.append("\n".join(self._data))
+                self._data.clear()
+            return
+        if line.startswith(":"):
+            # comments, used as keep-alives
+            return
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data.append(value[1:] if value.startswith(" ") else value)
+        # event, id and retry fields are not used by the llm apis
+
+
+def iter_sse_data(chunks: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    """Yield the data of every event of a server-sent events body"""
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+def iter_openai_deltas(events: Iterable[str]) -> Generator[str, None, bool]:
+    """
+    Yield the content deltas of OpenAI-compatible chat completion chunks, until [DONE]
+
+    Returns:
+        bool: Whether the answer is complete, i.e. [DONE] or a finish_reason arrived before the
+            events ended
+    """
+    finished = False
+    for data in events:
+        if data == "[DONE]":
+            return True
+        # role announcements and the final chunk carry no content, only the final one is parsed
+        if '"content"' not in data:
+            if '"finish_reason"' in data and not finished:
+                try:
+                    finished = _finish_reason(_decode_json(data)[0])
+                except json.JSONDecodeError:
+                    pass
+            continue
+        try:
+            payloads = [_decode_json(data)[0]]
+        except json.JSONDecodeError:
+            # servers that forget the blank line between events end up with several lines per event
+            try:
+                payloads = [json.loads(line) for line in data.splitlines() if line.strip()]
+            except json.JSONDecodeError:
+                print(f"\n⚠️ Invalid JSON chunk: {data}")
+                continue
+        for payload in payloads:
+            choices = payload.get("choices") or [{}]
+            token = (choices[0].get("delta") or {}).get("content") or ""
+            finished = finished or bool(choices[0].get("finish_reason"))
+            if token:
+                yield token
+    return finished
+
+
+def _finish_reason(payload: object) -> bool:
+    choices = (payload.get("choices") if isinstance(payload, dict) else None) or [{}]
+    return bool(choices[0].get("finish_reason"))
+
+
+class TrackedStream:
+    """
+    Iterates a token stream and keeps the value it returns: whether the provider finished the
+    answer, False when it stopped early (an error, a dropped connection) or was not iterated
+    to the end
+
+    Args:
+        stream: A generator that returns True once the answer is complete
+    """
+
+    def __init__(self, stream: Iterator[str]):
+        self.stream = stream
+        self.completed = False
+
+    def __iter__(self) -> Iterator[str]:
+        self.completed = bool((yield from self.stream))
+
+
+class CodeFenceFilter:
+    """
+    Streaming filter that drops code from generated text: fenced blocks, and optionally inline
+    `code` and <code> tags. Feed it the tokens as they arrive, it returns the text that is safe
+    to show so far. A delimiter split over several tokens (e.g. "``" then "`python") is held
+    back until it is complete, so it is never printed. Runs of blank lines left behind by removed
+    blocks are collapsed, and leading blank space is dropped.
+
+    Fenced blocks may span lines, an unclosed one drops the rest of the text. Inline code ends
+    at the end of its line, a backtick that is not closed on the same line is kept as text.
+    """
+
+    FENCE = "```"
+    INLINE = {"<code>": "</code>", "`": "`"}
+
+    def __init__(self, inline: bool = True, placeholder: str = ""):
+        """
+        Args:
+            inline: Also remove inline `code` and <code> tags, not only fenced blocks
+            placeholder: Text shown in place of every removed fenced block
+        """
+        self.inline = inline
+        self.placeholder = placeholder
+        # the fence comes first, so ``` is never read as three inline backticks
+        self.openings = [self.FENCE] + (list(self.INLINE) if inline else [])
+        # text without any of these characters can't contain or start a delimiter
+        self._special = re.compile("[" + re.escape("".join({opening[0] for opening in self.openings})) + "]")
+        self._prefixes = {opening[:size] for opening in self.openings for size in range(1, len(opening))}
+        self._longest_prefix = max(len(opening) for opening in self.openings) - 1
+        self._pending = ""
+        self._opening: Optional[str] = None
+        self._searched = 0
+        self._newlines = 0
+        self._indent = ""
+        self._started = False
+
+    def feed(self, text: str) -> str:
+        """Add a token, returning the text that can be shown now"""
+        if self._opening is None and not self._pending and not self._special.search(text):
+            # the common case: plain text between code
+            return self._emit(text)
+        text = self._pending + text
+        output: List[str] = []
+        position = 0
+        found = {}
+
+        while position < len(text):
+            if self._opening is None:
+                index, opening = self._find_opening(text, position, found)
+                if opening is None:
+                    # the end of the text could be the start of an opening, e.g. "<co" or "``"
+                    end = len(text) - self._prefix_length(text, position)
+                    output.append(self._emit(text[position:end]))
+                    position = end
+                    break
+                output.append(self._emit(text[position:index]))
+                if self._ambiguous(text, index):
+                    position = index
+                    break
+                position = index + len(opening)
+                self._opening = opening
+                self._searched = position
+                if opening == self.FENCE and self.placeholder:
+                    output.append(self._emit(self.placeholder))
+            elif self._opening == self.FENCE:
+                index = text.find(self.FENCE, position)
+                if index < 0:
+                    # the block is dropped, except what could be the start of the closing fence
+                    position = len(text) - self._prefix_length(text, position, self.FENCE)
+                    break
+                position = index + len(self.FENCE)
+                self._opening = None
+            else:
+                closing = self.INLINE[self._opening]
+                # everything before _searched was already searched by an earlier token
+                start = max(position, self._searched - len(closing) + 1)
+                index = text.find(closing, start)
+                newline = text.find("\n", start)
+                if newline >= 0 and (index < 0 or newline < index):
+                    # not inline code after all, show it as it is
+                    output.append(self._emit(self._opening + text[position:newline]))
+                    position = newline
+                    self._opening = None
+                    continue
+                if index < 0:
+                    # wait for the rest of the line
+                    self._searched = len(text)
+                    break
+                position = index + len(closing)
+                self._opening = None
+
+        self._pending = text[position:]
+        if self._opening is not None and self._opening != self.FENCE:
+            self._searched -= position
+        return "".join(output)
+
+    def close(self) -> str:
+        """Flush the held back text once the stream ended, an unclosed fenced block stays dropped"""
+        pending, self._pending = self._pending, ""
+        opening, self._opening = self._opening, None
+        if opening == self.FENCE:
+            return ""
+        return self._emit((opening or "") + pending)
+
+    def _find_opening(self, text: str, position: int, found: dict) -> Tuple[int, Optional[str]]:
+        """The first opening from position on. The positions found are reused while they are ahead."""
+        best_index, best = -1, None
+        for opening in self.openings:
+            index = found.get(opening)
+            if index is None or 0 <= index < position:
+                index = found[opening] = text.find(opening, position)
+            if index >= 0 and (best is None or index < best_index):
+                best_index, best = index, opening
+        return best_index, best
+
+    def _ambiguous(self, text: str, index: int) -> bool:
+        """Whether the text from index on could still grow into a longer opening, e.g. `` into a fence"""
+        rest = text[index:]
+        return any(len(opening) > len(rest) and opening.startswith(rest) for opening in self.openings)
+
+    def _prefix_length(self, text: str, position: int, delimiter: str = "") -> int:
+        """
+        Length of the longest end of text[position:] that is the start of the delimiter, or of
+        any opening when there is none
+        """
+        longest = min(len(delimiter) - 1 if delimiter else self._longest_prefix, len(text) - position)
+        for size in range(longest, 0, -1):
+            tail = text[-size:]
+            if delimiter.startswith(tail) if delimiter else tail in self._prefixes:
+                return size
+        return 0
+
+    def _emit(self, text: str) -> str:
+        """Collapse runs of blank lines, and hold back newlines and indentation until text follows"""
+        if not text:
+            return ""
+        if self._started and not self._newlines and "\n" not in text:
+            return text
+        output = []
+        lines = text.split("\n")
+        for number, line in enumerate(lines):
+            if not self._started:
+                line = line.lstrip()
+                self._started = bool(line)
+            if line.strip():
+                output.append("\n" * min(self._newlines, 2) + self._indent + line)
+                self._newlines = 0
+                self._indent = ""
+            elif line and self._newlines == 0 and self._started:
+                # spaces between words
+                output.append(line)
+            elif line:
+                # indentation of a line whose text is still to come
+                self._indent += line
+            if number < len(lines) - 1:
+                if self._started:
+                    self._newlines += 1
+                self._indent = ""
+        return "".join(output)
+
+
+def filter_code(text: str, inline: bool = True, placeholder: str = "") -> str:
+    """Remove the code from a complete text, see CodeFenceFilter"""
+    code_filter = CodeFenceFilter(inline, placeholder)
+    return (code_filter.feed(text) + code_filter.close()).strip()
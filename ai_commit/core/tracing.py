@@ -0,0 +1,165 @@
+"""
+Lightweight spans and counters for `ai-commit --profile`
+
+Instrumented code wraps its phases in `with span("git.diff"):` and bumps counters with
+`count("http.bytes_sent", n)`. Both are no-ops while tracing is disabled (a flag check and a
+shared null context manager), so the instrumentation can stay in the hot paths. Once enabled,
+the tracer prints a per-phase breakdown and can write a Chrome trace event file that opens in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed phase, recorded on the tracer when it ends"""
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.add_span(self.name, self.start, time.perf_counter(), **self.attrs)
+
+    def set(self, **attrs: Any) -> None:
+        """Attach attributes known only once the phase ran, e.g. the number of bytes read"""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Collects the spans and counters of one cli run"""
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.started = time.perf_counter()
+
+    def span(self, name: str, **attrs: Any):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def add_span(self, name: str, start: float, end: float, **attrs: Any) -> None:
+        """Record a phase measured by the caller, e.g. the time to the first streamed token"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start": start,
+                "end": end,
+                "thread": threading.current_thread().name,
+                "attrs": attrs,
+            })
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def phases(self) -> List[Dict[str, Any]]:
+        """Aggregate the spans by name, in the order the phases first started"""
+        phases: Dict[str, Dict[str, Any]] = {}
+        for item in sorted(self.spans, key=lambda item: item["start"]):
+            phase = phases.setdefault(item["name"], {"name": item["name"], "calls": 0, "total_s": 0.0, "max_s": 0.0})
+            duration = item["end"] - item["start"]
+            phase["calls"] += 1
+            phase["total_s"] += duration
+            phase["max_s"] = max(phase["max_s"], duration)
+        return list(phases.values())
+
+    def report(self) -> str:
+        wall = time.perf_counter() - self.started
+        lines = [f"\n📊 Profile ({wall:.2f}s wall, phases on worker threads can overlap)"]
+        for phase in self.phases():
+            lines.append(
+                f"  {phase['name']:<24}{phase['calls']:>6}x {phase['total_s']:>9.3f}s "
+                f"{100 * phase['total_s'] / wall if wall else 0:>6.1f}%   max {phase['max_s']:.3f}s"
+            )
+        if self.counters:
+            lines.append("  counters:")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"    {name:<32}{value:>12,.0f}")
+        return "\n".join(lines)
+
+    def write_trace(self, path: str) -> None:
+        """Write the spans as Chrome trace events and the counters as metadata"""
+        pid = os.getpid()
+        threads: Dict[str, int] = {}
+        events = []
+        for item in self.spans:
+            tid = threads.setdefault(item["thread"], len(threads) + 1)
+            events.append({
+                "name": item["name"],
+                "ph": "X",
+                "ts": round((item["start"] - self.started) * 1e6),
+                "dur": round((item["end"] - item["start"]) * 1e6),
+                "pid": pid,
+                "tid": tid,
+                "args": {key: str(value) for key, value in item["attrs"].items()},
+            })
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for name, tid in threads.items()
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "traceEvents": events,
+                "displayTimeUnit": "ms",
+                "otherData": {"counters": self.counters, "phases": self.phases()},
+            }, f, indent=2)
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attrs: Any):
+    """Time a phase: `with span("llm.generate", model=name):`"""
+    return tracer.span(name, **attrs)
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add to a counter, e.g. `count("http.retries")`"""
+    tracer.count(name, value)
+
+
+def finish(trace_path: Optional[str] = None) -> None:
+    """Print the phase breakdown, and write the trace file when a path is given"""
+    if not tracer.enabled:
+        return
+    print(tracer.report())
+    if trace_path:
+        tracer.write_trace(trace_path)
+        print(f"  trace written to {trace_path}")
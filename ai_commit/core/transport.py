@@ -0,0 +1,188 @@
+import gzip
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ai_commit.core.config import config
+from ai_commit.core.tracing import count, span
+
+# status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPTransport:
+    """
+    Shared HTTP transport for the remote llm apis
+
+    Keeps one requests session with a pool of keep-alive connections, so regenerations reuse
+    the TCP+TLS connection instead of handshaking again. Every request has connect and read
+    timeouts, and 429/5xx answers and connection errors are retried with jittered exponential
+    backoff that honors the Retry-After header. Read timeouts are not retried: the server may
+    still be working on the request, and sending a long generation again would only make the
+    caller wait several read timeouts for it.
+    """
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 120.0, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, pool_size: int = 8,
+                 compress: bool = False, compress_threshold: int = 64 * 1024, max_retry_after: float = 60.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.compress = compress
+        self.compress_threshold = compress_threshold
+        self.max_retry_after = max_retry_after
+
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """The pooled session, created on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # retries are handled in request() so Retry-After and jitter work the same everywhere
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def close(self) -> None:
+        """Close every pooled connection"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (starting at 0)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def retry_after_delay(self, response: requests.Response) -> Optional[float]:
+        """
+        Parse the Retry-After header, which is either a number of seconds or an http date
+
+        Returns:
+            Optional[float]: The delay in seconds capped at max_retry_after, or None when absent
+        """
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0.0), self.max_retry_after)
+
+    def encode_body(self, payload: Any, headers: Dict[str, str]) -> bytes:
+        """Serialize a json payload, gzip compressing it when it is large enough"""
+        body = json.dumps(payload).encode("utf-8")
+        headers.setdefault("Content-Type", "application/json")
+        if self.compress and len(body) >= self.compress_threshold:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        return body
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                data: Optional[bytes] = None, stream: bool = False) -> requests.Response:
+        """
+        Send a request over the pooled session, retrying rate limits, server errors and
+        connection failures (including connect timeouts), but not read timeouts
+
+        Args:
+            method: The http method
+            url: The url to call
+            headers: The request headers
+            data: The encoded request body
+            stream: Whether to stream the response body
+
+        Returns:
+            requests.Response: The last response received, which may still be an error status
+        """
+        attempt = 0
+        while True:
+            count("http.bytes_sent", len(data or b""))
+            try:
+                # until the response headers arrive: connect, upload and the server's time to respond
+                with span("http.request", attempt=attempt):
+                    response = self.session.request(
+                        method,
+                        url,
+                        headers=headers,
+                        data=data,
+                        stream=stream,
+                        timeout=(self.connect_timeout, self.read_timeout)
+                    )
+            except requests.exceptions.ConnectionError as e:
+                # ConnectTimeout is a ConnectionError too, a ReadTimeout goes straight to the caller
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                print(f"⚠️ Request failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+                count("http.retries")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+
+            delay = self.retry_after_delay(response)
+            if delay is None:
+                delay = self.backoff_delay(attempt)
+            print(f"⚠️ API returned status code {response.status_code}, retrying in {delay:.1f}s...")
+            count("http.retries")
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def warm_up(self, url: str) -> None:
+        """Open a pooled connection to the host of the url before the first real request needs it"""
+        try:
+            # any answer will do, the connection (and the tls session) stays in the pool
+            self.session.head(url, timeout=(self.connect_timeout, self.connect_timeout), allow_redirects=False)
+        except requests.exceptions.RequestException:
+            pass
+
+    def post_json(self, url: str, payload: Any, headers: Optional[Dict[str, str]] = None,
+                  stream: bool = False) -> requests.Response:
+        """Post a json payload, see request()"""
+        headers = dict(headers or {})
+        body = self.encode_body(payload, headers)
+        return self.request("POST", url, headers=headers, data=body, stream=stream)
+
+
+_transport: Optional[HTTPTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """Return the shared transport configured from the environment"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HTTPTransport(
+                connect_timeout=config.http_connect_timeout,
+                read_timeout=config.http_read_timeout,
+                max_retries=config.http_max_retries,
+                backoff_base=config.http_backoff_base,
+                backoff_max=config.http_backoff_max,
+                pool_size=config.http_pool_size,
+                compress=config.http_compress,
+                compress_threshold=config.http_compress_threshold
+            )
+        return _transport
@@ -0,0 +1,174 @@
+"""
+Concurrent unsubscribe requests for the email agent
+
+Every sender is unsubscribed once, however many of its emails were flagged: its links are
+merged and deduplicated (one link per host, and a url shared by several senders is only called
+once). When the sender supports RFC 8058 one-click unsubscribe (a List-Unsubscribe-Post header),
+a single POST to the https link of its List-Unsubscribe header is used instead. The requests run
+on a thread pool over pooled keep-alive connections, with timeouts and at most a few requests
+in flight per host.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import zip_longest
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from ai_commit.core.mail_state import sender_key
+from ai_commit.core.tracing import count, span
+from ai_commit.core.transport import HTTPTransport
+
+# the body of an RFC 8058 one-click unsubscribe request
+ONE_CLICK_BODY = b"List-Unsubscribe=One-Click"
+
+
+def plan_requests(senders: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Turn the links of the senders to unsubscribe from into the requests to send
+
+    Args:
+        senders: Dicts with the "sender", its "links" and its "one_click" links (the https links
+                 of a List-Unsubscribe header that came with List-Unsubscribe-Post). Several
+                 dicts of the same sender are merged.
+
+    Returns:
+        List[Dict[str, Any]]: One request per sender and host: its "url", "method", "host" and
+        the "senders" it unsubscribes from (a url shared by several senders is only called once)
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for item in senders:
+        key = sender_key(item["sender"])
+        entry = merged.setdefault(key, {"sender": key, "links": [], "one_click": []})
+        entry["links"].extend(item.get("links") or [])
+        entry["one_click"].extend(item.get("one_click") or [])
+
+    planned: List[Dict[str, Any]] = []
+    by_url: Dict[str, Dict[str, Any]] = {}
+    for entry in merged.values():
+        one_click = [link for link in entry["one_click"] if link.lower().startswith("https://")]
+        if one_click:
+            # one POST unsubscribes from the whole list, no need to visit any page
+            candidates = [(one_click[0], "POST")]
+        else:
+            candidates = [(link, "GET") for link in entry["links"] if link.lower().startswith(("http://", "https://"))]
+        hosts = set()
+        for url, method in candidates:
+            host = urlsplit(url).netloc.lower()
+            if host in hosts:
+                continue
+            hosts.add(host)
+            if url in by_url:
+                by_url[url]["senders"].append(entry["sender"])
+                continue
+            by_url[url] = {"senders": [entry["sender"]], "url": url, "method": method, "host": host}
+            planned.append(by_url[url])
+    return planned
+
+
+class UnsubscribeReport:
+    """The outcome of every unsubscribe request, by sender"""
+
+    def __init__(self, results: List[Dict[str, Any]]):
+        self.results = results
+
+    def senders(self) -> Dict[str, bool]:
+        """Whether every sender was unsubscribed, which takes one successful request"""
+        outcome: Dict[str, bool] = {}
+        for result in self.results:
+            for sender in result["senders"]:
+                outcome[sender] = outcome.get(sender, False) or result["ok"]
+        return outcome
+
+    def links(self, sender: Any) -> List[str]:
+        key = sender_key(sender)
+        return [result["url"] for result in self.results if key in result["senders"]]
+
+    def summary(self) -> str:
+        senders = self.senders()
+        unsubscribed = sum(1 for ok in senders.values() if ok)
+        lines = [f"Unsubscribed from {unsubscribed} of {len(senders)} senders "
+                 f"with {len(self.results)} requests."]
+        for result in self.results:
+            icon = "✅" if result["ok"] else "❌"
+            detail = result["error"] or f"status {result['status']}"
+            lines.append(f"  {icon} {', '.join(result['senders'])}: {result['method']} {result['url']} ({detail}, "
+                         f"{result['seconds']:.2f}s)")
+        return "\n".join(lines)
+
+
+class UnsubscribeExecutor:
+    """
+    Sends the planned unsubscribe requests concurrently
+
+    Args:
+        max_workers: The maximum number of requests in flight
+        per_host: The maximum number of requests in flight to the same host
+        timeout: The connect and read timeout of every request in seconds
+        transport: The http transport, a dedicated one without retries by default
+    """
+
+    def __init__(self, max_workers: int = 8, per_host: int = 2, timeout: float = 10.0,
+                 transport: Optional[HTTPTransport] = None):
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.transport = transport or HTTPTransport(
+            connect_timeout=timeout, read_timeout=timeout, max_retries=0, pool_size=self.max_workers
+        )
+        self._hosts: Dict[str, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.Semaphore(self.per_host)
+            return self._hosts[host]
+
+    def send(self, planned: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one planned request, never raising"""
+        result = {**planned, "status": None, "ok": False, "error": None}
+        start = time.perf_counter()
+        with self._host_slot(planned["host"]), span("unsubscribe.request", host=planned["host"]):
+            try:
+                if planned["method"] == "POST":
+                    response = self.transport.request(
+                        "POST", planned["url"], data=ONE_CLICK_BODY,
+                        headers={"Content-Type": "application/x-www-form-urlencoded"}
+                    )
+                else:
+                    response = self.transport.request("GET", planned["url"])
+                result["status"] = response.status_code
+                result["ok"] = 200 <= response.status_code < 300
+                response.close()
+            except requests.exceptions.RequestException as e:
+                result["error"] = e.__class__.__name__
+        result["seconds"] = time.perf_counter() - start
+        count("unsubscribe.requests")
+        return result
+
+    def run(self, senders: Iterable[Dict[str, Any]]) -> UnsubscribeReport:
+        """
+        Unsubscribe from the senders, see plan_requests() for what they look like
+
+        Returns:
+            UnsubscribeReport: The result of every request, in the order they completed
+        """
+        planned = plan_requests(senders)
+        results: List[Dict[str, Any]] = []
+        if not planned:
+            return UnsubscribeReport(results)
+        # interleave the hosts, so the workers don't all queue up behind the same host's limit
+        by_host: Dict[str, List[Dict[str, Any]]] = {}
+        for item in planned:
+            by_host.setdefault(item["host"], []).append(item)
+        ordered = [item for group in zip_longest(*by_host.values()) for item in group if item is not None]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(planned))) as executor:
+            futures = [executor.submit(self.send, item) for item in ordered]
+            for future in as_completed(futures):
+                results.append(future.result())
+        return UnsubscribeReport(results)
+
+    def close(self) -> None:
+        self.transport.close()
@@ -1,15 +1,32 @@
 import os
 import subprocess
-import sys
-from typing import List, Dict, Any, Optional, Union
+import threading
+import time
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Union
+
+from ai_commit.core.config import config
+from ai_commit.core.tracing import count, span, tracer
+
+# prompts by name, read once per process
+_prompts: Dict[str, str] = {}
+
+
+class CommandError(Exception):
+    """
+    A command failed or ran out of time. The cli reports it and exits, code running commands on
+    worker threads (one per commit of a range, say) catches it for the one item that failed.
+    """
 
 def load_prompt(prompt_name:str) -> str:
     """
-    Load a prompt from prompt registry
+    Load a prompt from prompt registry, the file is only read the first time
 
     Args:
         prompt_name: The name of the prompt file (without .txt extension)
     """
+    prompt = _prompts.get(prompt_name)
+    if prompt is not None:
+        return prompt
 
     prompt_path = os.path.join(
         os.path.dirname(os.path.dirname(__file__)),
@@ -17,34 +34,144 @@ def load_prompt(prompt_name:str) -> str:
         f"{prompt_name}.txt"
     )
     try:
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            return f.read()
+        with span("prompt.load", prompt=prompt_name), open(prompt_path, "r", encoding="utf-8") as f:
+            prompt = _prompts[prompt_name] = f.read()
+        return prompt
     except FileNotFoundError:
         print(f"❌ Error: Prompt file '{prompt_name}.txt' not found.")
         return ""
 
 
 
-def run_command(command: Union[List[str], str]) -> str:
+def run_command(command: Union[List[str], str], timeout: Optional[float] = None) -> str:
     """
     Runs a shell command and returns the output
 
     Args:
         command: The command to run
+        timeout: Seconds before the command is killed, defaults to AI_COMMIT_GIT_TIMEOUT
 
     Returns:
         str: The output of the command
+
+    Raises:
+        CommandError: When the command fails or times out
     """
     try: 
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True, 
-            encoding='utf-8',
-            check=True,
-            timeout=10,
-        )
+        with span("git", command=command if isinstance(command, str) else " ".join(command[:3])):
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True, 
+                encoding='utf-8',
+                check=True,
+                timeout=timeout or config.command_timeout,
+            )
         return result.stdout.strip()
     except subprocess.CalledProcessError as e:
-        print(f"❌ Error: \n{e.stderr}")
-        sys.exit(1)
\ No newline at end of file
+        raise CommandError(f"\n{e.stderr}") from e
+    except subprocess.TimeoutExpired as e:
+        raise CommandError(f"`{' '.join(e.cmd) if isinstance(e.cmd, list) else e.cmd}` timed out after "
+                           f"{e.timeout:.0f}s") from e
+
+
+def stream_command(command: List[str], base_timeout: Optional[float] = None,
+                   timeout_per_mb: Optional[float] = None) -> Iterator[str]:
+    """
+    Runs a command and yields its output line by line while it is still running, so large
+    outputs (like a big `git diff --cached`) are never buffered whole. The time budget grows
+    with the amount of output: base_timeout plus timeout_per_mb for every MB read so far.
+
+    Args:
+        command: The command to run
+        base_timeout: Seconds allowed before any output, defaults to AI_COMMIT_GIT_TIMEOUT
+        timeout_per_mb: Extra seconds per MB of output, defaults to AI_COMMIT_GIT_TIMEOUT_PER_MB
+
+    Yields:
+        str: The output lines, line endings included
+
+    Raises:
+        CommandError: Once the output ends, when the command failed or ran out of time
+    """
+    base_timeout = base_timeout or config.command_timeout
+    timeout_per_mb = config.command_timeout_per_mb if timeout_per_mb is None else timeout_per_mb
+
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=64 * 1024,
+    )
+    start = time.monotonic()
+    traced_start = time.perf_counter()
+    # the budget is per MB of output, the decoded lines are counted in utf-8 bytes again
+    bytes_read = 0
+    done = threading.Event()
+    timed_out = threading.Event()
+
+    def watchdog() -> None:
+        while not done.wait(0.1):
+            budget = base_timeout + timeout_per_mb * bytes_read / (1024 * 1024)
+            if time.monotonic() - start > budget:
+                timed_out.set()
+                process.kill()
+                return
+
+    # stderr is drained on its own thread so a chatty command can't block on a full pipe
+    stderr_lines: List[str] = []
+    stderr_reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+    stderr_reader.start()
+    threading.Thread(target=watchdog, daemon=True).start()
+
+    try:
+        for line in process.stdout:
+            bytes_read += len(line) if line.isascii() else len(line.encode("utf-8", errors="replace"))
+            yield line
+        process.wait()
+    finally:
+        done.set()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        stderr_reader.join(1)
+        tracer.add_span("git.stream", traced_start, time.perf_counter(), command=" ".join(command[:3]), bytes=bytes_read)
+        count("git.bytes_read", bytes_read)
+
+    if timed_out.is_set():
+        budget = base_timeout + timeout_per_mb * bytes_read / (1024 * 1024)
+        raise CommandError(f"`{' '.join(command)}` timed out after {budget:.0f}s "
+                           f"({bytes_read / (1024 * 1024):.1f} MB read)")
+    if process.returncode != 0:
+        raise CommandError(f"\n{''.join(stderr_lines)}")
+
+
+def print_stream(tokens: Iterable[str], show_timing: bool = True) -> str:
+    """
+    Print tokens as they arrive and return the full text
+
+    Args:
+        tokens: The streamed tokens
+        show_timing: Print the time to first token and the total time once the stream ends
+
+    Returns:
+        str: The concatenated tokens
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    parts = []
+
+    for token in tokens:
+        if first_token_at is None:
+            first_token_at = time.perf_counter() - start
+        parts.append(token)
+        print(token, end="", flush=True)
+
+    total = time.perf_counter() - start
+    print()
+    if show_timing and first_token_at is not None:
+        print(f"⏱  first token after {first_token_at:.2f}s, done in {total:.2f}s")
+    return "".join(parts)
@@ -1,36 +1,21 @@
-import ollama
 import sys
-from ai_commit.utils import load_prompt
+from ai_commit.core.llm import LocalLLMProvider
+from ai_commit.core.utils import load_prompt, print_stream
 
 def generate_message(staged_changes: str, model_name : str, prompt_name:str):
     try:
 
         system_prompt = load_prompt(prompt_name)
 
-
-        stream = ollama.chat(
-            model=model_name,
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": f"Here is the diff from staged changes:\n {staged_changes}",
-                },
-            ],
-            stream=True,
+        provider = LocalLLMProvider(model_name)
+        stream = provider.stream_response(
+            system_prompt,
+            f"Here is the diff from staged changes:\n {staged_changes}"
         )
 
         print("✨ Generating message...")
         print("-" * 50 + "\n")
-        commit_message = ""
-        for chunk in stream:
-            if chunk["done"] is False:
-                content = chunk["message"]["content"]
-                print(content, end="", flush=True)
-                commit_message += content
+        commit_message = print_stream(stream)
 
         if not commit_message.strip():
             print("\n❌ No commit message generated.")
@@ -42,4 +27,4 @@ def generate_message(staged_changes: str, model_name : str, prompt_name:str):
         print(f"❌ Error generating commit message: {str(e)}")
         import traceback
         traceback.print_exc()
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,90 @@
+"""
+prepare-commit-msg hook that asks the ai-commit daemon for a message
+
+The hook is a thin client: it only imports the standard library and the daemon client, and
+leaves the commit alone when no daemon is running, so `git commit` never waits for a cold start.
+Install it with `ai-commit --install-hook`. Set AI_COMMIT_HOOK_MODEL to a local model name to
+generate with ollama instead of the remote api, and AI_COMMIT_HOOK_TIMEOUT to the seconds the
+hook waits for the daemon before leaving the message empty.
+"""
+import os
+import stat
+import subprocess
+import sys
+from typing import List
+
+from ai_commit.core.config import config
+from ai_commit.core.daemon import DaemonClient
+
+HOOK_MARKER = "# installed by ai-commit"
+# a broken hook must never block a commit
+HOOK_SCRIPT = f"""#!/bin/sh
+{HOOK_MARKER}
+"{sys.executable}" -m ai_commit.hooks.prepare_commit_msg "$@" || true
+"""
+
+
+def install_hook() -> int:
+    """
+    Write the prepare-commit-msg hook of the current repository
+
+    Returns:
+        int: The exit code
+    """
+    result = subprocess.run(["git", "rev-parse", "--git-path", "hooks"], capture_output=True, text=True)
+    if result.returncode != 0:
+        print("❌ Not a git repository.")
+        return 1
+
+    hook_path = os.path.join(result.stdout.strip(), "prepare-commit-msg")
+    if os.path.exists(hook_path):
+        with open(hook_path, "r", encoding="utf-8", errors="replace") as f:
+            if HOOK_MARKER not in f.read():
+                print(f"❌ {hook_path} already exists, not overwriting it.")
+                return 1
+
+    os.makedirs(os.path.dirname(hook_path), exist_ok=True)
+    with open(hook_path, "w", encoding="utf-8") as f:
+        f.write(HOOK_SCRIPT)
+    os.chmod(hook_path, os.stat(hook_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    print(f"✨ Installed {hook_path}. Start the daemon with: ai-commit --daemon start")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    if not argv:
+        return 0
+    message_file = argv[0]
+    # only plain `git commit`, not -m, -F, templates, merges, squashes or amends
+    if len(argv) > 1 and argv[1]:
+        return 0
+
+    # `git commit` waits for the hook, without an answer in time the template stays empty
+    client = DaemonClient(timeout=config.hook_timeout)
+    if not client.available():
+        return 0
+
+    diff = subprocess.run(
+        ["git", "diff", "--cached", "--no-color", "--no-ext-diff"],
+        capture_output=True, text=True, encoding="utf-8", errors="replace"
+    ).stdout
+    if not diff.strip():
+        return 0
+
+    model_name = os.environ.get("AI_COMMIT_HOOK_MODEL", "")
+    reply = client.call("commit_message", diff=diff, use_local=bool(model_name), model_name=model_name,
+                        repo=os.getcwd())
+    message = (reply or {}).get("response", "").strip()
+    if not message:
+        return 0
+
+    with open(message_file, "r+", encoding="utf-8") as f:
+        template = f.read()
+        f.seek(0)
+        f.write(message + "\n" + template)
+        f.truncate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,268 @@
+"""
+End-to-end benchmarks of ai-commit against local stub llm servers
+
+Starts a StubLLMServer (see stubs.py) and runs every scenario on synthetic diffs of growing size,
+each in a fresh interpreter so the peak RSS belongs to that run alone. Reports the wall time,
+the time to first token, the tokens per second and the peak RSS, as a table or as json to
+compare across versions. Run it with `make bench` or `python benchmarks/e2e.py --json`.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from stubs import StubLLMServer  # noqa: E402
+
+SIZES = {"K": 1024, "M": 1024 * 1024}
+DEFAULT_SIZES = "1K,100K,1M,10M,50M"
+MODEL = "llama3"
+
+
+def parse_size(value: str) -> int:
+    """Parse a size like 512, 100K or 50M into bytes"""
+    value = value.strip().upper()
+    if value[-1] in SIZES:
+        return int(float(value[:-1]) * SIZES[value[-1]])
+    return int(value)
+
+
+def synthetic_diff(size: int) -> str:
+    """
+    Build a deterministic unified diff of about size bytes: source files with a few hunks each,
+    plus a lockfile and a minified bundle for the preprocessing filters to drop
+    """
+    parts = []
+    total = 0
+    index = 0
+    while total < size:
+        if index % 25 == 24:
+            path = f"vendor/bundle{index}.min.js" if index % 50 == 49 else f"packages/app{index}/package-lock.json"
+            body = "".join(f'+  "dependency-{index}-{line}": "^{line}.0.0",\n' for line in range(40))
+            hunk = f"@@ -0,0 +1,40 @@\n{body}"
+        else:
+            path = f"src/module{index // 10}/file{index}.py"
+            hunk = "".join(
+                f"@@ -{start},6 +{start},8 @@ def handler_{index}_{start}(request):\n"
+                f"     value = request.get('field_{start}')\n"
+                f"-    return compute(value)\n"
+                f"+    if value is None:\n"
+                f"+        return default_{start}()\n"
+                f"+    return compute(value, retries={start % 7})\n"
+                f"     # keep the old behaviour for field {start}\n"
+                f"     log.debug('handled %s', value)\n"
+                for start in range(10, 130, 30)
+            )
+        part = (
+            f"diff --git a/{path} b/{path}\n"
+            f"index {index:07x}..{index + 1:07x} 100644\n"
+            f"--- a/{path}\n+++ b/{path}\n{hunk}"
+        )
+        parts.append(part)
+        total += len(part)
+        index += 1
+    return "".join(parts)
+
+
+def timed_stream(tokens: Iterator[str], stats: Dict[str, Any]) -> Iterator[str]:
+    """Pass the tokens through, recording the time of the first one and the count"""
+    for token in tokens:
+        if "first_token" not in stats:
+            stats["first_token"] = time.perf_counter()
+        stats["tokens"] = stats.get("tokens", 0) + 1
+        yield token
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def scenario_local_provider(diff: str, stats: Dict[str, Any]) -> None:
+    from ai_commit.core.llm import LocalLLMProvider
+    from ai_commit.core.utils import load_prompt
+
+    provider = LocalLLMProvider(MODEL)
+    for _ in timed_stream(provider.stream_response(load_prompt("commit_message"), diff), stats):
+        pass
+
+
+def scenario_remote_provider(diff: str, stats: Dict[str, Any]) -> None:
+    from ai_commit.core.llm import RemoteLLMProvider
+    from ai_commit.core.utils import load_prompt
+
+    provider = RemoteLLMProvider(chat_format=True)
+    for _ in timed_stream(provider.stream_response(load_prompt("commit_message"), diff), stats):
+        pass
+
+
+def scenario_generate_remote_message(diff: str, stats: Dict[str, Any]) -> None:
+    import ai_commit.generate_remote_message as module
+
+    class TimedProvider(module.RemoteLLMProvider):
+        def stream_response(self, prompt: str, context: str, **kwargs: Any) -> Iterator[str]:
+            return timed_stream(super().stream_response(prompt, context, **kwargs), stats)
+
+    module.RemoteLLMProvider = TimedProvider
+    module.generate_remote_message(diff, "commit_message", "commit")
+
+
+def scenario_commit_agent(diff: str, stats: Dict[str, Any]) -> None:
+    from ai_commit.Agents.commit_agent import CommitAgent
+
+    agent = CommitAgent()
+    staged = agent.prepare_diff(diff, MODEL, verbose=False)
+    stats["prompt_bytes"] = len(staged)
+    for _ in timed_stream(agent.stream_commit_message(staged, True, MODEL), stats):
+        pass
+
+
+SCENARIOS: Dict[str, Callable[[str, Dict[str, Any]], None]] = {
+    "local_provider": scenario_local_provider,
+    "remote_provider": scenario_remote_provider,
+    "generate_remote_message": scenario_generate_remote_message,
+    "commit_agent": scenario_commit_agent,
+}
+
+
+def run_child(scenario: str, size: int, map_reduce: bool) -> Dict[str, Any]:
+    """Run one scenario in this process and return its measurements"""
+    from ai_commit.core.config import config
+
+    if not map_reduce:
+        # summarizing a 50 MB diff would benchmark the stub, not ai-commit
+        config.map_reduce_threshold = float("inf")
+
+    diff = synthetic_diff(size)
+    stats: Dict[str, Any] = {}
+    start = time.perf_counter()
+    # the agents print progress and the streamed message, only the measurements go to stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        SCENARIOS[scenario](diff, stats)
+    end = time.perf_counter()
+
+    first_token = stats.get("first_token")
+    tokens = stats.get("tokens", 0)
+    generating = end - first_token if first_token else 0
+    return {
+        "scenario": scenario,
+        "size_bytes": size,
+        "wall_s": round(end - start, 4),
+        "ttft_s": round(first_token - start, 4) if first_token else None,
+        "tokens": tokens,
+        "tokens_per_s": round((tokens - 1) / generating, 1) if tokens > 1 and generating > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+        "prompt_bytes": stats.get("prompt_bytes", len(diff)),
+    }
+
+
+def run_scenario(scenario: str, size: int, server: StubLLMServer, map_reduce: bool) -> Dict[str, Any]:
+    """Run one scenario in a fresh interpreter pointed at the stub server"""
+    env = {
+        **os.environ,
+        "OLLAMA_HOST": server.url,
+        "AI_API_URL": server.url + "/v1/chat/completions",
+        "AI_API_KEY": "benchmark",
+        # measure the work itself, not the cache or a running daemon
+        "AI_COMMIT_CACHE": "0",
+        "AI_COMMIT_DAEMON": "0",
+        "AI_COMMIT_WARM_UP": "0",
+    }
+    command = [sys.executable, os.path.abspath(__file__), "--child", scenario, str(size)]
+    if map_reduce:
+        command.append("--map-reduce")
+    requests_before = server.requests
+    result = subprocess.run(command, capture_output=True, text=True, env=env, cwd=REPO_ROOT)
+    if result.returncode != 0:
+        return {"scenario": scenario, "size_bytes": size, "error": (result.stderr or result.stdout).strip()[-500:]}
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement["requests"] = server.requests - requests_before
+    return measurement
+
+
+def git_revision() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=REPO_ROOT)
+    return result.stdout.strip() or "unknown"
+
+
+TABLE_HEADER = f"{'scenario':<26}{'size':>10}{'wall':>10}{'ttft':>9}{'tok/s':>9}{'rss':>10}"
+
+
+def format_row(item: Dict[str, Any]) -> str:
+    size = f"{item['size_bytes'] / 1024:.0f}K"
+    if "error" in item:
+        return f"{item['scenario']:<26}{size:>10}  ❌ {item['error'].splitlines()[-1]}"
+
+    def fmt(value: Optional[float], digits: int, suffix: str = "") -> str:
+        return "-" if value is None else f"{value:.{digits}f}{suffix}"
+
+    return (f"{item['scenario']:<26}{size:>10}{fmt(item['wall_s'], 2, 's'):>10}{fmt(item['ttft_s'], 2, 's'):>9}"
+            f"{fmt(item['tokens_per_s'], 0):>9}{fmt(item['peak_rss_mb'], 0, 'MB'):>10}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma separated scenarios to run, from: {', '.join(SCENARIOS)}.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated diff sizes, e.g. 1K,100K,1M.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub latency before the first token in seconds.")
+    parser.add_argument("--token-rate", type=float, default=200, help="Stub tokens per second, 0 for no delay.")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per stub response.")
+    parser.add_argument("--map-reduce", action="store_true",
+                        help="Let large diffs go through map-reduce instead of trimming them to the context.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    parser.add_argument("--output", help="Also write the json results to this file.")
+    parser.add_argument("--child", nargs=2, metavar=("SCENARIO", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child[0], int(args.child[1]), args.map_reduce)))
+        return 0
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+
+    results = []
+    if not args.json:
+        print(TABLE_HEADER)
+    with StubLLMServer(latency=args.latency, token_rate=args.token_rate, tokens=args.tokens) as server:
+        for scenario in scenarios:
+            for size in sizes:
+                results.append(run_scenario(scenario, size, server, args.map_reduce))
+                if not args.json:
+                    print(format_row(results[-1]), flush=True)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stub": {"latency_s": args.latency, "token_rate": args.token_rate, "tokens": args.tokens},
+        "map_reduce": args.map_reduce,
+        "results": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if any("error" in item for item in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
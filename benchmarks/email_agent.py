@@ -0,0 +1,348 @@
+"""
+Benchmark of the email agent's mailbox fetching against a local stub IMAP server
+
+Builds a synthetic inbox (newsletters with List-Unsubscribe headers, plain personal mail, and
+mail with large attachments), serves it with StubIMAPServer at a given round trip latency, and
+compares the one `FETCH n (RFC822)` per message loop the agent used before with the batched
+header fetch of fetch_emails_imap. Then it measures an incremental run with the sync state
+(MailState), after 1% new messages arrived. Reports the wall time, the IMAP commands and the
+bytes downloaded. It also compares the peak memory and the time to the first classified email
+of the streaming pipeline (iter_emails) with building the whole DataFrame.
+
+It then decodes --decode-messages text parts in several charsets (html newsletters of up to
+64 KB, a tenth of them without a declared charset) with the chardet over the whole payload
+fallback decode_payload used before and with the declared charset fast path, and reports the
+time per message and how many texts came out right.
+
+Finally it unsubscribes from --senders senders with several flagged emails each against a
+StubUnsubscribeServer, once by visiting every link of every email in turn as the agent used to,
+and once with the UnsubscribeExecutor. Run it with
+`python benchmarks/email_agent.py --messages 2000 --latency 0.02`.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from typing import Any, Callable, Dict, List
+
+import chardet
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from stubs import StubIMAPServer, StubUnsubscribeServer  # noqa: E402
+from ai_commit.core.charset import PayloadDecoder  # noqa: E402
+from ai_commit.core.mail_state import MailState  # noqa: E402
+
+SENDERS = ["news@shop.example", "deals@travel.example", "digest@forum.example", "alice@example.org",
+           "bob@example.org", "billing@service.example"]
+SUBJECTS = ["Weekly digest", "Exclusive discount inside", "Your invoice", "Lunch tomorrow?",
+            "Summer promotion ends soon", "Meeting notes", "A special offer for you"]
+# charsets of the decoded text parts, with text they can encode
+CHARSETS = [
+    ("utf-8", ["Réunion demain", "Grüße aus München", "Скидки недели", "週末のセール", "Weekly digest"]),
+    ("iso-8859-1", ["Réunion demain à midi", "Grüße aus München", "Café, crème brûlée", "Año nuevo"]),
+    ("windows-1252", ["Offre spéciale – 20 € de réduction", "“Quoted” résumé", "Grüße"]),
+    ("shift_jis", ["週末のセールのお知らせ", "会議の議事録", "請求書を添付します"]),
+    ("koi8-r", ["Скидки недели", "Протокол встречи", "Счёт во вложении"]),
+]
+
+
+def synthetic_mailbox(count: int, seed: int = 3) -> List[bytes]:
+    """Raw messages: a third newsletters, a tenth with a ~200 KB attachment, the rest plain mail"""
+    rng = random.Random(seed)
+    messages = []
+    for index in range(count):
+        sender = rng.choice(SENDERS)
+        message = EmailMessage()
+        message["From"] = sender
+        message["To"] = "me@example.org"
+        message["Subject"] = f"{rng.choice(SUBJECTS)} #{index}"
+        message["Date"] = "Mon, 06 Jan 2025 10:00:00 +0000"
+        paragraphs = "\n\n".join(
+            " ".join(rng.choice(SUBJECTS).lower() for _ in range(12)) for _ in range(rng.randint(3, 30))
+        )
+        roll = rng.random()
+        if roll < 0.33:
+            link = f"https://{sender.split('@')[1]}/unsubscribe?id={index}"
+            message["List-Unsubscribe"] = f"<{link}>, <mailto:unsubscribe@{sender.split('@')[1]}>"
+            message["List-Unsubscribe-Post"] = "List-Unsubscribe=One-Click"
+            message.set_content(f"{paragraphs}\n\nTo stop these emails: {link}\n")
+            message.add_alternative(f"<html><body><p>{paragraphs}</p><a href='{link}'>unsubscribe</a></body></html>",
+                                    subtype="html")
+        else:
+            message.set_content(paragraphs + "\n")
+            if roll > 0.9:
+                attachment = base64.b64encode(rng.randbytes(150 * 1024))
+                message.add_attachment(attachment, maintype="application", subtype="pdf", filename=f"doc{index}.pdf")
+        messages.append(message.as_bytes())
+    return messages
+
+
+def synthetic_payloads(count: int, seed: int = 9) -> List[Dict[str, Any]]:
+    """Encoded html text parts from a few dozen senders, each sender always using the same charset"""
+    rng = random.Random(seed)
+    payloads = []
+    for index in range(count):
+        sender = f"list{rng.randint(0, 40)}@news.example"
+        charset, phrases = CHARSETS[int(sender[4:sender.index("@")]) % len(CHARSETS)]
+        paragraphs = "".join(
+            f"<p>{' '.join(rng.choice(phrases) for _ in range(8))}</p>\n" for _ in range(int(rng.paretovariate(1.1) * 10))
+        )
+        text = f"<html><body>{paragraphs}</body></html>"
+        data = text.encode(charset)[:64 * 1024]
+        payloads.append({
+            "sender": sender,
+            "payload": data,
+            # a tenth of the parts don't say what they are
+            "charset": charset if rng.random() > 0.1 else None,
+            "text": data.decode(charset, errors="ignore"),
+        })
+    return payloads
+
+
+def legacy_decode_payload(payload: bytes) -> str:
+    """decode_payload as the email agent had it: utf-8, else chardet over the whole payload"""
+    try:
+        return payload.decode("utf-8")
+    except UnicodeDecodeError:
+        encoding = chardet.detect(payload)["encoding"]
+        if encoding:
+            return payload.decode(encoding, errors="replace")
+        return payload.decode("utf-8", errors="replace")
+
+
+def decode_benchmark(count: int) -> Dict[str, Any]:
+    payloads = synthetic_payloads(count)
+    decoder = PayloadDecoder()
+    runs = {
+        "legacy": lambda item: legacy_decode_payload(item["payload"]),
+        "fast_path": lambda item: decoder.decode(item["payload"], item["charset"], item["sender"]),
+    }
+    results = {}
+    for name, decode in runs.items():
+        correct = 0
+        start = time.perf_counter()
+        for item in payloads:
+            # a part cut at 64 KB may end in half a character
+            correct += decode(item)[:len(item["text"])] == item["text"]
+        seconds = time.perf_counter() - start
+        results[name] = {
+            "seconds": round(seconds, 3),
+            "ms_per_message": round(seconds * 1000 / count, 3),
+            "correct": correct,
+        }
+    results["messages"] = count
+    results["mb"] = round(sum(len(item["payload"]) for item in payloads) / (1024 * 1024), 1)
+    return results
+
+
+def legacy_fetch(email_agent: Any) -> List[Dict[str, Any]]:
+    """The fetch loop fetch_emails_imap used before: one RFC822 fetch per message"""
+    mail = email_agent.connect_imap()
+    mail.select("inbox")
+    status, messages = mail.search(None, "ALL")
+    rows = []
+    for num in messages[0].split():
+        status, data = mail.fetch(num, "(RFC822)")
+        if status != "OK":
+            continue
+        msg = BytesParser(policy=policy.default).parsebytes(data[0][1])
+        body = email_agent.get_email_body(msg)
+        rows.append({
+            "Subject": msg["subject"],
+            "Sender": msg["from"],
+            "Body": body or "",
+            "Unsubscribe Links": email_agent.extract_unsubscribe_links(body),
+        })
+    mail.close()
+    mail.logout()
+    return rows
+
+
+def batched_fetch(email_agent: Any) -> List[Dict[str, Any]]:
+    return email_agent.fetch_emails_imap().to_dict("records")
+
+
+def incremental_fetch(state: Any) -> Callable[[Any], List[Dict[str, Any]]]:
+    """A run with the sync state, which then counts the fetched emails as processed"""
+    def fetch(email_agent: Any) -> List[Dict[str, Any]]:
+        rows = email_agent.fetch_emails_imap(state=state).to_dict("records")
+        state.commit()
+        return rows
+    return fetch
+
+
+def memory_profile(consume: Callable[[], int]) -> Dict[str, Any]:
+    """Peak python memory and time to the first classified email of a run"""
+    first: Dict[str, float] = {}
+    tracemalloc.start()
+    start = time.perf_counter()
+    flagged = consume(lambda: first.setdefault("at", time.perf_counter()))
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "peak_mb": round(peak / (1024 * 1024), 2),
+        "first_email_s": round(first.get("at", start) - start, 3),
+        "seconds": round(seconds, 3),
+        "flagged": flagged,
+    }
+
+
+def dataframe_run(email_agent: Any) -> Callable[[Callable[[], Any]], int]:
+    def consume(mark_first: Callable[[], Any]) -> int:
+        email_df = email_agent.fetch_emails_imap()
+        mark_first()
+        return int(email_df["Should Unsubscribe"].sum())
+    return consume
+
+
+def pipeline_run(email_agent: Any) -> Callable[[Callable[[], Any]], int]:
+    def consume(mark_first: Callable[[], Any]) -> int:
+        mail = email_agent.connect_imap()
+        flagged = 0
+        for row in email_agent.iter_emails(mail):
+            mark_first()
+            flagged += bool(row["Should Unsubscribe"])
+        mail.close()
+        mail.logout()
+        return flagged
+    return consume
+
+
+def measure(fetch: Callable[[Any], List[Dict[str, Any]]], email_agent: Any, server: StubIMAPServer) -> Dict[str, Any]:
+    server.reset_counters()
+    start = time.perf_counter()
+    rows = fetch(email_agent)
+    seconds = time.perf_counter() - start
+    flagged = sum(
+        1 for row in rows
+        if email_agent.is_spam(row["Subject"] or "", row["Body"]) and row["Unsubscribe Links"]
+    )
+    return {
+        "seconds": round(seconds, 3),
+        "commands": server.commands,
+        "mb_downloaded": round(server.bytes_sent / (1024 * 1024), 2),
+        "messages": len(rows),
+        "flagged": flagged,
+    }
+
+
+def flagged_senders(port: int, senders: int, emails: int) -> List[Dict[str, Any]]:
+    """Flagged emails of the senders, each with a header and a body link, the senders split over two hosts"""
+    rows = []
+    for sender in range(senders):
+        host = "127.0.0.1" if sender % 2 else "localhost"
+        for index in range(emails):
+            rows.append({
+                "sender": f"list{sender}@news.example",
+                "links": [f"http://{host}:{port}/unsubscribe?list={sender}&email={index}",
+                          f"http://{host}:{port}/u/{sender}/{index}"],
+                "one_click": [],
+            })
+    return rows
+
+
+def unsubscribe_benchmark(email_agent: Any, senders: int, emails: int, latency: float) -> Dict[str, Any]:
+    results = {}
+    with StubUnsubscribeServer(latency=latency) as server:
+        rows = flagged_senders(server.port, senders, emails)
+
+        def legacy() -> None:
+            # unsubscribe_from_email for every flagged email, one link after the other
+            for row in rows:
+                for link in row["links"]:
+                    requests.get(link)
+
+        for name, run in (("legacy", legacy), ("executor", lambda: email_agent.unsubscribe_senders(rows))):
+            server.reset()
+            start = time.perf_counter()
+            run()
+            results[name] = {
+                "seconds": round(time.perf_counter() - start, 3),
+                "requests": len(server.requests),
+                "peak_per_host": max(server.peak_concurrency.values(), default=0),
+            }
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000, help="Number of messages in the inbox.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Round trip latency of the stub in seconds.")
+    parser.add_argument("--decode-messages", type=int, default=1000, help="Number of text parts to decode.")
+    parser.add_argument("--senders", type=int, default=40, help="Number of senders to unsubscribe from.")
+    parser.add_argument("--emails-per-sender", type=int, default=5, help="Flagged emails of every sender.")
+    parser.add_argument("--unsubscribe-latency", type=float, default=0.05,
+                        help="Response time of the stub unsubscribe pages in seconds.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    with StubIMAPServer(synthetic_mailbox(args.messages), latency=args.latency) as server:
+        from ai_commit.core.config import config
+        from ai_commit.Agents import email_agent
+
+        config.imap_ssl = False
+        config.imap_port = server.port
+        email_agent.IMAP_SERVER = server.host
+        # the stub accepts any login
+        email_agent.EMAIL, email_agent.APP_PASSWORD = "bench@example.org", "bench"
+
+        results = {
+            "messages": args.messages,
+            "latency_s": args.latency,
+            "legacy": measure(legacy_fetch, email_agent, server),
+            "batched": measure(batched_fetch, email_agent, server),
+        }
+        with MailState(":memory:") as state:
+            # the first run with the state syncs everything, the next one only sees the new mail
+            incremental_fetch(state)(email_agent)
+            for raw in synthetic_mailbox(max(args.messages // 100, 1), seed=5):
+                server.append(raw)
+            results["incremental"] = measure(incremental_fetch(state), email_agent, server)
+
+        results["memory"] = {
+            "dataframe": memory_profile(dataframe_run(email_agent)),
+            "pipeline": memory_profile(pipeline_run(email_agent)),
+        }
+        results["decode"] = decode_benchmark(args.decode_messages)
+        results["unsubscribe"] = unsubscribe_benchmark(
+            email_agent, args.senders, args.emails_per_sender, args.unsubscribe_latency
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{args.messages:,} messages, {args.latency * 1000:.0f} ms round trips")
+    for name in ("legacy", "batched", "incremental"):
+        item = results[name]
+        print(f"  {name:<12} {item['seconds']:>8.2f}s {item['commands']:>7,} commands "
+              f"{item['mb_downloaded']:>9.2f} MB   {item['flagged']:,} flagged for unsubscribing")
+    print("memory, measured with tracemalloc")
+    for name, item in results["memory"].items():
+        print(f"  {name:<12} {item['peak_mb']:>8.2f} MB peak, first email after {item['first_email_s']:.2f}s "
+              f"of {item['seconds']:.2f}s, {item['flagged']:,} flagged")
+    print(f"decoding {args.decode_messages:,} text parts, {results['decode']['mb']} MB")
+    for name in ("legacy", "fast_path"):
+        item = results["decode"][name]
+        print(f"  {name:<12} {item['seconds']:>8.2f}s {item['ms_per_message']:>7.3f} ms per message "
+              f"{item['correct']:>7,} decoded correctly")
+    print(f"unsubscribing from {args.senders} senders with {args.emails_per_sender} flagged emails each, "
+          f"{args.unsubscribe_latency * 1000:.0f} ms per page")
+    for name, item in results["unsubscribe"].items():
+        print(f"  {name:<12} {item['seconds']:>8.2f}s {item['requests']:>7,} requests "
+              f"{item['peak_per_host']:>4} at once per host")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
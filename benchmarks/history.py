@@ -0,0 +1,144 @@
+"""
+Benchmark of the commit history index
+
+Creates a throwaway repository of --commits commits with `git fast-import`: every commit changes
+a few lines of one file out of --files, in a few dozen packages, with messages in the styles of
+a few teams (conventional commits, ticket prefixes, plain sentences). Builds the HistoryIndex
+from scratch, adds --new commits and updates it incrementally, then runs --queries searches with
+the diffs of random indexed commits. Reports the build and update times, the size of the index,
+the search latency (p50, p95), how often the commit whose diff was searched is found first and
+how often the first example comes from the same package, whose message convention the generated
+message should follow. Run it with
+`python benchmarks/history.py --commits 100000`.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from ai_commit.core.history import HistoryIndex  # noqa: E402
+
+VERBS = ["add", "fix", "update", "remove", "refactor", "rename", "handle", "validate"]
+NOUNS = ["cache", "parser", "handler", "config", "session", "retry", "timeout", "schema", "index", "token"]
+
+
+def message_for(rng: random.Random, package: str, name: str, verb: str, noun: str) -> str:
+    style = hash(package) % 3
+    if style == 0:
+        return f"{'fix' if verb == 'fix' else 'feat'}({package}): {verb} {noun} of {name}\n"
+    if style == 1:
+        return f"[{package.upper()}-{rng.randint(100, 999)}] {verb.capitalize()} the {noun} in {name}\n"
+    return f"{verb.capitalize()} {noun} handling in {package}/{name}\n\nKeeps the {noun} consistent.\n"
+
+
+def file_content(name: str, version: int, verb: str, noun: str) -> str:
+    lines = [f"def {name}_{index}(value):\n    return value + {index}\n" for index in range(8)]
+    lines[version % 8] = f"def {verb}_{noun}_{name}(value):\n    return {noun}_{verb}(value, {version})\n"
+    return "".join(lines)
+
+
+def fast_import_stream(commits: int, files: int, first: int, seed: int) -> bytes:
+    """The fast-import commands of commits first..first+commits on refs/heads/main"""
+    rng = random.Random(seed + first)
+    packages = [f"pkg{index}" for index in range(40)]
+    chunks: List[bytes] = []
+    for number in range(first, first + commits):
+        index = rng.randrange(files)
+        package, name = packages[index % len(packages)], f"module{index}"
+        verb, noun = VERBS[(index + number) % len(VERBS)], NOUNS[index % len(NOUNS)]
+        message = message_for(rng, package, name, verb, noun).encode()
+        content = file_content(name, number, verb, noun).encode()
+        chunks.append(b"commit refs/heads/main\n")
+        chunks.append(f"committer Bench <bench@example.org> {1_600_000_000 + number} +0000\n".encode())
+        chunks.append(b"data %d\n%s" % (len(message), message))
+        if number == first and first:
+            chunks.append(b"from refs/heads/main^0\n")
+        chunks.append(f"M 100644 inline src/{package}/{name}.py\n".encode())
+        chunks.append(b"data %d\n%s\n" % (len(content), content))
+    return b"".join(chunks)
+
+
+def import_commits(repo: str, commits: int, files: int, first: int, seed: int) -> None:
+    subprocess.run(["git", "-C", repo, "fast-import", "--quiet"], input=fast_import_stream(commits, files, first, seed),
+                   check=True)
+    subprocess.run(["git", "-C", repo, "reset", "-q", "--hard", "main"], check=True)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] if ordered else 0.0
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commits", type=int, default=100000, help="Commits of the repository.")
+    parser.add_argument("--files", type=int, default=4000, help="Files the commits change.")
+    parser.add_argument("--new", type=int, default=100, help="Commits added before the incremental update.")
+    parser.add_argument("--queries", type=int, default=200, help="Searches to time.")
+    parser.add_argument("--dims", type=int, default=256, help="Length of the feature vectors.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {"commits": args.commits, "dims": args.dims}
+    with tempfile.TemporaryDirectory() as repo:
+        subprocess.run(["git", "init", "-q", "-b", "main", repo], check=True)
+        start = time.perf_counter()
+        import_commits(repo, args.commits, args.files, 0, seed=7)
+        results["repository_seconds"] = round(time.perf_counter() - start, 1)
+
+        index = HistoryIndex(os.path.join(repo, ".git", "ai-commit", "history"), dims=args.dims)
+        start = time.perf_counter()
+        added = index.update(repo)
+        results["build"] = {"seconds": round(time.perf_counter() - start, 2), "commits": added}
+        results["size_mb"] = round(index.size_bytes() / (1024 * 1024), 1)
+
+        import_commits(repo, args.new, args.files, args.commits, seed=7)
+        start = time.perf_counter()
+        added = index.update(repo)
+        results["update"] = {"seconds": round(time.perf_counter() - start, 3), "commits": added}
+
+        rng = random.Random(3)
+        shas = subprocess.run(["git", "-C", repo, "rev-list", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.split()
+        latencies = []
+        found = same_package = 0
+        for sha in rng.sample(shas, min(args.queries, len(shas))):
+            diff = subprocess.run(["git", "-C", repo, "show", "--format=", "--no-color", sha], capture_output=True,
+                                  text=True, check=True).stdout
+            start = time.perf_counter()
+            matches = index.search(diff, k=3, min_score=0.0)
+            latencies.append(time.perf_counter() - start)
+            found += bool(matches) and matches[0][1] == sha
+            package = re.search(r"src/(pkg\d+)/", diff).group(1)
+            same_package += bool(matches) and re.search(rf"\b{package}\b", matches[0][2], re.IGNORECASE) is not None
+        results["search"] = {
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "top1_rate": round(found / max(len(latencies), 1), 3),
+            "same_package_rate": round(same_package / max(len(latencies), 1), 3),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{args.commits:,} commits ({results['repository_seconds']}s to create), {args.dims} dimensions")
+    print(f"  build    {results['build']['seconds']:>8.2f}s  {results['build']['commits']:,} commits, "
+          f"{results['size_mb']} MB on disk")
+    print(f"  update   {results['update']['seconds']:>8.3f}s  {results['update']['commits']:,} new commits")
+    print(f"  search   p50 {results['search']['p50_ms']:.2f} ms  p95 {results['search']['p95_ms']:.2f} ms  "
+          f"own commit first in {results['search']['top1_rate']:.0%}, same package first in "
+          f"{results['search']['same_package_rate']:.0%} of the searches")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
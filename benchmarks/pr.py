@@ -0,0 +1,128 @@
+"""
+Benchmark of the pull request description against a local stub llm server
+
+Creates a throwaway git repository with a branch of --commits commits on top of main and
+describes it with a local model served by a StubLLMServer: once from the whole branch diff in
+one prompt, then with PullRequestAgent from per-commit summaries, again after --new more commits
+were pushed, and for comparison for the new commits alone without any cache. The agent runs
+share a temporary response cache. The stub charges --prompt-rate for the prompt tokens of every
+request, but evaluates parallel requests without slowing them down. Reports the wall time and the
+llm requests of every run. Run it with `python benchmarks/pr.py --commits 50`.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from review import git, write_file  # noqa: E402
+from stubs import StubLLMServer  # noqa: E402
+
+MODEL = "llama3"
+
+
+def add_commits(first: int, count: int) -> None:
+    """One commit per file, every one changing the file it is named after"""
+    for index in range(first, first + count):
+        write_file(index, 1)
+        git("add", "-A")
+        git("commit", "-q", "-m", f"Update the handlers of module {index}")
+
+
+def create_repository(commits: int, files: int) -> None:
+    git("init", "-q", "-b", "main")
+    git("config", "user.email", "bench@example.org")
+    git("config", "user.name", "bench")
+    os.makedirs("src")
+    for index in range(files):
+        write_file(index, 0)
+    git("add", "-A")
+    git("commit", "-q", "-m", "initial")
+    git("checkout", "-q", "-b", "feature")
+    add_commits(0, commits)
+
+
+def measure(server: StubLLMServer, run: Callable[[], Any]) -> Dict[str, Any]:
+    requests = server.requests
+    start = time.perf_counter()
+    # the agent prints the summaries and the description
+    with contextlib.redirect_stdout(io.StringIO()):
+        run()
+    return {"seconds": round(time.perf_counter() - start, 2), "requests": server.requests - requests}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commits", type=int, default=50, help="Commits on the branch.")
+    parser.add_argument("--new", type=int, default=3, help="Commits pushed after the first description.")
+    parser.add_argument("--jobs", type=int, default=4, help="Commits summarized at once.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub latency before the first token.")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Stub tokens per second.")
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="Prompt tokens the stub evaluates per second.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {"commits": args.commits, "new": args.new, "jobs": args.jobs}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo, tempfile.TemporaryDirectory() as cache_dir, \
+            StubLLMServer(latency=args.latency, token_rate=args.token_rate, tokens=32,
+                          prompt_rate=args.prompt_rate) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+        # imported once the server runs, the ollama client reads OLLAMA_HOST at import
+        from ai_commit.core.config import config
+        from ai_commit.core.llm import generate_response
+        from ai_commit.core.utils import load_prompt
+        from ai_commit.Agents.pr_agent import PullRequestAgent
+
+        config.cache_dir = cache_dir
+        config.daemon_enabled = False
+        os.chdir(repo)
+        try:
+            create_repository(args.commits, args.commits + args.new)
+
+            def whole_branch() -> None:
+                diff = subprocess.run(["git", "diff", "main...HEAD"], capture_output=True, text=True).stdout
+                generate_response(load_prompt("pull_request"), diff, use_local=True, model_name=MODEL, use_cache=False)
+
+            def describe(base: str) -> Callable[[], Any]:
+                return lambda: PullRequestAgent().run(base=base, use_local=True, local_llm=MODEL, jobs=args.jobs)
+
+            def push() -> Any:
+                add_commits(args.commits, args.new)
+                return describe("main")()
+
+            def new_commits_alone() -> Any:
+                config.cache_enabled = False
+                try:
+                    return describe(f"HEAD~{args.new}")()
+                finally:
+                    config.cache_enabled = True
+
+            results["whole_branch_diff"] = measure(server, whole_branch)
+            results["first_description"] = measure(server, describe("main"))
+            results["after_push"] = measure(server, push)
+            results["new_commits_alone"] = measure(server, new_commits_alone)
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"branch of {args.commits} commits, then {args.new} more, stub at {args.latency * 1000:.0f} ms, "
+          f"{args.token_rate:.0f} tokens/s and {args.prompt_rate:,.0f} prompt tokens/s")
+    for name, item in results.items():
+        if isinstance(item, dict):
+            print(f"  {name:<18} {item['seconds']:>7.2f}s {item['requests']:>4} requests")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
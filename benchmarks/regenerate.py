@@ -0,0 +1,102 @@
+"""
+Benchmark of commit message regenerations with a local model
+
+Starts a StubLLMServer whose ollama api charges prompt evaluation time for every prompt token it
+is sent (--prompt-rate tokens per second), generates a first message for a synthetic diff and
+then --regenerations more, once by sending the whole prompt again as every "r" did before, once
+through the provider's OllamaSession, which sends the regeneration prompt along with the context
+of the first answer. Then regenerates once from a new session, as when the first message came
+from the response cache or the daemon and the session is primed with the prompt first. Reports
+the prompt tokens evaluated and the time to first token of a regeneration. The stub keeps no KV
+cache of its own, so the resent prompt is always evaluated in full, as ollama does when its
+cache no longer holds the prompt. Run it with
+`python benchmarks/regenerate.py --sizes 8K,32K`.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from e2e import parse_size, synthetic_diff  # noqa: E402
+from stubs import StubLLMServer  # noqa: E402
+
+MODEL = "llama3"
+
+
+def first_token(stream: Iterator[str]) -> float:
+    """Seconds until the stream yields its first token, the rest of it is consumed"""
+    start = time.perf_counter()
+    latency = None
+    for token in stream:
+        if latency is None and token:
+            latency = time.perf_counter() - start
+    return latency if latency is not None else float("nan")
+
+
+def measure(regenerate: Callable[[], Iterator[str]], session: Any, regenerations: int) -> Dict[str, Any]:
+    latencies = []
+    evaluated = []
+    for _ in range(regenerations):
+        latencies.append(first_token(regenerate()))
+        evaluated.append(session.turns[-1]["prompt_eval_count"])
+    return {
+        "first_token_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+        "prompt_tokens": round(sum(evaluated) / len(evaluated)),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="8K,32K", help="Comma separated diff sizes, e.g. 8K,32K.")
+    parser.add_argument("--regenerations", type=int, default=5, help="Regenerations per diff and mode.")
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="Prompt tokens the stub evaluates per second.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {"prompt_rate": args.prompt_rate, "sizes": {}}
+    with StubLLMServer(latency=0.01, token_rate=0, tokens=32, prompt_rate=args.prompt_rate) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+        # imported once the server runs, the ollama client reads OLLAMA_HOST at import
+        from ai_commit.core.llm import LocalLLMProvider
+        from ai_commit.core.utils import load_prompt
+
+        prompt = load_prompt("commit_message")
+        for size in (parse_size(value) for value in args.sizes.split(",")):
+            diff = synthetic_diff(size)
+            provider = LocalLLMProvider(MODEL)
+            session = provider.session(prompt, diff)
+            first = first_token(provider.stream_response(prompt, diff))
+            results["sizes"][size] = {
+                "first_message": {"first_token_ms": round(first * 1000, 1),
+                                  "prompt_tokens": session.turns[0]["prompt_eval_count"]},
+                "resend": measure(lambda: provider.stream_response(prompt, diff), session, args.regenerations),
+                "session": measure(lambda: provider.regenerate_response(prompt, diff), session, args.regenerations),
+            }
+            # a first message from the cache leaves this process without a session to start from
+            LocalLLMProvider._sessions.clear()
+            primed = provider.session(prompt, diff)
+            latency = first_token(provider.regenerate_response(prompt, diff))
+            results["sizes"][size]["after_cache_hit"] = {
+                "first_token_ms": round(latency * 1000, 1),
+                "prompt_tokens": sum(turn["prompt_eval_count"] for turn in primed.turns),
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"ollama stub evaluating {args.prompt_rate:,.0f} prompt tokens/s, {args.regenerations} regenerations")
+    for size, runs in results["sizes"].items():
+        print(f"  diff of {size / 1024:,.0f} KB")
+        for name, item in runs.items():
+            print(f"    {name:<14} {item['prompt_tokens']:>7,} prompt tokens evaluated   "
+                  f"first token after {item['first_token_ms']:>8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
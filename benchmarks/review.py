@@ -0,0 +1,138 @@
+"""
+Benchmark of the per-file code review against a local stub llm server
+
+Creates a throwaway git repository with --files staged python files and reviews it with a local
+model served by a StubLLMServer: once as a single review of the whole diff like the review agent
+did before, then with ReviewAgent one file at a time and with --jobs files at once, again without
+any change, and once more after touching a single file. Every review run starts from the state
+the previous one left in a temporary response cache. The stub charges --prompt-rate for the
+prompt tokens of every request, but evaluates parallel requests without slowing them down, so the
+parallel run is a best case. Reports the wall time, the llm requests and how many file reviews
+came from the cache. Run it with `python benchmarks/review.py --files 40`.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from stubs import StubLLMServer  # noqa: E402
+
+MODEL = "llama3"
+
+
+def git(*args: str) -> None:
+    subprocess.run(["git", *args], check=True, capture_output=True)
+
+
+def write_file(index: int, version: int) -> None:
+    path = os.path.join("src", f"module{index}.py")
+    with open(path, "w", encoding="utf-8") as f:
+        for function in range(30):
+            f.write(f"def handler_{index}_{function}(request):\n"
+                    f"    value = request.get('field_{function}', {version})\n"
+                    f"    return value * {function + version}\n\n")
+
+
+def create_repository(files: int) -> None:
+    """A repository whose first commit has every file at version 0, version 1 staged"""
+    git("init", "-q")
+    git("config", "user.email", "bench@example.org")
+    git("config", "user.name", "bench")
+    os.makedirs("src")
+    for index in range(files):
+        write_file(index, 0)
+    git("add", "-A")
+    git("commit", "-q", "-m", "initial")
+    for index in range(files):
+        write_file(index, 1)
+    git("add", "-A")
+
+
+def measure(server: StubLLMServer, run: Callable[[], Dict[str, int]]) -> Dict[str, Any]:
+    requests = server.requests
+    start = time.perf_counter()
+    # the agent prints every review
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run()
+    return {"seconds": round(time.perf_counter() - start, 2), "requests": server.requests - requests, **result}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=40, help="Number of staged files.")
+    parser.add_argument("--jobs", type=int, default=4, help="Files reviewed at once.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub latency before the first token.")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Stub tokens per second.")
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="Prompt tokens the stub evaluates per second.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {"files": args.files, "jobs": args.jobs}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo, tempfile.TemporaryDirectory() as cache_dir, \
+            StubLLMServer(latency=args.latency, token_rate=args.token_rate, tokens=32,
+                          prompt_rate=args.prompt_rate) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+        # imported once the server runs, the ollama client reads OLLAMA_HOST at import
+        from ai_commit.core.config import config
+        from ai_commit.core.llm import generate_response
+        from ai_commit.core.utils import load_prompt, run_command
+        from ai_commit.Agents.review_agent import ReviewAgent
+
+        config.cache_dir = cache_dir
+        config.daemon_enabled = False
+        os.chdir(repo)
+        try:
+            create_repository(args.files)
+
+            def monolithic() -> Dict[str, int]:
+                diff = run_command(["git", "diff", "--cached"])
+                generate_response(load_prompt("code_review"), diff, use_local=True, model_name=MODEL, use_cache=False)
+                return {"reviewed": 1, "cached": 0}
+
+            def per_file(jobs: int) -> Callable[[], Dict[str, int]]:
+                def run() -> Dict[str, int]:
+                    reviews = list(ReviewAgent().review(True, MODEL, jobs))
+                    return {"reviewed": sum(1 for _, review, _ in reviews if review),
+                            "cached": sum(1 for _, _, cached in reviews if cached)}
+                return run
+
+            def touch_one() -> Dict[str, int]:
+                write_file(0, 2)
+                git("add", "-A")
+                return per_file(args.jobs)()
+
+            results["whole_diff"] = measure(server, monolithic)
+            results["per_file_1_job"] = measure(server, per_file(1))
+            # the same reviews again, in parallel and without the cache of the previous run
+            config.cache_enabled = False
+            results[f"per_file_{args.jobs}_jobs"] = measure(server, per_file(args.jobs))
+            config.cache_enabled = True
+            results["unchanged_rerun"] = measure(server, per_file(args.jobs))
+            results["one_file_touched"] = measure(server, touch_one)
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"review of {args.files} staged files, stub at {args.latency * 1000:.0f} ms, {args.token_rate:.0f} tokens/s "
+          f"and {args.prompt_rate:,.0f} prompt tokens/s")
+    for name, item in results.items():
+        if isinstance(item, dict):
+            print(f"  {name:<18} {item['seconds']:>7.2f}s {item['requests']:>4} requests "
+                  f"{item['reviewed']:>4} reviews, {item['cached']:>3} from the cache")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
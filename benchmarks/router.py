@@ -0,0 +1,118 @@
+"""
+Benchmark of the provider router against two local stub servers
+
+Starts two OpenAI-compatible StubLLMServers: a fast one with occasional slow responses and a
+slower steady one. Sends --requests requests in a row with the fast provider alone, with the
+ProviderRouter without hedging, and with hedging. Then the fast server starts failing every
+request and the same runs are repeated, to show the failover. Reports the time to first token
+(p50, p95, max) and the failed requests of every run. Run it with
+`python benchmarks/router.py --requests 200`.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from stubs import StubLLMServer  # noqa: E402
+from ai_commit.core.config import config  # noqa: E402
+from ai_commit.core.llm import LLMProvider, RemoteLLMProvider, is_failed_response  # noqa: E402
+from ai_commit.core.router import ProviderRouter, RouterHistory  # noqa: E402
+
+PROMPT = "Write a commit message for these changes."
+CONTEXT = "diff --git a/app.py b/app.py\n+print('hello')\n"
+
+
+def remote(server: StubLLMServer, model: str) -> RemoteLLMProvider:
+    return RemoteLLMProvider(model, chat_format=True, api_url=f"{server.url}/v1/chat/completions", api_key="stub")
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] if ordered else 0.0
+
+
+def measure(provider: LLMProvider, requests: int) -> Dict[str, Any]:
+    """Time to first token of every request, the failed ones left out"""
+    latencies = []
+    failed = 0
+    # the providers print every failed request
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(requests):
+            start = time.perf_counter()
+            first = None
+            tokens = []
+            for token in provider.stream_response(PROMPT, CONTEXT):
+                if first is None:
+                    first = time.perf_counter() - start
+                tokens.append(token)
+            if first is None or is_failed_response("".join(tokens)):
+                failed += 1
+            else:
+                latencies.append(first)
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 1),
+        "failed": failed,
+    }
+
+
+def runs(fast: StubLLMServer, steady: StubLLMServer, hedge_min: float) -> Dict[str, Callable[[], LLMProvider]]:
+    def router(hedge: bool) -> Callable[[], LLMProvider]:
+        # a fresh in-memory history for every run, warmed up by the run itself
+        return lambda: ProviderRouter([remote(fast, "fast"), remote(steady, "steady")], history=RouterHistory(),
+                                      hedge=hedge, hedge_min=hedge_min)
+    return {
+        "fast_only": lambda: remote(fast, "fast"),
+        "router": router(False),
+        "router_hedged": router(True),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Number of requests of every run.")
+    parser.add_argument("--fast-latency", type=float, default=0.05, help="Usual first token latency of the fast server.")
+    parser.add_argument("--slow-rate", type=float, default=0.04, help="Share of slow responses of the fast server.")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="First token latency of a slow response.")
+    parser.add_argument("--steady-latency", type=float, default=0.3, help="First token latency of the steady server.")
+    parser.add_argument("--hedge-min", type=float, default=0.2, help="Shortest hedge deadline in seconds.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+    # failed requests go to the next provider, not to the transport's backoff
+    config.http_max_retries = 0
+
+    results: Dict[str, Any] = {"requests": args.requests}
+    with StubLLMServer(latency=args.fast_latency, token_rate=0, tokens=16, slow_rate=args.slow_rate,
+                       slow_latency=args.slow_latency) as fast, \
+            StubLLMServer(latency=args.steady_latency, token_rate=0, tokens=16) as steady:
+        for phase in ("spiky", "down"):
+            fast.error_rate = 1.0 if phase == "down" else 0.0
+            results[phase] = {name: measure(build(), args.requests)
+                              for name, build in runs(fast, steady, args.hedge_min).items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    titles = {
+        "spiky": f"fast server at {args.fast_latency * 1000:.0f} ms with {args.slow_rate:.0%} of responses at "
+                 f"{args.slow_latency:.1f}s, steady server at {args.steady_latency * 1000:.0f} ms",
+        "down": "fast server answering every request with a 503",
+    }
+    for phase, title in titles.items():
+        print(f"{args.requests} requests, {title}")
+        for name, item in results[phase].items():
+            print(f"  {name:<14} p50 {item['p50_ms']:>7.1f} ms  p95 {item['p95_ms']:>7.1f} ms  "
+                  f"max {item['max_ms']:>7.1f} ms  {item['failed']:>4} failed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
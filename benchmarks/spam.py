@@ -0,0 +1,156 @@
+"""
+Microbenchmark of the email agent's spam classification
+
+Builds a synthetic corpus of emails (personal mail, newsletters with unsubscribe links and
+List-Unsubscribe headers, bodies up to the 64 KB the agent fetches) and classifies it three
+times: with the keyword loop of is_spam plus the extract_unsubscribe_links regex the agent used
+before, with SpamScorer.score() one email at a time, and with SpamScorer.score_batch() one IMAP
+batch at a time, and once more in batches with a scorer that scans the whole body. Reports the
+throughput of each and how many decisions and links differ from the legacy functions: the
+whole body scorer must agree on every email, the default one may only differ on keywords in the
+middle of a long body, which it doesn't scan. Run it with
+`python benchmarks/spam.py --emails 20000`.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from ai_commit.core.spam import SpamScorer  # noqa: E402
+
+WORDS = ["meeting", "notes", "the", "invoice", "attached", "lunch", "tomorrow", "project", "update", "thanks",
+         "review", "schedule", "please", "Deadline", "report", "weekly"]
+SPAM_WORDS = ["Discount", "promotion", "OFFER", "deal", "Unsubscribe", "offers", "dealer"]
+BODY_BYTES = 64 * 1024
+
+
+def synthetic_corpus(count: int, seed: int = 5) -> List[Dict[str, Any]]:
+    """Emails: a third newsletters, a few with a spam word deep in a long body, the rest plain mail"""
+    rng = random.Random(seed)
+    emails = []
+    for index in range(count):
+        words = [rng.choice(WORDS) for _ in range(int(rng.paretovariate(1.2) * 150))]
+        headers = {"From": f"sender{rng.randint(0, 300)}@example.org"}
+        subject = " ".join(rng.choice(WORDS) for _ in range(5))
+        roll = rng.random()
+        if roll < 0.33:
+            host = f"news{rng.randint(0, 50)}.example"
+            link = f"https://{host}/Unsubscribe?id={index}"
+            words.insert(rng.randrange(len(words) + 1), rng.choice(SPAM_WORDS))
+            words.append(f"To stop these emails: {link}")
+            headers["List-Unsubscribe"] = f"<{link}>"
+            if rng.random() < 0.5:
+                headers["Precedence"] = "bulk"
+            if rng.random() < 0.3:
+                subject = f"{rng.choice(SPAM_WORDS)} {subject}"
+        elif roll < 0.36:
+            # a spam word far down a long body
+            words.extend(rng.choice(WORDS) for _ in range(8000))
+            words.append(rng.choice(SPAM_WORDS))
+        body = " ".join(words)[:BODY_BYTES]
+        emails.append({"subject": subject, "body": body, "headers": headers})
+    return emails
+
+
+def legacy_is_spam(subject: str, body: str) -> bool:
+    """is_spam as the email agent had it"""
+    spam_keywords = ["unsubscribe", "discount", "promotion", "offer", "deal"]
+    return any(keyword.lower() in (subject + body).lower() for keyword in spam_keywords)
+
+
+def legacy_extract_unsubscribe_links(body: str) -> List[str]:
+    """extract_unsubscribe_links as the email agent had it"""
+    if not body:
+        return []
+    unsubscribe_pattern = re.compile(r'https?://[^\s]*unsubscribe[^\s]*', re.IGNORECASE)
+    return unsubscribe_pattern.findall(body)
+
+
+def legacy_classify(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"spam": legacy_is_spam(item["subject"], item["body"]),
+         "links": list(dict.fromkeys(legacy_extract_unsubscribe_links(item["body"])))}
+        for item in emails
+    ]
+
+
+def scorer_classify(scorer: SpamScorer) -> Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    def classify(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [scorer.score(item["subject"], item["body"], item["headers"]) for item in emails]
+    return classify
+
+
+def batch_classify(scorer: SpamScorer, batch_size: int) -> Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    def classify(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        results = []
+        for start in range(0, len(emails), batch_size):
+            results.extend(scorer.score_batch(emails[start:start + batch_size]))
+        return results
+    return classify
+
+
+def measure(classify: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]], emails: List[Dict[str, Any]],
+            expected: List[Dict[str, Any]], runs: int) -> Dict[str, Any]:
+    best = float("inf")
+    results: List[Dict[str, Any]] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        results = classify(emails)
+        best = min(best, time.perf_counter() - start)
+    size_mb = sum(len(item["subject"]) + len(item["body"]) for item in emails) / (1024 * 1024)
+    return {
+        "seconds": round(best, 4),
+        "emails_per_s": round(len(emails) / best),
+        "mb_per_s": round(size_mb / best, 1),
+        "spam": sum(1 for result in results if result["spam"]),
+        "decisions_differ": sum(1 for result, legacy in zip(results, expected) if result["spam"] != legacy["spam"]),
+        "links_differ": sum(1 for result, legacy in zip(results, expected) if result["links"] != legacy["links"]),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--emails", type=int, default=20000, help="Number of emails in the corpus.")
+    parser.add_argument("--batch-size", type=int, default=200, help="Emails per score_batch call.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs, the best one is reported.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    emails = synthetic_corpus(args.emails)
+    expected = legacy_classify(emails)
+    scorer = SpamScorer()
+    whole_body = SpamScorer(max_chars=BODY_BYTES)
+    results = {
+        "emails": len(emails),
+        "mb": round(sum(len(item["body"]) for item in emails) / (1024 * 1024), 1),
+        "legacy": measure(legacy_classify, emails, expected, args.runs),
+        "score": measure(scorer_classify(scorer), emails, expected, args.runs),
+        "score_batch": measure(batch_classify(scorer, args.batch_size), emails, expected, args.runs),
+        "score_batch_whole_body": measure(batch_classify(whole_body, args.batch_size), emails, expected, args.runs),
+    }
+    mismatch = results["score_batch_whole_body"]["decisions_differ"] or results["score_batch_whole_body"]["links_differ"]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return int(bool(mismatch))
+    print(f"{results['emails']:,} emails, {results['mb']} MB of text, at most {scorer.max_chars:,} "
+          f"characters of every body scanned")
+    for name in ("legacy", "score", "score_batch", "score_batch_whole_body"):
+        item = results[name]
+        print(f"  {name:<23} {item['seconds']:>8.3f}s {item['emails_per_s']:>9,} emails/s {item['mb_per_s']:>7.1f} MB/s "
+              f"{item['spam']:>7,} spam   {item['decisions_differ']} decisions and {item['links_differ']} link "
+              f"lists differ from legacy")
+    if mismatch:
+        print("⚠️ The scorer scanning the whole body disagrees with the legacy functions.")
+    return int(bool(mismatch))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
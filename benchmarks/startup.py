@@ -0,0 +1,114 @@
+"""
+Startup-time budget check for the ai-commit cli
+
+Imports the cli entry point in a fresh interpreter with `python -X importtime`, then fails when
+the import takes longer than the budget or pulls in a heavy dependency that only some
+subcommands need. Run it with `make bench-startup` or `python benchmarks/startup.py`.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# modules the plain cli startup must never import, they belong to specific agents or providers
+HEAVY_MODULES = ["ollama", "requests", "urllib3", "httpx", "pandas", "numpy", "chardet"]
+
+ENTRY_MODULE = "ai_commit.cli.cli"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module: str) -> Dict[str, int]:
+    """
+    Import a module in a fresh interpreter and parse the -X importtime report
+
+    Returns:
+        Dict[str, int]: The cumulative import time in microseconds of the module and of every
+                        module imported because of it
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+        check=True
+    )
+    subtree = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        top_level = not name[1:].startswith(" ")
+        # children are reported before their parent, so a top level line closes its subtree
+        subtree[name.strip()] = int(cumulative)
+        if top_level:
+            if name.strip() == module:
+                return subtree
+            subtree = {}
+    raise RuntimeError(f"{module} is missing from the -X importtime report")
+
+
+def measure_help(runs: int) -> float:
+    """Return the best wall time in milliseconds of `python -m ai_commit.cli.cli --help`"""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", ENTRY_MODULE, "--help"],
+            stdout=subprocess.DEVNULL,
+            cwd=REPO_ROOT,
+            check=True
+        )
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("AI_COMMIT_STARTUP_BUDGET_MS", "30")),
+                        help="Maximum cumulative import time of the cli entry point in milliseconds.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs, the best one is reported.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    best_import = None
+    heavy = set()
+    slowest = []
+    for _ in range(args.runs):
+        timings = measure_import(ENTRY_MODULE)
+        heavy |= {name for name in timings if name.split(".")[0] in HEAVY_MODULES}
+        if best_import is None or timings[ENTRY_MODULE] < best_import:
+            best_import = timings[ENTRY_MODULE]
+            slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:10]
+
+    results = {
+        "import_ms": best_import / 1000,
+        "help_wall_ms": measure_help(args.runs),
+        "budget_ms": args.budget_ms,
+        "heavy_modules": sorted(heavy),
+        "slowest_imports": [{"module": name, "cumulative_ms": us / 1000} for name, us in slowest],
+    }
+    failed = results["import_ms"] > args.budget_ms or bool(heavy)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"import {ENTRY_MODULE}: {results['import_ms']:.1f}ms (budget {args.budget_ms:.0f}ms)")
+        print(f"ai-commit --help wall time: {results['help_wall_ms']:.1f}ms")
+        print("slowest imports:")
+        for item in results["slowest_imports"]:
+            print(f"  {item['cumulative_ms']:8.1f}ms  {item['module']}")
+        if heavy:
+            print(f"❌ heavy modules imported at startup: {', '.join(sorted(heavy))}")
+        elif failed:
+            print("❌ startup import time is over budget")
+        else:
+            print("✅ startup is within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
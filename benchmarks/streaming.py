@@ -0,0 +1,179 @@
+"""
+Microbenchmark of the streamed response decoding
+
+Builds a multi-megabyte OpenAI-style server-sent events body with fenced and inline code,
+splits it into network-sized reads, and decodes it twice: with the line-by-line parser and
+per-token fence check that generate_remote_message used before (plus its regex passes), and with
+SSEDecoder + CodeFenceFilter. Reports the throughput of both, how much text each one kept and
+how many backticks each one let through. Run it with `python benchmarks/streaming.py --size 8M`.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from ai_commit.core.streaming import CodeFenceFilter, iter_openai_deltas, iter_sse_data  # noqa: E402
+
+WORDS = ["Update", "the", "parser", "to", "handle", "split", "tokens", "and", "keep", "state", "across", "chunks"]
+CODE = ["```python\n", "def ", "handler", "(request):\n", "    return ", "None\n", "```\n"]
+
+
+def synthetic_tokens(size: int, seed: int = 7) -> List[str]:
+    """Tokens of about size characters: prose with inline code, and fenced blocks split over tokens"""
+    rng = random.Random(seed)
+    tokens, total = [], 0
+    while total < size:
+        roll = rng.random()
+        if roll < 0.02:
+            # a fence split over two tokens, which the per-token check misses
+            block = ["``", "`python\n", "x = 1\n", "`", "``\n"]
+        elif roll < 0.05:
+            block = CODE
+        elif roll < 0.1:
+            block = [" `", "value", "`"]
+        else:
+            block = [" " + rng.choice(WORDS)] + (["\n"] if rng.random() < 0.1 else [])
+        tokens.extend(block)
+        total += sum(len(token) for token in block)
+    return tokens
+
+
+def sse_body(tokens: List[str]) -> bytes:
+    events = [
+        "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": token}}]}) + "\n\n"
+        for token in tokens
+    ]
+    return ("".join(events) + "data: [DONE]\n\n").encode("utf-8")
+
+
+def network_reads(body: bytes, seed: int = 11) -> List[bytes]:
+    """Split the body at random points, like reads from a socket"""
+    rng = random.Random(seed)
+    reads, position = [], 0
+    while position < len(body):
+        size = rng.randint(1, 1500)
+        reads.append(body[position:position + size])
+        position += size
+    return reads
+
+
+def legacy_iter_lines(reads: List[bytes]) -> Iterator[str]:
+    """What requests' iter_lines(decode_unicode=True) does with the reads"""
+    pending = None
+    for chunk in reads:
+        chunk = chunk.decode("utf-8", errors="replace")
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        pending = lines.pop() if lines and chunk and lines[-1] and lines[-1][-1] == chunk[-1] else None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def legacy_decode(reads: List[bytes]) -> Tuple[str, str]:
+    """
+    The decoding and filtering generate_remote_message used to do for commit messages
+
+    Returns:
+        Tuple[str, str]: The text printed while streaming and the final message
+    """
+    message_content = ""
+    in_code_block = False
+    for line in legacy_iter_lines(reads):
+        if not line or line.startswith(":"):
+            continue
+        if line.startswith("data:"):
+            line = line[5:].strip()
+        if line == "[DONE]":
+            break
+        try:
+            chunk = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        choices = chunk.get("choices") or [{}]
+        delta_content = (choices[0].get("delta") or {}).get("content") or ""
+        if "```" in delta_content:
+            if delta_content.strip().startswith("```"):
+                in_code_block = True
+                delta_content = ""
+            elif delta_content.strip() == "```":
+                in_code_block = False
+                delta_content = ""
+        if in_code_block:
+            continue
+        message_content += delta_content
+    printed = message_content
+    text = re.sub(r"```[\w]*[\s\S]*?```", "", message_content)
+    text = re.sub(r"`[^`]*`", "", text)
+    text = re.sub(r"<code>[\s\S]*?</code>", "", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return printed, text.strip()
+
+
+def streaming_decode(reads: List[bytes]) -> Tuple[str, str]:
+    code_filter = CodeFenceFilter()
+    parts = [code_filter.feed(token) for token in iter_openai_deltas(iter_sse_data(reads))]
+    parts.append(code_filter.close())
+    printed = "".join(parts)
+    return printed, printed.strip()
+
+
+def measure(decode: Callable[[List[bytes]], Tuple[str, str]], reads: List[bytes], runs: int) -> Dict[str, Any]:
+    best = float("inf")
+    printed = output = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        printed, output = decode(reads)
+        best = min(best, time.perf_counter() - start)
+    size_mb = sum(len(read) for read in reads) / (1024 * 1024)
+    return {
+        "seconds": round(best, 4),
+        "mb_per_s": round(size_mb / best, 1),
+        "output_chars": len(output),
+        # code that reached the terminal while streaming, before any final clean up
+        "backticks_printed": printed.count("`"),
+        "backticks_left": output.count("`"),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", default="4M", help="Characters of generated content, e.g. 512K or 8M.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs, the best one is reported.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    args = parser.parse_args(argv)
+
+    size = args.size.upper()
+    size = int(float(size[:-1]) * {"K": 1024, "M": 1024 * 1024}[size[-1]]) if size[-1] in "KM" else int(size)
+    tokens = synthetic_tokens(size)
+    reads = network_reads(sse_body(tokens))
+
+    results = {
+        "content_chars": sum(len(token) for token in tokens),
+        "tokens": len(tokens),
+        "body_bytes": sum(len(read) for read in reads),
+        "legacy": measure(legacy_decode, reads, args.runs),
+        "streaming": measure(streaming_decode, reads, args.runs),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{results['tokens']:,} tokens, {results['body_bytes'] / (1024 * 1024):.1f} MB of server-sent events")
+    for name in ("legacy", "streaming"):
+        item = results[name]
+        print(f"  {name:<10} {item['seconds']:>8.3f}s {item['mb_per_s']:>8.1f} MB/s {item['output_chars']:>12,} chars kept   "
+              f"{item['backticks_printed']:,} backticks printed while streaming, {item['backticks_left']} left at the end")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,524 @@
+"""
+Local stand-ins for the llm and mail servers, used by the benchmarks
+
+StubLLMServer answers the ollama api (/api/generate, /api/chat) and the OpenAI-compatible chat
+completions api (/v1/chat/completions, streamed as server-sent events) with a canned message,
+after a configurable latency and at a configurable token rate, optionally with occasional slow
+responses or errors. Its ollama api can charge prompt evaluation time for every prompt token it is
+sent, while the tokens of a `context` from an earlier response count as already evaluated. It runs on a background thread:
+
+    with StubLLMServer(latency=0.2, token_rate=50) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+        os.environ["AI_API_URL"] = server.url + "/v1/chat/completions"
+
+StubIMAPServer serves a fixed list of messages over plain IMAP, with the subset of IMAP4rev1
+the email agent uses (SELECT, SEARCH, FETCH and their UID variants) and a round trip latency.
+StubUnsubscribeServer answers unsubscribe links and records how they were called.
+"""
+import email
+import gzip
+import json
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+from email.message import Message
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+MESSAGE = (
+    "Add synthetic changes for the benchmark\n\n"
+    "- Update the generated modules with new helper functions\n"
+    "- Adjust the configuration defaults and the documentation\n"
+)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # clients that hang up, e.g. a cancelled hedged request, are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubLLMServer:
+    """Fake ollama and OpenAI-compatible server with a controllable latency and token rate"""
+
+    def __init__(self, latency: float = 0.1, token_rate: float = 100.0, tokens: int = 64,
+                 load_time: float = 0.0, host: str = "127.0.0.1", port: int = 0, slow_rate: float = 0.0,
+                 slow_latency: float = 2.0, error_rate: float = 0.0, seed: int = 1, prompt_rate: float = 0.0):
+        """
+        Args:
+            latency: Seconds before the first token of every response
+            token_rate: Tokens per second after the first one, 0 for no delay
+            tokens: Number of tokens per response
+            load_time: Seconds the first ollama request waits for the "model load"
+            host: The interface to listen on
+            port: The port to listen on, 0 picks a free one
+            slow_rate: The share of responses that wait slow_latency instead of latency
+            slow_latency: Seconds before the first token of a slow response
+            error_rate: The share of requests answered with a 503
+            seed: Seed of the slow and failed responses
+            prompt_rate: Prompt tokens the ollama api evaluates per second, 0 for no delay
+        """
+        self.latency = latency
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.load_time = load_time
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.prompt_rate = prompt_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._server = _HTTPServer((host, port), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubLLMServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def token_stream(self) -> Iterator[str]:
+        """Yield the canned message split into words, paced by the latency and the token rate"""
+        words = MESSAGE.replace("\n", " \n").split(" ")
+        with self._lock:
+            slow = self._random.random() < self.slow_rate
+        time.sleep(self.slow_latency if slow else self.latency)
+        for index in range(self.tokens):
+            if index and self.token_rate:
+                time.sleep(1 / self.token_rate)
+            yield words[index % len(words)] + " "
+
+    def load_model(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                time.sleep(self.load_time)
+                self._loaded = True
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def read_json(self) -> Dict[str, Any]:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.bytes_received += len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return json.loads(body or b"{}")
+
+            def send_json(self, payload: Dict[str, Any]) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_chunks(self, content_type: str, chunks: Iterator[bytes]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client stopped reading, e.g. a cancelled prefetch
+                    self.close_connection = True
+
+            def do_HEAD(self) -> None:
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self) -> None:
+                request = self.read_json()
+                with stub._lock:
+                    failed = stub._random.random() < stub.error_rate
+                if failed:
+                    self.send_error(503)
+                elif self.path == "/api/generate":
+                    self.ollama(request, "response", bool(request.get("prompt")))
+                elif self.path == "/api/chat":
+                    self.ollama(request, "message", bool(request.get("messages")))
+                elif self.path.endswith("/chat/completions"):
+                    self.openai(request)
+                else:
+                    self.send_error(404)
+
+            def ollama(self, request: Dict[str, Any], field: str, generate: bool) -> None:
+                # an empty prompt only loads the model
+                stub.load_model()
+
+                def wrap(token: str) -> Any:
+                    return token if field == "response" else {"role": "assistant", "content": token}
+
+                # about four characters per token, the tokens of the context were evaluated before
+                text = request.get("prompt") or "".join(
+                    str(message.get("content", "")) for message in request.get("messages") or []
+                )
+                prompt_tokens = max(1, len(text) // 4) if generate else 0
+                # num_predict 0 only evaluates the prompt
+                answer = generate and (request.get("options") or {}).get("num_predict") != 0
+                started = time.perf_counter()
+                if stub.prompt_rate and prompt_tokens:
+                    time.sleep(prompt_tokens / stub.prompt_rate)
+                context = list(request.get("context") or [])
+                context.extend(range(prompt_tokens + (stub.tokens if answer else 0)))
+                done = {"model": request.get("model"), field: wrap(""), "done": True, "context": context,
+                        "prompt_eval_count": prompt_tokens,
+                        "prompt_eval_duration": int((time.perf_counter() - started) * 1e9),
+                        "eval_count": stub.tokens if answer else 0}
+                if not request.get("stream", True):
+                    tokens = stub.token_stream() if answer else []
+                    self.send_json({**done, field: wrap("".join(tokens))})
+                    return
+                chunks = (
+                    (json.dumps({"model": request.get("model"), field: wrap(token), "done": False}) + "\n").encode()
+                    for token in (stub.token_stream() if answer else [])
+                )
+                self.send_chunks("application/x-ndjson", self._with_last(chunks, (json.dumps(done) + "\n").encode()))
+
+            def openai(self, request: Dict[str, Any]) -> None:
+                if not request.get("stream"):
+                    content = "".join(stub.token_stream())
+                    self.send_json({"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]})
+                    return
+                events = (
+                    b"data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": token}}]}).encode() + b"\n\n"
+                    for token in stub.token_stream()
+                )
+                self.send_chunks("text/event-stream", self._with_last(events, b"data: [DONE]\n\n"))
+
+            @staticmethod
+            def _with_last(chunks: Iterator[bytes], last: bytes) -> Iterator[bytes]:
+                yield from chunks
+                yield last
+
+        return Handler
+
+
+class StubUnsubscribeServer:
+    """Fake unsubscribe endpoint: every GET and POST succeeds after a latency"""
+
+    def __init__(self, latency: float = 0.05, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.requests: List[Tuple[str, str, bytes]] = []
+        # the most requests in flight at once, per Host header
+        self.peak_concurrency: Dict[str, int] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "StubUnsubscribeServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubUnsubscribeServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = []
+            self.peak_concurrency = {}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def answer(self) -> None:
+                host = self.headers.get("Host", "")
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub._lock:
+                    stub.requests.append((self.command, self.path, body))
+                    stub._active[host] = stub._active.get(host, 0) + 1
+                    stub.peak_concurrency[host] = max(stub.peak_concurrency.get(host, 0), stub._active[host])
+                try:
+                    time.sleep(stub.latency)
+                finally:
+                    with stub._lock:
+                        stub._active[host] -= 1
+                page = b"<html><body>You have been unsubscribed.</body></html>"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            do_GET = answer
+            do_POST = answer
+
+        return Handler
+
+
+class StubIMAPServer:
+    """Fake IMAP server holding a fixed mailbox, with a controllable round trip latency"""
+
+    FETCH_ITEM = re.compile(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|[A-Z0-9.]+", re.IGNORECASE)
+
+    def __init__(self, messages: List[bytes], latency: float = 0.0, uidvalidity: int = 1,
+                 first_uid: int = 101, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            messages: The raw messages of the inbox, oldest first
+            latency: Seconds added before every command's answer
+            uidvalidity: The UIDVALIDITY of the inbox
+            first_uid: The uid of the first message, the others follow (distinct from sequence numbers)
+            host: The interface to listen on
+            port: The port to listen on, 0 picks a free one
+        """
+        self.messages = [(first_uid + index, raw, email.message_from_bytes(raw)) for index, raw in enumerate(messages)]
+        self.first_uid = first_uid
+        self.latency = latency
+        self.uidvalidity = uidvalidity
+        self.commands = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "StubIMAPServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubIMAPServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def append(self, raw: bytes) -> int:
+        """Deliver a new message, returning its uid"""
+        with self._lock:
+            uid = self.messages[-1][0] + 1 if self.messages else self.first_uid
+            self.messages.append((uid, raw, email.message_from_bytes(raw)))
+        return uid
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.commands = 0
+            self.bytes_sent = 0
+
+    def select(self, sequence_set: str, by_uid: bool) -> List[Tuple[int, int, bytes, Message]]:
+        """The (sequence number, uid, raw, parsed) of the messages in an IMAP sequence set"""
+        numbered = [(number, uid, raw, parsed) for number, (uid, raw, parsed) in enumerate(self.messages, 1)]
+        if not numbered:
+            return []
+        highest = numbered[-1][1] if by_uid else len(numbered)
+        wanted = set()
+        for item in sequence_set.split(","):
+            start, _, end = item.partition(":")
+            start = highest if start == "*" else int(start)
+            end = start if not end else (highest if end == "*" else int(end))
+            wanted.update(range(min(start, end), max(start, end) + 1))
+        return [message for message in numbered if (message[1] if by_uid else message[0]) in wanted]
+
+    @staticmethod
+    def part(message: Message, section: str) -> Optional[Message]:
+        for index in section.split("."):
+            if not message.is_multipart():
+                # part 1 of a single part message is its body
+                return message if index == "1" else None
+            parts = message.get_payload()
+            if not index.isdigit() or not 0 < int(index) <= len(parts):
+                return None
+            message = parts[int(index) - 1]
+        return message
+
+    @staticmethod
+    def header_fields(raw: bytes, fields: List[str]) -> bytes:
+        header = re.split(rb"\r?\n\r?\n", raw, maxsplit=1)[0]
+        lines, keep = [], False
+        for line in re.split(rb"\r?\n", header):
+            if line[:1] in (b" ", b"\t"):
+                if keep:
+                    lines.append(line)
+                continue
+            keep = line.split(b":", 1)[0].decode("latin-1").strip().upper() in fields
+            if keep:
+                lines.append(line)
+        return b"".join(line + b"\r\n" for line in lines) + b"\r\n"
+
+    @staticmethod
+    def bodystructure(part: Message) -> str:
+        if part.is_multipart():
+            children = "".join(StubIMAPServer.bodystructure(child) for child in part.get_payload())
+            return f'({children} "{part.get_content_subtype().upper()}")'
+        params = " ".join(f'"{name.upper()}" "{value}"' for name, value in (part.get_params() or [])[1:])
+        encoding = part.get("Content-Transfer-Encoding", "7BIT").upper()
+        payload = part.get_payload()
+        disposition = part.get_content_disposition()
+        fields = [
+            f'"{part.get_content_maintype().upper()}"', f'"{part.get_content_subtype().upper()}"',
+            f"({params})" if params else "NIL", "NIL", "NIL", f'"{encoding}"', str(len(payload.encode("utf-8")))
+        ]
+        if part.get_content_maintype() == "text":
+            fields.append(str(payload.count("\n")))
+        fields += ["NIL", f'("{disposition.upper()}" NIL)' if disposition else "NIL", "NIL", "NIL"]
+        return f"({' '.join(fields)})"
+
+    def fetch_items(self, number: int, uid: int, raw: bytes, message: Message, items: str,
+                    by_uid: bool) -> bytes:
+        answer: List[bytes] = [f"UID {uid}".encode()] if by_uid else []
+        for match in self.FETCH_ITEM.finditer(items):
+            name = match.group(0).upper()
+            if name == "UID":
+                if not by_uid:
+                    answer.append(f"UID {uid}".encode())
+                continue
+            if name in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+                data = raw
+                label = "RFC822" if name == "RFC822" else "BODY[]"
+            elif name == "BODYSTRUCTURE":
+                answer.append(b"BODYSTRUCTURE " + self.bodystructure(message).encode())
+                continue
+            elif match.group(1) is not None:
+                section = match.group(1).upper()
+                if section.startswith("HEADER.FIELDS"):
+                    fields = section[section.index("(") + 1:section.rindex(")")].split()
+                    data = self.header_fields(raw, fields)
+                else:
+                    part = self.part(message, section)
+                    data = part.get_payload().encode("utf-8") if part is not None and not part.is_multipart() else b""
+                label = f"BODY[{match.group(1)}]"
+                if match.group(2) is not None:
+                    origin, length = int(match.group(2)), int(match.group(3))
+                    data = data[origin:origin + length]
+                    label += f"<{origin}>"
+            else:
+                continue
+            answer.append(label.encode() + b" {%d}\r\n" % len(data) + data)
+        return b"* %d FETCH (" % number + b" ".join(answer) + b")\r\n"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self) -> None:
+                super().setup()
+                self.pending: List[bytes] = []
+
+            def send(self, data: bytes) -> None:
+                self.pending.append(data)
+
+            def flush(self) -> None:
+                # one write per answer, so nagle and delayed acks don't add to the latency
+                data = b"".join(self.pending)
+                self.pending = []
+                with stub._lock:
+                    stub.bytes_sent += len(data)
+                self.wfile.write(data)
+
+            def handle(self) -> None:
+                self.send(b"* OK [CAPABILITY IMAP4rev1] stub ready\r\n")
+                self.flush()
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    tag, _, rest = line.decode("utf-8", "replace").strip().partition(" ")
+                    command, _, args = rest.partition(" ")
+                    command = command.upper()
+                    with stub._lock:
+                        stub.commands += 1
+                    if stub.latency:
+                        time.sleep(stub.latency)
+                    by_uid = command == "UID"
+                    if by_uid:
+                        command, _, args = args.partition(" ")
+                        command = command.upper()
+                    keep_open = self.dispatch(tag, command, args, by_uid)
+                    self.flush()
+                    if not keep_open:
+                        return
+
+            def dispatch(self, tag: str, command: str, args: str, by_uid: bool) -> bool:
+                if command == "CAPABILITY":
+                    self.send(b"* CAPABILITY IMAP4rev1 UIDPLUS\r\n")
+                elif command in ("SELECT", "EXAMINE"):
+                    self.send(b"* %d EXISTS\r\n* OK [UIDVALIDITY %d] UIDs valid\r\n"
+                              % (len(stub.messages), stub.uidvalidity))
+                    self.send(b"* OK [UIDNEXT %d] next uid\r\n"
+                              % ((stub.messages[-1][0] + 1) if stub.messages else 1))
+                elif command == "SEARCH":
+                    # only the UID criterion is honored, dates and flags match everything
+                    criterion = re.search(r"\bUID\s+([\d:*,]+)", args, re.IGNORECASE)
+                    sequence_set = criterion.group(1) if criterion else "1:*"
+                    found = stub.select(sequence_set, by_uid=bool(criterion))
+                    numbers = [str(message[1] if by_uid else message[0]) for message in found]
+                    self.send(("* SEARCH " + " ".join(numbers)).rstrip().encode() + b"\r\n")
+                elif command == "FETCH":
+                    sequence_set, _, items = args.partition(" ")
+                    for number, uid, raw, message in stub.select(sequence_set, by_uid):
+                        self.send(stub.fetch_items(number, uid, raw, message, items, by_uid))
+                elif command == "LOGOUT":
+                    self.send(b"* BYE\r\n" + f"{tag} OK LOGOUT completed\r\n".encode())
+                    return False
+                elif command not in ("LOGIN", "CLOSE", "NOOP", "STORE"):
+                    self.send(f"{tag} BAD unknown command\r\n".encode())
+                    return True
+                self.send(f"{tag} OK {command} completed\r\n".encode())
+                return True
+
+        return Handler